@@ -0,0 +1,216 @@
+"""
+Cancelación y actualización masiva de pedidos (p. ej. al cancelar un evento).
+
+`POST /orders/bulk` resuelve la selección (lista de ids o filtro) a ids y
+encola un trabajo; un hilo lo procesa en lotes de BULK_ORDER_BATCH_SIZE
+pedidos, cada uno en su propia transacción:
+
+- cancelar: bloquea los pedidos del lote que no estén cancelados, devuelve
+  el stock con un `UPDATE products SET stock = stock + n` por producto,
+  reembolsa las almas con un UPDATE por usuario, anula los tickets y marca
+  los pedidos como cancelados con un único UPDATE;
+- actualizar: un único UPDATE de los campos indicados para todo el lote.
+
+El progreso se guarda en `bulk_order_jobs` en la misma transacción que cada
+lote, así que `GET /orders/bulk/{job_id}` responde desde cualquier worker y
+el recuento coincide con lo aplicado. Los trabajos terminados se borran a
+los JOB_RETENTION días.
+"""
+import logging
+import threading
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+from typing import List, Optional
+
+from sqlalchemy import exists
+
+from .config import settings
+from .database import SessionLocal
+from . import crud, models, schemas
+
+logger = logging.getLogger(__name__)
+
+# Trabajos terminados que se conservan para consultar su resultado
+JOB_RETENTION = timedelta(days=30)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+# ============================================================================
+# SELECCIÓN
+# ============================================================================
+def has_selection(request: schemas.BulkOrderRequest) -> bool:
+    """True si la petición acota los pedidos (ids no vacíos o algún criterio de filtro)."""
+    if request.order_ids is not None and not request.order_ids:
+        return False
+    if request.filter is not None and not any(
+        value is not None for value in request.filter.model_dump().values()
+    ):
+        return False
+    return request.order_ids is not None or request.filter is not None
+
+
+def select_order_ids(db, request: schemas.BulkOrderRequest) -> List[int]:
+    """Ids de los pedidos afectados (solo la columna id, aunque sean miles)."""
+    if not has_selection(request):
+        raise ValueError("Selección vacía: se afectarían todos los pedidos")
+    query = db.query(models.Order.id)
+    if request.order_ids is not None:
+        query = query.filter(models.Order.id.in_(request.order_ids))
+    if request.filter is not None:
+        f = request.filter
+        if f.status:
+            query = query.filter(models.Order.status == f.status.value)
+        if f.user_id is not None:
+            query = query.filter(models.Order.user_id == f.user_id)
+        if f.date_from:
+            query = query.filter(models.Order.created_at >= datetime.combine(f.date_from, time.min))
+        if f.date_to:
+            query = query.filter(models.Order.created_at <= datetime.combine(f.date_to, time.max))
+        if f.event_id is not None:
+            query = query.filter(exists().where(
+                models.OrderItem.order_id == models.Order.id,
+                models.OrderItem.product_id == models.Product.id,
+                models.Product.event_id == f.event_id,
+            ))
+    return [order_id for (order_id,) in query.order_by(models.Order.id)]
+
+
+# ============================================================================
+# LOTES
+# ============================================================================
+def cancel_batch(db, order_ids: List[int], refund_souls: bool) -> dict:
+    """Cancela un lote de pedidos con sentencias agregadas. No hace commit."""
+    orders = db.query(models.Order.id, models.Order.user_id, models.Order.total).filter(
+        models.Order.id.in_(order_ids),
+        models.Order.status != "cancelled"
+    ).order_by(models.Order.id).with_for_update().all()
+    ids = [order.id for order in orders]
+    if not ids:
+        return {"changed": 0, "stock_restored": 0, "souls_refunded": 0}
+
+    stock_restored = crud.restore_order_stock(db, ids)
+
+    souls_refunded = 0
+    if refund_souls:
+        # Se cobró int(total) por pedido (ver routers/orders.py)
+        refunds = defaultdict(int)
+        for order in orders:
+            refunds[order.user_id] += int(order.total or 0)
+        for user_id in sorted(refunds):
+            if refunds[user_id]:
+                db.query(models.User).filter(models.User.id == user_id).update(
+                    {models.User.soul_balance: models.User.soul_balance + refunds[user_id]},
+                    synchronize_session=False
+                )
+        souls_refunded = sum(refunds.values())
+
+    db.query(models.OrderItem).filter(
+        models.OrderItem.order_id.in_(ids),
+        models.OrderItem.ticket_code.isnot(None)
+    ).update({models.OrderItem.ticket_status: "cancelled"}, synchronize_session=False)
+
+    values = {models.Order.status: "cancelled", models.Order.cancelled_at: datetime.utcnow()}
+    if refund_souls:
+        values[models.Order.payment_status] = "refunded"
+    db.query(models.Order).filter(models.Order.id.in_(ids)).update(values, synchronize_session=False)
+
+    return {"changed": len(ids), "stock_restored": stock_restored, "souls_refunded": souls_refunded}
+
+
+def update_batch(db, order_ids: List[int], update: schemas.OrderUpdate) -> dict:
+    """Aplica los mismos campos a un lote de pedidos con un único UPDATE. No hace commit."""
+    values = update.model_dump(exclude_unset=True, mode="json")
+    changed = db.query(models.Order).filter(models.Order.id.in_(order_ids)).update(
+        {**values, "updated_at": datetime.utcnow()}, synchronize_session=False
+    )
+    return {"changed": changed, "stock_restored": 0, "souls_refunded": 0}
+
+
+# ============================================================================
+# TRABAJOS
+# ============================================================================
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Un solo hilo: los trabajos masivos se ejecutan de uno en uno
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bulk-orders")
+        return _executor
+
+
+def shutdown():
+    """Detiene el hilo de trabajos (al cerrar la aplicación)."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def submit(db, request: schemas.BulkOrderRequest, order_ids: List[int],
+           requested_by: Optional[int] = None) -> models.BulkOrderJob:
+    """Registra el trabajo sobre `order_ids` y lo encola. Devuelve su estado inicial."""
+    db.query(models.BulkOrderJob).filter(
+        models.BulkOrderJob.finished_at < datetime.utcnow() - JOB_RETENTION
+    ).delete(synchronize_session=False)
+    job = models.BulkOrderJob(
+        id=uuid.uuid4().hex,
+        action=request.action,
+        requested_by=requested_by,
+        status="queued",
+        total=len(order_ids),
+        created_at=datetime.utcnow(),
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _get_executor().submit(_run, job.id, order_ids, request)
+    return job
+
+
+def get_job(db, job_id: str) -> Optional[models.BulkOrderJob]:
+    return db.get(models.BulkOrderJob, job_id)
+
+
+def _update_job(db, job_id: str, **values):
+    db.query(models.BulkOrderJob).filter(models.BulkOrderJob.id == job_id).update(
+        values, synchronize_session=False
+    )
+
+
+def _run(job_id: str, order_ids: List[int], request: schemas.BulkOrderRequest):
+    batch_size = max(settings.BULK_ORDER_BATCH_SIZE, 1)
+    db = SessionLocal()
+    totals = defaultdict(int)
+    try:
+        _update_job(db, job_id, status="running")
+        db.commit()
+        for start in range(0, len(order_ids), batch_size):
+            batch = order_ids[start:start + batch_size]
+            if request.action == "cancel":
+                result = cancel_batch(db, batch, request.refund_souls)
+            else:
+                result = update_batch(db, batch, request.update)
+            totals["processed"] += len(batch)
+            totals["skipped"] += len(batch) - result["changed"]
+            for key, value in result.items():
+                totals[key] += value
+            # El progreso se confirma junto con el lote
+            _update_job(db, job_id, **totals)
+            db.commit()
+        _update_job(db, job_id, status="completed", finished_at=datetime.utcnow())
+        db.commit()
+        logger.info("Operación masiva de pedidos terminada", extra={
+            "job_id": job_id, "action": request.action, "total": len(order_ids), "changed": totals["changed"]
+        })
+    except Exception as exc:
+        db.rollback()
+        logger.exception("Error en operación masiva de pedidos", extra={"job_id": job_id})
+        _update_job(db, job_id, status="failed", error=str(exc), finished_at=datetime.utcnow())
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,327 @@
+"""
+Compresión de respuestas y ficheros estáticos precomprimidos.
+
+- CompressionMiddleware: comprime con Brotli o GZip las respuestas dinámicas
+  cuyo tipo está en la lista permitida y superan un tamaño mínimo.
+- PrecompressedStaticFiles: StaticFiles que sirve los hermanos `.br`/`.gz`
+  generados de antemano y cachea de forma inmutable los ficheros con hash
+  en el nombre.
+- precompress_file / precompress_tree: generan esos hermanos, al subir un
+  fichero o en el build (`python -m app.compression ../Frontend`).
+"""
+import gzip
+import os
+import re
+import sys
+import zlib
+from mimetypes import guess_type
+from typing import Dict, Optional, Set
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from .config import settings
+
+try:
+    import brotli
+except ImportError:  # Brotli es opcional: sin él solo se usa GZip
+    brotli = None
+
+# Tipos que merece la pena comprimir (imágenes y vídeo ya van comprimidos)
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/x-ndjson",
+    "application/xml",
+    "image/svg+xml",
+)
+
+# Sufijos de los ficheros precomprimidos, por orden de preferencia
+PRECOMPRESSED_SUFFIXES = ((("br", ".br"),) if brotli else ()) + (("gzip", ".gz"),)
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Nombres con hash de contenido: app.3f9a2b1c.js (hash entre puntos), <sha256>.png
+# (16+ hexadecimales), <uuid4>.webp. El hash debe tener alguna letra: así
+# fechas y números como banner-20251031.png o foto.20251031.jpg no cuentan.
+_HEX_WITH_LETTER = r"(?=[0-9]*[a-f])[0-9a-f]"
+_HASHED_NAME = re.compile(
+    rf"\.{_HEX_WITH_LETTER}{{8,}}\."
+    rf"|(^|[.\-_])({_HEX_WITH_LETTER}{{16,}}"
+    r"|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})([.\-_]|$)"
+)
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    if not content_type:
+        return False
+    content_type = content_type.split(";", 1)[0].strip().lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def is_content_hashed(path: str) -> bool:
+    return bool(_HASHED_NAME.search(os.path.basename(path).lower()))
+
+
+def accepted_encodings(accept_encoding: str) -> Set[str]:
+    """Codificaciones aceptadas por el cliente (descarta las que tienen q=0)."""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+    return accepted
+
+
+# ============================================================================
+# MIDDLEWARE
+# ============================================================================
+class _Compressor:
+    """Interfaz común para gzip (zlib) y brotli en modo streaming."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._obj = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        else:
+            # wbits=31 -> formato gzip
+            self._obj = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._obj.process(data)
+        return self._obj.compress(data)
+
+    def sync(self) -> bytes:
+        """Vacía lo pendiente sin cerrar el flujo: el cliente puede descomprimir ya el fragmento."""
+        if self.encoding == "br":
+            return self._obj.flush()
+        return self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def flush(self) -> bytes:
+        if self.encoding == "br":
+            return self._obj.finish()
+        return self._obj.flush()
+
+
+class CompressionMiddleware:
+    """
+    Compresión Brotli/GZip con umbral de tamaño y lista de tipos permitidos.
+    Las respuestas que ya traen Content-Encoding (p. ej. estáticos
+    precomprimidos) pasan sin tocar. Todas las de tipo comprimible llevan
+    `Vary: Accept-Encoding`, también las que no se comprimen por tamaño o
+    porque el cliente no lo acepta. En streaming (exportaciones NDJSON/CSV)
+    cada fragmento se envía comprimido y vaciado (Z_SYNC_FLUSH / flush de
+    Brotli) en lugar de quedarse en el búfer del compresor.
+    """
+
+    def __init__(self, app, minimum_size: int = None):
+        self.app = app
+        self.minimum_size = settings.COMPRESSION_MIN_SIZE if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli and "br" in accepted:
+            encoding = "br"
+        elif "gzip" in accepted:
+            encoding = "gzip"
+        else:
+            await self.app(scope, receive, self._vary_only(send))
+            return
+
+        start_message = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+        # Fragmentos retenidos hasta saber si se alcanza el tamaño mínimo
+        # (BaseHTTPMiddleware reenvía incluso las respuestas simples por partes)
+        pending = []
+        pending_size = 0
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough, pending_size
+            message_type = message["type"]
+
+            if message_type == "http.response.start":
+                headers = Headers(raw=message.get("headers", []))
+                if (
+                    "content-encoding" in headers
+                    or not is_compressible(headers.get("content-type"))
+                    or message["status"] < 200
+                    or message["status"] in (204, 304)
+                ):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Esperamos al cuerpo para decidir
+                    start_message = message
+                return
+
+            if message_type != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                pending.append(body)
+                pending_size += len(body)
+                if more_body and pending_size < self.minimum_size:
+                    return
+                body = b"".join(pending)
+                pending.clear()
+
+                if pending_size < self.minimum_size:
+                    passthrough = True
+                    MutableHeaders(scope=start_message).add_vary_header("Accept-Encoding")
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+
+                compressor = _Compressor(encoding)
+                headers = MutableHeaders(scope=start_message)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if not more_body:
+                    compressed = compressor.compress(body) + compressor.flush()
+                    headers["Content-Length"] = str(len(compressed))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                # Respuesta en streaming: la longitud final es desconocida
+                del headers["Content-Length"]
+                await send(start_message)
+
+            chunk = compressor.compress(body)
+            chunk += compressor.sync() if more_body else compressor.flush()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _vary_only(send):
+        """Cliente sin gzip/br: sin comprimir, pero la respuesta depende de Accept-Encoding."""
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if "content-encoding" not in headers and is_compressible(headers.get("content-type")):
+                    headers.add_vary_header("Accept-Encoding")
+            await send(message)
+        return send_wrapper
+
+
+# ============================================================================
+# STATIC FILES
+# ============================================================================
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    Sirve `fichero.br` / `fichero.gz` si existen, son más recientes que el
+    original y el cliente los acepta. Los ficheros con hash de contenido
+    en el nombre se cachean un año como `immutable`; `cache_control` fija la
+    cabecera por prefijo de ruta (p. ej. snapshots que cambian cada pocos
+    segundos).
+    """
+
+    def __init__(self, *args, cache_control: Optional[Dict[str, str]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = cache_control or {}
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        request_headers = Headers(scope=scope)
+        media_type = guess_type(str(full_path))[0] or "text/plain"
+        serve_path, serve_stat, encoding = full_path, stat_result, None
+
+        compressible = is_compressible(media_type)
+        if compressible and status_code == 200:
+            accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+            for name, suffix in PRECOMPRESSED_SUFFIXES:
+                if name not in accepted:
+                    continue
+                try:
+                    sibling_stat = os.stat(f"{full_path}{suffix}")
+                except OSError:
+                    continue
+                if sibling_stat.st_mtime >= stat_result.st_mtime:
+                    serve_path, serve_stat, encoding = f"{full_path}{suffix}", sibling_stat, name
+                    break
+
+        response = FileResponse(serve_path, status_code=status_code, stat_result=serve_stat, media_type=media_type)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        if compressible:
+            response.headers.add_vary_header("Accept-Encoding")
+        if is_content_hashed(str(full_path)):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        elif self.cache_control:
+            relative = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+            for prefix, value in self.cache_control.items():
+                if relative.startswith(prefix):
+                    response.headers["Cache-Control"] = value
+                    break
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+# ============================================================================
+# PRECOMPRESIÓN
+# ============================================================================
+def precompress_file(path: str, minimum_size: int = None) -> bool:
+    """
+    Genera `path.gz` (y `path.br` si Brotli está disponible) con compresión
+    máxima. Devuelve False si el fichero no es comprimible o es muy pequeño.
+    """
+    minimum_size = settings.COMPRESSION_MIN_SIZE if minimum_size is None else minimum_size
+    if path.endswith((".gz", ".br")) or not is_compressible(guess_type(path)[0]):
+        return False
+    stat_result = os.stat(path)
+    if stat_result.st_size < minimum_size:
+        return False
+
+    with open(path, "rb") as f:
+        data = f.read()
+
+    outputs = {".gz": lambda: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli:
+        outputs[".br"] = lambda: brotli.compress(data, quality=11)
+
+    for suffix, compress in outputs.items():
+        target = f"{path}{suffix}"
+        try:
+            if os.stat(target).st_mtime >= stat_result.st_mtime:
+                continue
+        except OSError:
+            pass
+        compressed = compress()
+        if len(compressed) >= len(data):
+            continue
+        tmp = f"{target}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(compressed)
+        os.replace(tmp, target)
+    return True
+
+
+def precompress_tree(root: str) -> int:
+    """Precomprime todos los ficheros comprimibles de un directorio."""
+    count = 0
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if precompress_file(os.path.join(dirpath, filename)):
+                count += 1
+    return count
+
+
+if __name__ == "__main__":
+    for directory in sys.argv[1:] or [os.path.join(os.path.dirname(__file__), "static")]:
+        print(f"{directory}: {precompress_tree(directory)} ficheros precomprimidos")
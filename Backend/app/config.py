@@ -14,6 +14,10 @@ class Settings:
     SECRET_KEY: str = os.getenv("SECRET_KEY", "maldita_secreta_key_2025_horror_666")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 10080))
+
+    # Login con Google (ver app/google_jwks.py)
+    GOOGLE_CLIENT_ID: str = os.getenv("GOOGLE_CLIENT_ID", "")
+    GOOGLE_CERTS_URL: str = os.getenv("GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v3/certs")
     
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "")
@@ -22,6 +26,96 @@ class Settings:
     # CORS
     ALLOWED_ORIGINS: str = os.getenv("ALLOWED_ORIGINS", "http://localhost:5500,http://127.0.0.1:5500")
 
+    # Logging: nivel global y niveles por módulo ("app.crud=DEBUG,sqlalchemy.engine=WARNING")
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_LEVELS: str = os.getenv("LOG_LEVELS", "")
+
+    # Subida de imágenes
+    UPLOAD_MAX_BYTES: int = int(os.getenv("UPLOAD_MAX_BYTES", 5 * 1024 * 1024))
+    # Caducidad (segundos) de las URLs firmadas de subida directa
+    UPLOAD_PRESIGN_EXPIRES: int = int(os.getenv("UPLOAD_PRESIGN_EXPIRES", 900))
+    # Procesos para generar variantes de imagen (0 = nº de CPUs)
+    IMAGE_WORKERS: int = int(os.getenv("IMAGE_WORKERS", 2))
+
+    # Idempotency-Key (ver app/idempotency.py)
+    IDEMPOTENCY_TTL_HOURS: int = int(os.getenv("IDEMPOTENCY_TTL_HOURS", 24))
+    # Espera máxima de un duplicado concurrente a que termine la primera ejecución
+    IDEMPOTENCY_WAIT_SECONDS: float = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", 10))
+    # Una ejecución "en curso" más antigua que esto se considera abandonada
+    IDEMPOTENCY_LOCK_SECONDS: int = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", 60))
+
+    # Checkout en cola para picos de venta (ver app/order_queue.py)
+    ORDER_QUEUE_ENABLED: bool = os.getenv("ORDER_QUEUE_ENABLED", "False").lower() == "true"
+    ORDER_QUEUE_WORKERS: int = int(os.getenv("ORDER_QUEUE_WORKERS", 2))
+    ORDER_QUEUE_BATCH_SIZE: int = int(os.getenv("ORDER_QUEUE_BATCH_SIZE", 50))
+    ORDER_QUEUE_POLL_MS: int = int(os.getenv("ORDER_QUEUE_POLL_MS", 200))
+
+    # Caché en memoria de las fichas de evento por slug (ver app/events.py)
+    EVENT_CACHE_TTL_SECONDS: float = float(os.getenv("EVENT_CACHE_TTL_SECONDS", 30))
+
+    # Pedidos por transacción en cancelaciones/actualizaciones masivas
+    BULK_ORDER_BATCH_SIZE: int = int(os.getenv("BULK_ORDER_BATCH_SIZE", 500))
+
+    # Leaderboards diarios/semanales/por evento (ver app/leaderboard.py)
+    LEADERBOARD_TOP_K: int = int(os.getenv("LEADERBOARD_TOP_K", 100))
+    LEADERBOARD_CACHE_TTL_SECONDS: float = float(os.getenv("LEADERBOARD_CACHE_TTL_SECONDS", 15))
+    # Hora (UTC) a la que empieza el "día" de juego: 12 = la noche entera cuenta como un día
+    LEADERBOARD_DAY_START_HOUR: int = int(os.getenv("LEADERBOARD_DAY_START_HOUR", 0))
+
+    # Posición global por juego (ver app/ranking.py)
+    RANK_REFRESH_SECONDS: float = float(os.getenv("RANK_REFRESH_SECONDS", 60))
+
+    # Escritura diferida de puntuaciones (ver app/score_buffer.py)
+    SCORE_BUFFER_ENABLED: bool = os.getenv("SCORE_BUFFER_ENABLED", "False").lower() == "true"
+    SCORE_BUFFER_FLUSH_MS: int = int(os.getenv("SCORE_BUFFER_FLUSH_MS", 500))
+    SCORE_BUFFER_DIR: str = os.getenv("SCORE_BUFFER_DIR", "")
+    SCORE_BUFFER_FSYNC: bool = os.getenv("SCORE_BUFFER_FSYNC", "False").lower() == "true"
+    # Intentos de una partida que hace fallar el volcado antes de apartarla a dead-letter.jsonl
+    SCORE_BUFFER_MAX_ATTEMPTS: int = int(os.getenv("SCORE_BUFFER_MAX_ATTEMPTS", 5))
+
+    # Snapshots estáticos del leaderboard público (ver app/leaderboard_snapshots.py)
+    LEADERBOARD_SNAPSHOT_ENABLED: bool = os.getenv("LEADERBOARD_SNAPSHOT_ENABLED", "True").lower() == "true"
+    LEADERBOARD_SNAPSHOT_SECONDS: float = float(os.getenv("LEADERBOARD_SNAPSHOT_SECONDS", 5))
+    LEADERBOARD_SNAPSHOT_SIZE: int = int(os.getenv("LEADERBOARD_SNAPSHOT_SIZE", 100))
+
+    # Nodo (0-255) en los números de pedido y códigos de ticket (ver
+    # app/identifiers.py); vacío = cualquier valor libre en la BD
+    NODE_ID: str = os.getenv("NODE_ID", "")
+
+    # Reservas de stock del carrito (ver app/inventory.py)
+    HOLD_TTL_SECONDS: int = int(os.getenv("HOLD_TTL_SECONDS", 600))
+    HOLD_MAX_QUANTITY: int = int(os.getenv("HOLD_MAX_QUANTITY", 10))
+    HOLD_SWEEP_SECONDS: float = float(os.getenv("HOLD_SWEEP_SECONDS", 5))
+
+    # Almacenamiento de ficheros subidos: "local" o "s3" (ver app/storage.py)
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "local")
+    STORAGE_LOCAL_DIR: str = os.getenv("STORAGE_LOCAL_DIR", "")
+    # Temporales de subida (local): fuera de static/, en el mismo disco que STORAGE_LOCAL_DIR
+    STORAGE_TMP_DIR: str = os.getenv("STORAGE_TMP_DIR", "")
+    S3_BUCKET: str = os.getenv("S3_BUCKET", "")
+    S3_PREFIX: str = os.getenv("S3_PREFIX", "uploads")
+    S3_REGION: str = os.getenv("S3_REGION", "")
+    S3_ENDPOINT_URL: str = os.getenv("S3_ENDPOINT_URL", "")  # MinIO, R2...
+    S3_ACCESS_KEY_ID: str = os.getenv("S3_ACCESS_KEY_ID", "")
+    S3_SECRET_ACCESS_KEY: str = os.getenv("S3_SECRET_ACCESS_KEY", "")
+    S3_PUBLIC_URL: str = os.getenv("S3_PUBLIC_URL", "")  # CDN delante del bucket
+
+    # Compresión de respuestas (ver app/compression.py)
+    COMPRESSION_MIN_SIZE: int = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+    COMPRESSION_GZIP_LEVEL: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+    COMPRESSION_BROTLI_QUALITY: int = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+
+    # /metrics (Prometheus): solo con `Authorization: Bearer <METRICS_TOKEN>`;
+    # vacío = endpoint desactivado (404)
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
+
+    # Profiling bajo demanda (ver app/profiling.py)
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "False").lower() == "true"
+    PROFILING_TOKEN: str = os.getenv("PROFILING_TOKEN", "")
+    PROFILING_SAMPLE_RATE: float = float(os.getenv("PROFILING_SAMPLE_RATE", 0.0))
+    PROFILING_INTERVAL_MS: float = float(os.getenv("PROFILING_INTERVAL_MS", 5))
+    PROFILING_MAX_STORED: int = int(os.getenv("PROFILING_MAX_STORED", 50))
+
     def get_database_url(self) -> str:
         url = self.DATABASE_URL
         if not url:
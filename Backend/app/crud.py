@@ -1,8 +1,15 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy import case, desc, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from datetime import datetime
-from typing import Optional, List
-from . import models, schemas, auth
+from collections import Counter
+from typing import Optional, List, Tuple
+from . import models, schemas, auth, inventory, identifiers, events, leaderboard, leaderboard_snapshots, ranking
 from fastapi import HTTPException, status
 
 # ============================================================================
@@ -49,6 +56,65 @@ def create_user(db: Session, user: schemas.UserCreate) -> models.User:
     db.refresh(db_user)
     return db_user
 
+# Intentos de alta si otro registro simultáneo se queda el mismo username
+USERNAME_ATTEMPTS = 5
+
+
+def _like_prefix(value: str) -> str:
+    """Patrón LIKE 'value%' con los comodines de `value` escapados."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def next_free_username(db: Session, base: str) -> str:
+    """
+    `base` o el primer `base_N` libre. Una sola consulta por prefijo (usa el
+    índice de `username`) y el sufijo se elige en memoria.
+    """
+    # En minúsculas: en MySQL el índice único no distingue mayúsculas
+    taken = {
+        name.lower() for (name,) in db.query(models.User.username).filter(
+            models.User.username.like(_like_prefix(base), escape="\\")
+        )
+    }
+    if base.lower() not in taken:
+        return base
+    suffix = 1
+    while f"{base}_{suffix}".lower() in taken:
+        suffix += 1
+    return f"{base}_{suffix}"
+
+
+def create_user_unique_username(db: Session, user: schemas.UserCreate) -> models.User:
+    """
+    Crea el usuario con `user.username` o el primer sufijo libre. Si un alta
+    simultánea se adelanta (IntegrityError) se vuelve a elegir; si la que se
+    adelantó es del mismo email, se devuelve ese usuario.
+    """
+    db_user = models.User(
+        email=user.email,
+        hashed_password=auth.get_password_hash(user.password),
+        first_name=user.first_name,
+        last_name=user.last_name,
+        phone=user.phone
+    )
+    for _ in range(USERNAME_ATTEMPTS):
+        db_user.username = next_free_username(db, user.username)
+        db.add(db_user)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            existing = get_user_by_email(db, user.email)
+            if existing is not None:
+                return existing
+            continue
+        db.refresh(db_user)
+        return db_user
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="No se pudo asignar un nombre de usuario, inténtalo de nuevo"
+    )
+
 def create_user_admin(db: Session, user: schemas.UserCreateAdmin) -> models.User:
     """Crear nuevo usuario (Admin)"""
     hashed_password = auth.get_password_hash(user.password)
@@ -95,6 +161,7 @@ def delete_user(db: Session, user_id: int) -> bool:
     
     db.delete(db_user)
     db.commit()
+    ranking.invalidate()
     return True
 
 
@@ -179,6 +246,61 @@ def delete_product(db: Session, product_id: int) -> bool:
     return True
 
 
+# ============================================================================
+# EVENT CRUD
+# ============================================================================
+
+def get_event(db: Session, event_id: int) -> Optional[models.Event]:
+    """Obtener evento por ID"""
+    return db.query(models.Event).filter(models.Event.id == event_id).first()
+
+def get_event_by_slug(db: Session, slug: str) -> Optional[models.Event]:
+    """Obtener evento por slug (con sus productos)"""
+    return db.query(models.Event).options(selectinload(models.Event.products)).filter(
+        models.Event.slug == slug
+    ).first()
+
+def get_events(db: Session, skip: int = 0, limit: int = 100, include_unpublished: bool = False) -> List[models.Event]:
+    """Obtener eventos por fecha (solo públicos y publicados por defecto)"""
+    query = db.query(models.Event)
+    if not include_unpublished:
+        query = query.filter(models.Event.is_public == True, models.Event.status == "published")
+    return query.order_by(models.Event.start_date).offset(skip).limit(limit).all()
+
+def create_event(db: Session, event: schemas.EventCreate, user_id: Optional[int] = None) -> models.Event:
+    """Crear nuevo evento con su contador de entradas a cero"""
+    db_event = models.Event(**event.model_dump(), created_by=user_id)
+    db.add(db_event)
+    db.flush()
+    db.add(models.EventTicketCounter(event_id=db_event.id, tickets_sold=0))
+    db.commit()
+    db.refresh(db_event)
+    return db_event
+
+def update_event(db: Session, event_id: int, event_update: schemas.EventUpdate) -> Optional[models.Event]:
+    """Actualizar evento existente"""
+    db_event = get_event(db, event_id)
+    if not db_event:
+        return None
+    
+    for field, value in event_update.model_dump(exclude_unset=True).items():
+        setattr(db_event, field, value)
+    
+    db.commit()
+    db.refresh(db_event)
+    return db_event
+
+def delete_event(db: Session, event_id: int) -> bool:
+    """Eliminar evento (sus productos quedan sin evento)"""
+    db_event = get_event(db, event_id)
+    if not db_event:
+        return False
+    
+    db.delete(db_event)
+    db.commit()
+    return True
+
+
 # ============================================================================
 # SCORE CRUD
 # ============================================================================
@@ -207,73 +329,144 @@ def get_user_best_score(db: Session, user_id: int) -> Optional[models.Score]:
         models.Score.user_id == user_id
     ).order_by(desc(models.Score.points)).first()
 
+# Rangos por suma de las mejores puntuaciones, de mayor a menor
+RANKS = [
+    (5000, "Señor de las Tinieblas"),
+    (2000, "Demonio Mayor"),
+    (1000, "Demonio"),
+    (500, "Espectro"),
+    (100, "Alma en Pena"),
+]
+DEFAULT_RANK = "Mortal"
+
+
+def rank_for_points(total_points: int) -> str:
+    """Rango del usuario según la suma de sus mejores puntuaciones."""
+    for threshold, rank in RANKS:
+        if total_points >= threshold:
+            return rank
+    return DEFAULT_RANK
+
+
+def rank_expression(total_points):
+    """`rank_for_points` como expresión SQL (para calcularlo dentro del UPDATE)."""
+    return case(*[(total_points >= threshold, rank) for threshold, rank in RANKS], else_=DEFAULT_RANK)
+
+
+def upsert_high_scores(db: Session, rows: List[dict]):
+    """
+    Inserta o mejora los high scores (una fila por usuario y juego, ver
+    `uq_score_user_game`) en una sola sentencia: INSERT ... ON DUPLICATE KEY
+    UPDATE en MySQL, ON CONFLICT DO UPDATE en SQLite/PostgreSQL. Los datos de
+    la partida solo se sustituyen si trae más puntos. No hace commit.
+    """
+    db.execute(_high_score_upsert(db.bind.dialect.name), rows)
+
+
+def _high_score_upsert(dialect_name: str):
+    table = models.Score.__table__
+    fields = ("event_id", "level_reached", "time_played_seconds", "played_at")
+    if dialect_name in ("mysql", "mariadb"):
+        stmt = mysql_insert(table)
+        better = stmt.inserted.points > table.c.points
+        # MySQL aplica las asignaciones en orden: `points` debe ir la última
+        stmt = stmt.on_duplicate_key_update(
+            [(f, case((better, stmt.inserted[f]), else_=table.c[f])) for f in fields]
+            + [("points", func.greatest(table.c.points, stmt.inserted.points))]
+        )
+    else:
+        insert_ = sqlite_insert if dialect_name == "sqlite" else postgresql_insert
+        stmt = insert_(table)
+        better = stmt.excluded.points > table.c.points
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "game_type"],
+            set_={
+                **{f: case((better, stmt.excluded[f]), else_=table.c[f]) for f in fields},
+                "points": case((better, stmt.excluded.points), else_=table.c.points),
+            }
+        )
+    return stmt
+
+
+def apply_soul_and_rank(db: Session, user_id: int, souls: int) -> Tuple[int, str]:
+    """
+    Suma las almas y recalcula el rango con la suma de sus high scores en un
+    único UPDATE. Devuelve (saldo, rango) nuevos. No hace commit.
+    """
+    total = select(func.coalesce(func.sum(models.Score.points), 0)).where(
+        models.Score.user_id == user_id
+    ).scalar_subquery()
+    stmt = update(models.User).where(models.User.id == user_id).values(
+        soul_balance=models.User.soul_balance + souls,
+        rank=rank_expression(total),
+    )
+    if db.bind.dialect.update_returning:
+        soul_balance, rank = db.execute(stmt.returning(models.User.soul_balance, models.User.rank)).one()
+    else:
+        db.execute(stmt)
+        soul_balance, rank = db.query(models.User.soul_balance, models.User.rank).filter(
+            models.User.id == user_id
+        ).one()
+    # Que el usuario de la sesión (current_user) vea los valores nuevos
+    user = db.identity_map.get(identity_key(models.User, user_id))
+    if user is not None:
+        set_committed_value(user, "soul_balance", soul_balance)
+        set_committed_value(user, "rank", rank)
+    return soul_balance, rank
+
+
+def debit_souls(db: Session, user_id: int, cost: float) -> Optional[int]:
+    """
+    Descuenta `cost` almas (su parte entera) solo si el saldo llega, en un
+    único UPDATE condicionado: no se lee y reescribe el saldo, así que no se
+    pierden las almas sumadas a la vez por otra petición. Devuelve el saldo
+    nuevo, o None si no alcanza. No hace commit.
+    """
+    result = db.execute(update(models.User).where(
+        models.User.id == user_id, models.User.soul_balance >= cost
+    ).values(soul_balance=models.User.soul_balance - int(cost)))
+    if result.rowcount == 0:
+        return None
+    soul_balance = db.query(models.User.soul_balance).filter(models.User.id == user_id).scalar()
+    # Que el usuario de la sesión (current_user) vea el saldo nuevo
+    user = db.identity_map.get(identity_key(models.User, user_id))
+    if user is not None:
+        set_committed_value(user, "soul_balance", soul_balance)
+    return soul_balance
+
+
 def create_score(db: Session, score: schemas.ScoreCreate, user_id: int) -> models.Score:
     """
-    Registrar puntuación:
-    - Si ya existe puntuación para ese juego y usuario, actualiza solo si es mayor (High Score).
-    - Si no existe, crea una nueva.
-    - Actualiza el rango del usuario basado en sus puntos totales.
+    Registrar una partida en una sola transacción:
+    - upsert del high score del juego (solo sube si la partida es mejor),
+    - la partida cuenta para los leaderboards diario, semanal y del evento,
+    - suma 1 alma por punto y recalcula el rango en un único UPDATE.
     """
-    # 1. Buscar si ya existe puntuación para este juego
-    existing_score = db.query(models.Score).filter(
+    played_at = datetime.utcnow()
+    improved = leaderboard.record(db, user_id, score.game_type, score.points, played_at, score.event_id)
+
+    upsert_high_scores(db, [{
+        "user_id": user_id,
+        "game_type": score.game_type,
+        "points": score.points,
+        "event_id": score.event_id,
+        "level_reached": score.level_reached,
+        "time_played_seconds": score.time_played_seconds,
+        "device_type": score.device_type,
+        "played_at": played_at,
+    }])
+    db_score = db.query(models.Score).filter(
         models.Score.user_id == user_id,
         models.Score.game_type == score.game_type
-    ).first()
-    
-    db_score = None
-    
-    if existing_score:
-        # Si existe, verificamos si la nueva es mayor
-        if score.points > existing_score.points:
-            existing_score.points = score.points
-            existing_score.level_reached = score.level_reached
-            existing_score.time_played_seconds = score.time_played_seconds
-            existing_score.played_at = datetime.utcnow()
-            db_score = existing_score
-        else:
-            # Si no es mayor, no hacemos nada (mantenemos el high score)
-            return existing_score
-    else:
-        # Si no existe, creamos una nueva
-        db_score = models.Score(
-            points=score.points, 
-            user_id=user_id,
-            game_type=score.game_type,
-            level_reached=score.level_reached,
-            time_played_seconds=score.time_played_seconds,
-            device_type=score.device_type
-        )
-        db.add(db_score)
-    
+    ).populate_existing().one()
+
+    # GAMIFICATION: por simplicidad, 1 punto de score = 1 Alma
+    apply_soul_and_rank(db, user_id, score.points)
     db.commit()
-    db.refresh(db_score)
-    
-    # 2. Recalcular Rango del Usuario
-    # Obtener suma total de puntos de todos los juegos del usuario
-    total_points = db.query(func.sum(models.Score.points)).filter(
-        models.Score.user_id == user_id
-    ).scalar() or 0
-    
-    # Definir rangos
-    new_rank = "Mortal"
-    if total_points >= 5000:
-        new_rank = "Señor de las Tinieblas"
-    elif total_points >= 2000:
-        new_rank = "Demonio Mayor"
-    elif total_points >= 1000:
-        new_rank = "Demonio"
-    elif total_points >= 500:
-        new_rank = "Espectro"
-    elif total_points >= 100:
-        new_rank = "Alma en Pena"
-        
-    # Actualizar usuario
-    user = get_user(db, user_id)
-    if user and user.rank != new_rank:
-        user.rank = new_rank
-        db.commit()
-        db.refresh(user)
-        
+
+    leaderboard.offer(improved, user_id, score.game_type, score.points, played_at)
+    ranking.record(score.game_type, user_id, db_score.points)
+    leaderboard_snapshots.notify()
     return db_score
 
 def update_score(db: Session, score_id: int, score_update: schemas.ScoreUpdate) -> Optional[models.Score]:
@@ -289,6 +482,7 @@ def update_score(db: Session, score_id: int, score_update: schemas.ScoreUpdate)
     
     db.commit()
     db.refresh(db_score)
+    ranking.invalidate(db_score.game_type)
     return db_score
 
 def delete_score(db: Session, score_id: int) -> bool:
@@ -299,6 +493,7 @@ def delete_score(db: Session, score_id: int) -> bool:
     
     db.delete(db_score)
     db.commit()
+    ranking.invalidate(db_score.game_type)
     return True
 
 
@@ -337,95 +532,145 @@ def get_tickets_sold_count(db: Session) -> int:
     # Si alguna vez cambiamos eso, deberíamos hacer sum(quantity).
     return db.query(models.OrderItem).filter(models.OrderItem.product_type == 'ticket').count()
 
-def create_order(db: Session, order: schemas.OrderCreate, user_id: int) -> models.Order:
-    """Crear nuevo pedido con sus items"""
-    import uuid
-    
-    # Generar número de orden único (e.g., ORD-12345678)
-    order_number = f"ORD-{str(uuid.uuid4()).upper()[:8]}"
-    
+# Reintentos si un número de pedido o código de ticket choca con el índice único
+IDENTIFIER_ATTEMPTS = 3
+
+def build_order(db: Session, user_id: int, user: Optional[models.User] = None) -> models.Order:
+    """Crea el pedido (sin items) y hace flush para obtener su id. No hace commit."""
     # Crear el pedido
     db_order = models.Order(
         user_id=user_id, 
         total=0.0,
-        order_number=order_number,
         customer_email="user@email.com", # Placeholder, idealmente del usuario
         status="confirmed", # Confirmado porque se paga con almas al instante
         payment_status="paid"
     )
-    # Intentar obtener email del usuario si es posible
-    user = get_user(db, user_id)
     if user:
         db_order.customer_email = user.email
         db_order.customer_name = f"{user.first_name or ''} {user.last_name or ''}".strip() or user.username
-        
-    db.add(db_order)
-    db.flush()
     
-    total = 0.0
+    # Número de pedido único y ordenado por tiempo (ver app/identifiers.py);
+    # si aun así choca, se reintenta con otro dentro de un savepoint
+    for attempt in range(IDENTIFIER_ATTEMPTS):
+        db_order.order_number = identifiers.order_number()
+        try:
+            with db.begin_nested():
+                db.add(db_order)
+                db.flush()
+            return db_order
+        except IntegrityError:
+            if attempt == IDENTIFIER_ATTEMPTS - 1:
+                raise
+
+def order_item_rows(order_id: int, product: models.Product, quantity: int) -> List[dict]:
+    """
+    Filas de `order_items` para un producto del pedido. Los tickets se
+    desglosan en una fila por unidad (cada una con su código).
+    No comprueba ni descuenta stock (lo hace quien llama).
+    """
+    base = {
+        "order_id": order_id,
+        "product_id": product.id,
+        "unit_price": product.price,
+        "product_name": product.name,
+        "product_type": product.type,
+        "product_image_url": product.image_url,
+    }
+    if product.type != "ticket":
+        return [{**base, "quantity": quantity, "subtotal": product.price * quantity,
+                 "ticket_code": None, "ticket_status": None}]
+    # Crear un item por cada unidad para tener códigos únicos
+    return [
+        {**base, "quantity": 1, "subtotal": product.price, "ticket_code": code, "ticket_status": "valid"}
+        for code in identifiers.ticket_codes(quantity)
+    ]
+
+def insert_order_items(db: Session, rows: List[dict]) -> float:
+    """
+    Inserta las líneas de uno o varios pedidos en un solo INSERT multi-fila
+    (executemany) y devuelve su importe. No hace commit. Si un código de
+    ticket choca con el índice único, se regeneran (en `rows`) y se reintenta.
+    """
+    for attempt in range(IDENTIFIER_ATTEMPTS if rows else 0):
+        try:
+            with db.begin_nested():
+                db.execute(insert(models.OrderItem), rows)
+            break
+        except IntegrityError:
+            tickets = [row for row in rows if row["ticket_code"]]
+            if attempt == IDENTIFIER_ATTEMPTS - 1 or not tickets:
+                raise
+            for row, code in zip(tickets, identifiers.ticket_codes(len(tickets))):
+                row["ticket_code"] = code
+    return float(sum(row["subtotal"] for row in rows))
+
+def get_order_with_items(db: Session, order_id: int) -> Optional[models.Order]:
+    """Pedido con sus items cargados en una segunda consulta (selectinload)."""
+    return db.query(models.Order).options(selectinload(models.Order.items)).filter(
+        models.Order.id == order_id
+    ).first()
+
+def create_order(db: Session, order: schemas.OrderCreate, user_id: int) -> models.Order:
+    """Crear nuevo pedido con sus items"""
+    # Intentar obtener email del usuario si es posible
+    user = get_user(db, user_id)
+    db_order = build_order(db, user_id, user)
     
-    # Crear los items del pedido
+    needed = Counter()
     for item in order.items:
-        product = get_product(db, item.product_id)
+        needed[item.product_id] += item.quantity
+    
+    # Bloquear los productos (por id, como la cola de pedidos) y después los
+    # contadores de reservas: las del propio usuario cuentan como disponibles
+    products = {
+        p.id: p for p in db.query(models.Product).filter(
+            models.Product.id.in_(list(needed))
+        ).order_by(models.Product.id).with_for_update().all()
+    }
+    counters, holds = inventory.claim_for_order(db, [user_id], products)
+    
+    for product_id, quantity in needed.items():
+        product = products.get(product_id)
         if not product:
             db.rollback()
-            raise HTTPException(status_code=404, detail=f"Producto {item.product_id} no encontrado")
+            raise HTTPException(status_code=404, detail=f"Producto {product_id} no encontrado")
+        
+        if product.max_per_order and quantity > product.max_per_order:
+            db.rollback()
+            raise HTTPException(status_code=400, detail=f"Máximo {product.max_per_order} unidades de {product.name} por pedido")
         
-        if product.stock < item.quantity:
+        if inventory.available_for(product, counters, holds.get((user_id, product_id))) < quantity:
             db.rollback()
             raise HTTPException(status_code=400, detail=f"Stock insuficiente para {product.name}")
-            
-        # Determinar si necesitamos desglosar items (para tickets)
-        items_to_create = []
-        if product.type == "ticket":
-            # Crear un item por cada unidad para tener códigos únicos
-            for _ in range(item.quantity):
-                items_to_create.append({
-                    "quantity": 1,
-                    "is_ticket": True
-                })
-        else:
-            # Item normal
-            items_to_create.append({
-                "quantity": item.quantity,
-                "is_ticket": False
-            })
-            
-        for new_item_data in items_to_create:
-            qty = new_item_data["quantity"]
-            item_total = float(product.price) * qty
-            
-            # Generar código si es ticket
-            ticket_code = None
-            ticket_status = None
-            if new_item_data["is_ticket"]:
-                ticket_code = f"TKT-{str(uuid.uuid4()).upper()[:8]}"
-                ticket_status = "valid"
-            
-            db_item = models.OrderItem(
-                order_id=db_order.id,
-                product_id=product.id,
-                quantity=qty,
-                unit_price=product.price,
-                subtotal=item_total,
-                product_name=product.name,
-                product_type=product.type,
-                product_image_url=product.image_url,
-                ticket_code=ticket_code,
-                ticket_status=ticket_status
-            )
-            db.add(db_item)
-            total += item_total
+    
+    # Aforo de los eventos (contador por evento, 409 si está completo) y
+    # límite de entradas por persona (UPDATE condicionado por evento)
+    tickets = events.tickets_by_event(products, needed)
+    if tickets:
+        ledger = events.CapacityLedger(db, tickets)
+        ledger.reserve(db, tickets)
+        over_limit = events.add_user_tickets(db, user_id, tickets, ledger.events)
+        if over_limit is not None:
+            db.rollback()
+            raise HTTPException(status_code=400, detail=events.limit_exceeded_detail(over_limit))
+    
+    # Crear los items del pedido
+    rows = []
+    for item in order.items:
+        product = products[item.product_id]
+        rows.extend(order_item_rows(db_order.id, product, item.quantity))
 
         # Actualizar stock (una sola vez por el total de cantidad del producto original)
         product.stock -= item.quantity
     
+    for product_id in needed:
+        inventory.consume_hold(db, counters, holds.get((user_id, product_id)))
+    
     # Actualizar total del pedido
-    db_order.total = total
+    db_order.total = insert_order_items(db, rows)
     
     db.commit()
-    db.refresh(db_order)
-    return db_order
+    return get_order_with_items(db, db_order.id)
 
 def update_order(db: Session, order_id: int, order_update: schemas.OrderUpdate) -> Optional[models.Order]:
     """Actualizar estado del pedido"""
@@ -452,15 +697,35 @@ def cancel_order(db: Session, order_id: int) -> Optional[models.Order]:
         return db_order  # Ya está cancelado
     
     # Restaurar stock de los productos
-    for item in db_order.items:
-        if item.product:
-            item.product.stock += item.quantity
+    restore_order_stock(db, [order_id])
     
     db_order.status = "cancelled"
     db.commit()
     db.refresh(db_order)
     return db_order
 
+def restore_order_stock(db: Session, order_ids: List[int]) -> int:
+    """
+    Devuelve al stock las unidades de los pedidos: un UPDATE
+    `stock = stock + n` por producto (en orden de id), sin cargar items ni
+    productos, y descuenta sus entradas del aforo de cada evento.
+    Devuelve las unidades restauradas. No hace commit.
+    """
+    per_product = db.query(
+        models.OrderItem.product_id, func.sum(models.OrderItem.quantity)
+    ).filter(
+        models.OrderItem.order_id.in_(order_ids),
+        models.OrderItem.product_id.isnot(None)
+    ).group_by(models.OrderItem.product_id).order_by(models.OrderItem.product_id).all()
+    
+    for product_id, quantity in per_product:
+        db.query(models.Product).filter(models.Product.id == product_id).update(
+            {models.Product.stock: models.Product.stock + quantity}, synchronize_session=False
+        )
+    # Las entradas devueltas vuelven a contar para el aforo del evento
+    events.release_tickets(db, order_ids)
+    return int(sum(quantity for _, quantity in per_product))
+
 def delete_order(db: Session, order_id: int) -> bool:
     """Eliminar pedido"""
     db_order = get_order(db, order_id)
@@ -469,9 +734,7 @@ def delete_order(db: Session, order_id: int) -> bool:
     
     # Restaurar stock si el pedido no estaba cancelado
     if db_order.status != "cancelled":
-        for item in db_order.items:
-            if item.product:
-                item.product.stock += item.quantity
+        restore_order_stock(db, [order_id])
     
     db.delete(db_order)
     db.commit()
@@ -497,6 +760,10 @@ def get_order_items(db: Session, order_id: int) -> List[models.OrderItem]:
 
 def get_ticket_by_code(db: Session, ticket_code: str) -> Optional[models.OrderItem]:
     """Buscar un ticket por su código"""
+    # Un código mal tecleado (control incorrecto) no llega a la BD
+    ticket_code = identifiers.normalize(ticket_code, identifiers.TICKET_PREFIX)
+    if ticket_code is None:
+        return None
     return db.query(models.OrderItem).filter(
         models.OrderItem.ticket_code == ticket_code
     ).first()
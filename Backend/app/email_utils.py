@@ -1,11 +1,14 @@
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
 from pydantic import EmailStr
 from typing import List
+import logging
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 conf = ConnectionConfig(
     MAIL_USERNAME=os.getenv("MAIL_USERNAME", ""),
     MAIL_PASSWORD=os.getenv("MAIL_PASSWORD", ""),
@@ -56,20 +59,19 @@ async def send_ticket_email(email_to: EmailStr, customer_name: str, ticket_codes
         subtype=MessageType.html
     )
 
-    # Si no tenemos configuración real, solo imprimimos en consola
+    # Si no tenemos configuración real, solo lo registramos en el log
     if not os.getenv("MAIL_USERNAME") or "tu_email" in os.getenv("MAIL_USERNAME"):
-        print("\n" + "="*50)
-        print(f"📧 [SIMULACIÓN EMAIL] Enviando a: {email_to}")
-        print(f"Asunto: Tus Tickets para La Previa Maldita")
-        print("Contenido: (HTML Generado)")
-        print("="*50 + "\n")
+        logger.info(
+            "📧 [SIMULACIÓN EMAIL] Tickets",
+            extra={"email_to": email_to, "subject": message.subject, "tickets": len(ticket_codes)}
+        )
         return
 
     try:
         fm = FastMail(conf)
         await fm.send_message(message)
     except Exception as e:
-        print(f"❌ Error enviando email: {e}")
+        logger.exception("❌ Error enviando email", extra={"email_to": email_to})
 
 
 async def send_welcome_email(email_to: EmailStr, username: str):
@@ -113,16 +115,15 @@ async def send_welcome_email(email_to: EmailStr, username: str):
 
     # Simulación si no hay credenciales
     if not os.getenv("MAIL_USERNAME") or "tu_email" in os.getenv("MAIL_USERNAME"):
-        print("\n" + "="*50)
-        print(f"📧 [SIMULACIÓN EMAIL WELCOME] Enviando a: {email_to}")
-        print(f"Asunto: Bienvenido al Culto")
-        print("Contenido: (HTML Generado)")
-        print("="*50 + "\n")
+        logger.info(
+            "📧 [SIMULACIÓN EMAIL] Bienvenida",
+            extra={"email_to": email_to, "subject": message.subject}
+        )
         return
 
     try:
         fm = FastMail(conf)
         await fm.send_message(message)
     except Exception as e:
-        print(f"❌ Error enviando email de bienvenida: {e}")
+        logger.exception("❌ Error enviando email de bienvenida", extra={"email_to": email_to})
 
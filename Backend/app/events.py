@@ -0,0 +1,274 @@
+"""
+Eventos: caché de páginas por slug y contador de entradas vendidas.
+
+- Caché: la ficha de un evento (con sus productos) se sirve desde memoria
+  durante EVENT_CACHE_TTL_SECONDS; editar el evento la invalida en este
+  proceso y en los demás caduca sola.
+- Aforo: `event_ticket_counters` guarda las entradas vendidas por evento y
+  se actualiza en la misma transacción que el pedido, con la fila bloqueada.
+  Comprobar si un evento está agotado es leer esa fila, no contar
+  `order_items`. La fila se crea (contando lo ya vendido) la primera vez
+  que se necesita.
+- Límite por persona: `user_event_purchases` lleva las entradas de cada
+  usuario por evento. La compra lo incrementa con un UPDATE condicionado
+  (`tickets + n <= max_tickets_per_user`), una sola sentencia que además
+  serializa los checkouts simultáneos de la misma cuenta.
+
+Orden de bloqueo: products → users → product_inventory → event_ticket_counters
+→ user_event_purchases.
+"""
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .config import settings
+from . import models
+
+
+# ============================================================================
+# CACHÉ POR SLUG
+# ============================================================================
+class TTLCache:
+    """Diccionario con caducidad por entrada, seguro entre hilos."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._data: Dict[str, Tuple[float, object]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, key: Optional[str] = None):
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+
+page_cache = TTLCache(settings.EVENT_CACHE_TTL_SECONDS)
+
+
+# ============================================================================
+# CONTADORES DE AFORO
+# ============================================================================
+def _sold_tickets(db: Session, event_id: int) -> int:
+    """Entradas vendidas contando filas (solo al crear el contador)."""
+    return db.query(func.coalesce(func.sum(models.OrderItem.quantity), 0)).join(
+        models.Product, models.Product.id == models.OrderItem.product_id
+    ).join(
+        models.Order, models.Order.id == models.OrderItem.order_id
+    ).filter(
+        models.Product.event_id == event_id,
+        models.OrderItem.product_type == "ticket",
+        models.Order.status != "cancelled"
+    ).scalar()
+
+
+def lock_counters(db: Session, event_ids: Iterable[int]) -> Dict[int, models.EventTicketCounter]:
+    """Bloquea (creándolos si faltan) los contadores de los eventos, por orden de id."""
+    event_ids = sorted(set(event_ids))
+    if not event_ids:
+        return {}
+    counters = {
+        c.event_id: c for c in db.query(models.EventTicketCounter).filter(
+            models.EventTicketCounter.event_id.in_(event_ids)
+        ).order_by(models.EventTicketCounter.event_id).with_for_update().all()
+    }
+    for event_id in event_ids:
+        if event_id in counters:
+            continue
+        try:
+            with db.begin_nested():
+                db.add(models.EventTicketCounter(event_id=event_id, tickets_sold=_sold_tickets(db, event_id)))
+        except IntegrityError:
+            pass  # lo ha creado otra petición a la vez
+        counters[event_id] = db.query(models.EventTicketCounter).filter(
+            models.EventTicketCounter.event_id == event_id
+        ).with_for_update().one()
+    return counters
+
+
+def get_tickets_sold(db: Session, event_id: int) -> int:
+    """Lectura O(1) del contador (sin bloquear)."""
+    sold = db.query(models.EventTicketCounter.tickets_sold).filter(
+        models.EventTicketCounter.event_id == event_id
+    ).scalar()
+    return sold if sold is not None else _sold_tickets(db, event_id)
+
+
+def tickets_by_event(products: Dict[int, models.Product], needed: Dict[int, int]) -> Counter:
+    """Entradas por evento de un pedido (`needed`: cantidad por producto)."""
+    tickets = Counter()
+    for product_id, quantity in needed.items():
+        product = products[product_id]
+        if product.type == "ticket" and product.event_id is not None:
+            tickets[product.event_id] += quantity
+    return tickets
+
+
+class CapacityLedger:
+    """
+    Aforo de los eventos de uno o varios pedidos dentro de una transacción:
+    bloquea los contadores al crearse y va sumando las entradas asignadas.
+    """
+
+    def __init__(self, db: Session, event_ids: Iterable[int]):
+        self.counters = lock_counters(db, event_ids)
+        self.events = {
+            e.id: e for e in db.query(models.Event).filter(
+                models.Event.id.in_(list(self.counters))
+            )
+        } if self.counters else {}
+
+    def exceeded(self, tickets: Counter) -> Optional[models.Event]:
+        """Primer evento cuyo aforo se superaría con estas entradas, o None."""
+        for event_id, quantity in tickets.items():
+            event = self.events.get(event_id)
+            capacity = event.venue_capacity if event else None
+            if capacity is not None and self.counters[event_id].tickets_sold + quantity > capacity:
+                return event
+        return None
+
+    def add(self, tickets: Counter):
+        for event_id, quantity in tickets.items():
+            self.counters[event_id].tickets_sold += quantity
+
+    def reserve(self, db: Session, tickets: Counter):
+        """Suma las entradas o lanza 409 si el evento no tiene aforo suficiente."""
+        event = self.exceeded(tickets)
+        if event is not None:
+            remaining = max(event.venue_capacity - self.counters[event.id].tickets_sold, 0)
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Aforo completo para {event.name}: quedan {remaining} entradas"
+            )
+        self.add(tickets)
+
+
+# ============================================================================
+# LÍMITE POR USUARIO
+# ============================================================================
+def _purchased_tickets(db: Session, user_id: int, event_id: int) -> int:
+    """Entradas del usuario para el evento contando filas (solo al crear el contador)."""
+    return db.query(func.coalesce(func.sum(models.OrderItem.quantity), 0)).join(
+        models.Product, models.Product.id == models.OrderItem.product_id
+    ).join(
+        models.Order, models.Order.id == models.OrderItem.order_id
+    ).filter(
+        models.Order.user_id == user_id,
+        models.Product.event_id == event_id,
+        models.OrderItem.product_type == "ticket",
+        models.Order.status != "cancelled"
+    ).scalar()
+
+
+def _add_user_event_tickets(db: Session, user_id: int, event_id: int, quantity: int,
+                            limit: Optional[int]) -> bool:
+    for _ in range(2):
+        query = db.query(models.UserEventPurchase).filter(
+            models.UserEventPurchase.user_id == user_id,
+            models.UserEventPurchase.event_id == event_id
+        )
+        if limit is not None:
+            query = query.filter(models.UserEventPurchase.tickets + quantity <= limit)
+        if query.update({models.UserEventPurchase.tickets: models.UserEventPurchase.tickets + quantity},
+                        synchronize_session=False):
+            return True
+
+        # Sin fila todavía (primera compra desde que existe el contador) o límite superado
+        exists = db.query(models.UserEventPurchase.tickets).filter(
+            models.UserEventPurchase.user_id == user_id,
+            models.UserEventPurchase.event_id == event_id
+        ).scalar()
+        if exists is not None:
+            return False
+        purchased = _purchased_tickets(db, user_id, event_id)
+        if limit is not None and purchased + quantity > limit:
+            return False
+        try:
+            with db.begin_nested():
+                db.add(models.UserEventPurchase(user_id=user_id, event_id=event_id, tickets=purchased + quantity))
+            return True
+        except IntegrityError:
+            continue  # otra compra simultánea la ha creado: reintentar el UPDATE
+    return False
+
+
+def add_user_tickets(db: Session, user_id: int, tickets: Counter,
+                     events: Dict[int, models.Event]) -> Optional[models.Event]:
+    """
+    Suma las entradas del pedido a las del usuario por evento respetando
+    `max_tickets_per_user`. Devuelve el evento cuyo límite se superaría (los
+    eventos anteriores ya se han sumado: quien llama debe deshacer). No hace commit.
+    """
+    for event_id, quantity in sorted(tickets.items()):
+        event = events.get(event_id)
+        limit = event.max_tickets_per_user if event else None
+        if not _add_user_event_tickets(db, user_id, event_id, quantity, limit):
+            return event
+    return None
+
+
+def limit_exceeded_detail(event: models.Event) -> str:
+    return f"Máximo {event.max_tickets_per_user} entradas por persona para {event.name}"
+
+
+def release_tickets(db: Session, order_ids: Iterable[int]):
+    """
+    Descuenta las entradas de pedidos que se cancelan o borran: un UPDATE
+    por evento en el aforo y uno por (usuario, evento) en el límite por
+    persona. No hace commit.
+    """
+    order_ids = list(order_ids)
+    per_event = db.query(models.Product.event_id, func.sum(models.OrderItem.quantity)).join(
+        models.Product, models.Product.id == models.OrderItem.product_id
+    ).filter(
+        models.OrderItem.order_id.in_(order_ids),
+        models.OrderItem.product_type == "ticket",
+        models.Product.event_id.isnot(None)
+    ).group_by(models.Product.event_id).order_by(models.Product.event_id).all()
+
+    for event_id, quantity in per_event:
+        db.query(models.EventTicketCounter).filter(
+            models.EventTicketCounter.event_id == event_id
+        ).update(
+            {models.EventTicketCounter.tickets_sold: models.EventTicketCounter.tickets_sold - quantity},
+            synchronize_session=False
+        )
+
+    per_user = db.query(
+        models.Order.user_id, models.Product.event_id, func.sum(models.OrderItem.quantity)
+    ).join(
+        models.Order, models.Order.id == models.OrderItem.order_id
+    ).join(
+        models.Product, models.Product.id == models.OrderItem.product_id
+    ).filter(
+        models.OrderItem.order_id.in_(order_ids),
+        models.OrderItem.product_type == "ticket",
+        models.Product.event_id.isnot(None)
+    ).group_by(models.Order.user_id, models.Product.event_id).all()
+
+    for user_id, event_id, quantity in sorted(per_user):
+        db.query(models.UserEventPurchase).filter(
+            models.UserEventPurchase.user_id == user_id,
+            models.UserEventPurchase.event_id == event_id
+        ).update(
+            {models.UserEventPurchase.tickets: models.UserEventPurchase.tickets - quantity},
+            synchronize_session=False
+        )
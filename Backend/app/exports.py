@@ -0,0 +1,175 @@
+"""
+Exportación en streaming (CSV o NDJSON) de pedidos, tickets y usuarios.
+
+Las consultas seleccionan solo columnas (sin construir objetos ORM ni
+relaciones) y se recorren con un cursor de servidor (`stream_results` +
+`yield_per`), de modo que la memoria no crece con el número de filas. Las
+filas se escriben en trozos de ~64 KB que van directamente a la
+StreamingResponse.
+
+El generador abre su propia sesión: la de la dependencia `get_db` se cierra
+antes de que termine de enviarse la respuesta.
+"""
+import csv
+import io
+import logging
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Iterator, List, Optional
+
+import orjson
+from sqlalchemy import exists, select
+from sqlalchemy.sql import Select
+
+from .database import SessionLocal
+from . import models
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+# Filas pedidas a la BD en cada ronda del cursor
+YIELD_PER = 1000
+# Tamaño aproximado de cada trozo enviado al cliente
+CHUNK_SIZE = 64 * 1024
+
+
+# ============================================================================
+# CONSULTAS
+# ============================================================================
+ORDER_COLUMNS = (
+    models.Order.id, models.Order.order_number, models.Order.user_id,
+    models.Order.customer_email, models.Order.customer_name, models.Order.total,
+    models.Order.currency, models.Order.status, models.Order.payment_status,
+    models.Order.created_at, models.Order.cancelled_at,
+)
+
+TICKET_COLUMNS = (
+    models.OrderItem.id, models.OrderItem.ticket_code, models.OrderItem.ticket_status,
+    models.OrderItem.ticket_used_at, models.OrderItem.product_id, models.OrderItem.product_name,
+    models.Product.event_id, models.OrderItem.unit_price, models.OrderItem.order_id,
+    models.Order.order_number, models.Order.customer_email, models.OrderItem.created_at,
+)
+
+USER_COLUMNS = (
+    models.User.id, models.User.username, models.User.email, models.User.first_name,
+    models.User.last_name, models.User.role, models.User.auth_provider, models.User.is_active,
+    models.User.soul_balance, models.User.created_at, models.User.last_login_at,
+)
+
+
+def _date_range(query: Select, column, date_from: Optional[date], date_to: Optional[date]) -> Select:
+    if date_from:
+        query = query.where(column >= datetime.combine(date_from, time.min))
+    if date_to:
+        query = query.where(column <= datetime.combine(date_to, time.max))
+    return query
+
+
+def orders_query(date_from: Optional[date] = None, date_to: Optional[date] = None,
+                 status: Optional[str] = None, event_id: Optional[int] = None) -> Select:
+    """Pedidos; con `event_id`, los que incluyen algún producto del evento."""
+    query = select(*ORDER_COLUMNS)
+    query = _date_range(query, models.Order.created_at, date_from, date_to)
+    if status:
+        query = query.where(models.Order.status == status)
+    if event_id is not None:
+        query = query.where(exists().where(
+            models.OrderItem.order_id == models.Order.id,
+            models.OrderItem.product_id == models.Product.id,
+            models.Product.event_id == event_id,
+        ))
+    return query.order_by(models.Order.id)
+
+
+def tickets_query(date_from: Optional[date] = None, date_to: Optional[date] = None,
+                  status: Optional[str] = None, event_id: Optional[int] = None) -> Select:
+    """Tickets vendidos; `status` filtra por estado del ticket (valid, used...)."""
+    query = select(*TICKET_COLUMNS).select_from(models.OrderItem).join(
+        models.Order, models.Order.id == models.OrderItem.order_id
+    ).outerjoin(
+        models.Product, models.Product.id == models.OrderItem.product_id
+    ).where(models.OrderItem.ticket_code.isnot(None))
+    query = _date_range(query, models.OrderItem.created_at, date_from, date_to)
+    if status:
+        query = query.where(models.OrderItem.ticket_status == status)
+    if event_id is not None:
+        query = query.where(models.Product.event_id == event_id)
+    return query.order_by(models.OrderItem.id)
+
+
+def users_query(date_from: Optional[date] = None, date_to: Optional[date] = None,
+                status: Optional[str] = None, event_id: Optional[int] = None) -> Select:
+    """
+    Usuarios por fecha de alta; `status` es "active" o "inactive" y
+    `event_id` deja solo a quienes han comprado algo del evento.
+    """
+    query = select(*USER_COLUMNS)
+    query = _date_range(query, models.User.created_at, date_from, date_to)
+    if status:
+        query = query.where(models.User.is_active == (status == "active"))
+    if event_id is not None:
+        query = query.where(exists().where(
+            models.Order.user_id == models.User.id,
+            models.OrderItem.order_id == models.Order.id,
+            models.OrderItem.product_id == models.Product.id,
+            models.Product.event_id == event_id,
+        ))
+    return query.order_by(models.User.id)
+
+
+# ============================================================================
+# ESCRITURA
+# ============================================================================
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def stream_rows(query: Select, fmt: str) -> Iterator[bytes]:
+    """Ejecuta la consulta con cursor de servidor y produce el fichero por trozos."""
+    db = SessionLocal()
+    rows = 0
+    try:
+        result = db.execute(query.execution_options(stream_results=True, yield_per=YIELD_PER))
+        columns: List[str] = list(result.keys())
+        buffer = io.StringIO()
+
+        if fmt == "csv":
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for partition in result.partitions():
+                for row in partition:
+                    writer.writerow([_csv_value(v) for v in row])
+                rows += len(partition)
+                if buffer.tell() >= CHUNK_SIZE:
+                    yield buffer.getvalue().encode()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue().encode()
+        else:
+            chunk = bytearray()
+            for partition in result.partitions():
+                for row in partition:
+                    chunk += orjson.dumps(dict(zip(columns, row)), default=_json_default)
+                    chunk += b"\n"
+                rows += len(partition)
+                if len(chunk) >= CHUNK_SIZE:
+                    yield bytes(chunk)
+                    chunk.clear()
+            yield bytes(chunk)
+    finally:
+        db.close()
+        logger.info("Exportación terminada", extra={"rows": rows, "format": fmt})
@@ -0,0 +1,258 @@
+"""
+Verificación local de los ID tokens de Google (`POST /users/google-auth`).
+
+En lugar de `id_token.verify_oauth2_token`, que crea un transporte nuevo en
+cada login y puede descargar los certificados de Google en mitad de la
+petición, las claves públicas (JWKS de GOOGLE_CERTS_URL) se guardan en
+memoria y verificar un token es solo comprobar la firma RS256 y los claims:
+
+- Un hilo renueva las claves antes de que caduquen según el `max-age` del
+  Cache-Control de Google, por una conexión HTTP persistente (keep-alive).
+  Si la descarga falla se siguen usando las claves anteriores y se reintenta.
+- Un `kid` desconocido (Google acaba de rotar las claves) fuerza una
+  descarga, agrupada entre peticiones concurrentes y como mucho una cada
+  UNKNOWN_KID_COOLDOWN segundos.
+
+Para probar sin red, benchmarks/google_jwks_stub.py sirve un JWKS propio y
+firma tokens de prueba con él.
+"""
+import http.client
+import json
+import logging
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from jose import JWTError, jwk, jwt
+
+from .config import settings
+from . import metrics, singleflight
+
+logger = logging.getLogger(__name__)
+
+ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+ALGORITHM = "RS256"
+# Vigencia de las claves si la respuesta no trae Cache-Control
+DEFAULT_MAX_AGE = 3600
+# Se renuevan al pasar esta fracción de su vigencia
+REFRESH_AT = 0.8
+MIN_REFRESH_SECONDS = 60
+RETRY_SECONDS = 30
+UNKNOWN_KID_COOLDOWN = 30
+HTTP_TIMEOUT = 5
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+# ============================================================================
+# CONEXIÓN CON EL SERVIDOR DE CLAVES
+# ============================================================================
+class KeySession:
+    """Conexión HTTP(S) persistente con el servidor de claves, reutilizada entre descargas."""
+
+    def __init__(self, url: str, timeout: float = HTTP_TIMEOUT):
+        parts = urlsplit(url)
+        self.url = url
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.timeout = timeout
+        self._conn: Optional[http.client.HTTPConnection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> http.client.HTTPConnection:
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def get(self) -> Tuple[int, http.client.HTTPMessage, bytes]:
+        """(status, cabeceras, cuerpo). Reconecta una vez si el servidor cerró la conexión."""
+        with self._lock:
+            for attempt in range(2):
+                if self._conn is None:
+                    self._conn = self._connect()
+                try:
+                    self._conn.request("GET", self.path, headers={"Accept": "application/json"})
+                    response = self._conn.getresponse()
+                    body = response.read()
+                except (http.client.HTTPException, OSError):
+                    self._close()
+                    if attempt:
+                        raise
+                    continue
+                if response.will_close:
+                    self._close()
+                return response.status, response.headers, body
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+# ============================================================================
+# CACHÉ DE CLAVES
+# ============================================================================
+def _max_age(headers) -> float:
+    """Segundos de vigencia según Cache-Control (menos Age si pasa por una caché)."""
+    match = _MAX_AGE.search(headers.get("Cache-Control", "") or "")
+    if not match:
+        return DEFAULT_MAX_AGE
+    try:
+        age = int(headers.get("Age", 0) or 0)
+    except ValueError:
+        age = 0
+    return max(int(match.group(1)) - age, 0)
+
+
+_session: Optional[KeySession] = None
+_session_lock = threading.Lock()
+_keys: Dict[str, object] = {}
+_expires_at = 0.0       # monotonic
+_last_fetch = 0.0       # monotonic, intento más reciente
+_flight = singleflight.group("google_certs")
+_stats = {"ok": 0, "error": 0}
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def _get_session() -> KeySession:
+    global _session
+    with _session_lock:
+        if _session is None or _session.url != settings.GOOGLE_CERTS_URL:
+            if _session is not None:
+                _session.close()
+            _session = KeySession(settings.GOOGLE_CERTS_URL)
+        return _session
+
+
+def _fetch() -> int:
+    """Descarga el JWKS y sustituye las claves. Devuelve cuántas hay."""
+    global _keys, _expires_at, _last_fetch
+    _last_fetch = time.monotonic()
+    try:
+        status_code, headers, body = _get_session().get()
+        if status_code != 200:
+            raise ValueError(f"HTTP {status_code}")
+        keys = {}
+        for key in json.loads(body)["keys"]:
+            if key.get("kty") == "RSA" and key.get("kid"):
+                keys[key["kid"]] = jwk.construct(key, ALGORITHM)
+        if not keys:
+            raise ValueError("JWKS sin claves RSA")
+    except Exception:
+        _stats["error"] += 1
+        raise
+    _keys = keys
+    _expires_at = time.monotonic() + _max_age(headers)
+    _stats["ok"] += 1
+    return len(keys)
+
+
+def refresh() -> int:
+    """Descarga las claves (una sola descarga para peticiones simultáneas)."""
+    return _flight.do("certs", _fetch)
+
+
+def _key_for(kid: Optional[str]):
+    key = _keys.get(kid)
+    if key is not None:
+        return key
+    # Sin claves todavía (arranque) o rotación en Google: descargar ya
+    if not _keys or time.monotonic() - _last_fetch >= UNKNOWN_KID_COOLDOWN:
+        try:
+            refresh()
+        except Exception as exc:
+            logger.warning("No se pudieron descargar las claves de Google", extra={"error": str(exc)})
+        key = _keys.get(kid)
+    return key
+
+
+# ============================================================================
+# VERIFICACIÓN
+# ============================================================================
+def verify(token: str, audience: str) -> dict:
+    """
+    Claims de un ID token de Google válido para `audience`. Lanza ValueError
+    si el token no es válido (firma, emisor, audiencia o caducidad).
+    """
+    try:
+        header = jwt.get_unverified_header(token)
+    except JWTError as exc:
+        raise ValueError(f"token mal formado ({exc})")
+    if header.get("alg") != ALGORITHM:
+        raise ValueError(f"algoritmo no admitido: {header.get('alg')}")
+    key = _key_for(header.get("kid"))
+    if key is None:
+        raise ValueError("clave de firma desconocida")
+    try:
+        return jwt.decode(token, key, algorithms=[ALGORITHM], audience=audience, issuer=ISSUERS)
+    except JWTError as exc:
+        raise ValueError(str(exc))
+
+
+# ============================================================================
+# HILO DE RENOVACIÓN
+# ============================================================================
+def _refresh_loop():
+    while True:
+        lifetime = _expires_at - _last_fetch
+        delay = max(_last_fetch + lifetime * REFRESH_AT - time.monotonic(), MIN_REFRESH_SECONDS)
+        if _stop.wait(delay):
+            return
+        try:
+            refresh()
+        except Exception:
+            logger.exception("Error renovando las claves de Google")
+            _stop.wait(RETRY_SECONDS)
+
+
+def start():
+    """Descarga las claves y arranca su renovación (lifespan). Solo con GOOGLE_CLIENT_ID."""
+    global _thread
+    if not settings.GOOGLE_CLIENT_ID or _thread is not None:
+        return
+    try:
+        refresh()
+    except Exception as exc:
+        # No impide arrancar: se reintenta en el primer login
+        logger.warning("No se pudieron descargar las claves de Google", extra={"error": str(exc)})
+    _stop.clear()
+    _thread = threading.Thread(target=_refresh_loop, name="google-jwks", daemon=True)
+    _thread.start()
+
+
+def stop(timeout: float = 5):
+    global _thread
+    if _thread is None:
+        return
+    _stop.set()
+    _thread.join(timeout)
+    _thread = None
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+
+
+# ============================================================================
+# MÉTRICAS
+# ============================================================================
+def jwks_collector():
+    if not settings.GOOGLE_CLIENT_ID:
+        return
+    for result in ("ok", "error"):
+        yield ("google_jwks_fetch_total", "counter", "Descargas de las claves de Google.",
+               {"result": result}, _stats[result])
+    yield "google_jwks_keys", "gauge", "Claves de Google en memoria.", {}, len(_keys)
+    yield ("google_jwks_ttl_seconds", "gauge", "Segundos hasta que caducan las claves en memoria.",
+           {}, round(max(_expires_at - time.monotonic(), 0), 1))
+
+
+metrics.registry.register_collector(jwks_collector)
@@ -0,0 +1,362 @@
+"""
+Soporte de la cabecera `Idempotency-Key` en endpoints POST con efectos.
+
+El cliente genera una clave por operación lógica y la reenvía en cada
+reintento. La primera petición reserva la clave (fila `in_progress` en
+`idempotency_keys`), ejecuta el endpoint y guarda su respuesta; las
+repeticiones devuelven esa respuesta sin volver a ejecutar nada (cabecera
+`Idempotent-Replayed: true`). Un duplicado concurrente espera a que termine
+la primera ejecución, hasta IDEMPOTENCY_WAIT_SECONDS.
+
+Estados: in_progress -> applied -> completed. Con la sesión del endpoint, la
+clave pasa a `applied` en la misma transacción que el pedido o la partida
+(con los ids creados), así que el efecto y la marca se confirman juntos:
+
+- si el proceso cae antes de guardar la respuesta, el reintento la
+  reconstruye con `recover` a partir de esos ids, sin volver a ejecutar;
+- una reserva `in_progress` abandonada (más de IDEMPOTENCY_LOCK_SECONDS)
+  no llegó a confirmar nada y otra petición puede quedársela; si la
+  ejecución original sigue viva, su commit falla al no encontrar su reserva.
+
+Sin sesión (efectos fuera de la BD) una reserva abandonada no se reejecuta:
+se responde 409 y el cliente debe usar otra clave.
+
+Si la ejecución falla antes de confirmar, la reserva se libera y el
+reintento puede volver a intentarlo. Las claves caducan a las
+IDEMPOTENCY_TTL_HOURS.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+
+from fastapi import HTTPException, Request, status
+from pydantic import BaseModel
+from sqlalchemy import event, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+from .database import SessionLocal
+from .responses import ORJSONResponse
+from . import models
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+# Intervalo de sondeo de la BD mientras se espera a otro proceso
+POLL_INTERVAL = 0.1
+
+# Ejecuciones en curso en este proceso: los duplicados esperan al evento
+# en lugar de sondear la BD
+_in_flight: Dict[Tuple[int, str, str], threading.Event] = {}
+_in_flight_lock = threading.Lock()
+
+
+def request_fingerprint(payload: BaseModel) -> str:
+    """Hash del cuerpo: la misma clave con otro cuerpo es un error del cliente."""
+    data = json.dumps(payload.model_dump(mode="json"), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class IdempotentCall:
+    """Reserva, espera y guarda la respuesta de una clave concreta."""
+
+    def __init__(self, scope: str, key: str, user_id: int, fingerprint: str):
+        self.scope = scope
+        self.key = key
+        self.user_id = user_id
+        self.fingerprint = fingerprint
+        self.record_id: Optional[int] = None
+        # Ids creados en la transacción del endpoint, por modelo
+        self.created: Dict[str, int] = {}
+        self.applied = False
+        # Transacción cuyo commit lleva la marca `applied`
+        self._marked_in = None
+        self.status_code: Optional[int] = None
+
+    @property
+    def _flight_key(self) -> Tuple[int, str, str]:
+        return (self.user_id, self.scope, self.key)
+
+    def acquire(self, transactional: bool = False) -> Optional[models.IdempotencyKey]:
+        """
+        Reserva la clave. Devuelve None si esta petición debe ejecutarse, o la
+        fila existente si ya se aplicó (`completed` o `applied`).
+
+        `transactional`: la ejecución marca `applied` en su transacción (ver
+        `attach`), así que una reserva abandonada se puede reejecutar.
+        """
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            db = SessionLocal()
+            try:
+                now = datetime.utcnow()
+                record = models.IdempotencyKey(
+                    user_id=self.user_id,
+                    scope=self.scope,
+                    key=self.key,
+                    request_hash=self.fingerprint,
+                    status="in_progress",
+                    created_at=now,
+                    expires_at=now + timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS),
+                )
+                db.add(record)
+                try:
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()
+                else:
+                    self.record_id = record.id
+                    with _in_flight_lock:
+                        _in_flight[self._flight_key] = threading.Event()
+                    return None
+
+                existing = db.query(models.IdempotencyKey).filter(
+                    models.IdempotencyKey.user_id == self.user_id,
+                    models.IdempotencyKey.scope == self.scope,
+                    models.IdempotencyKey.key == self.key,
+                ).first()
+                if existing is None:
+                    continue  # liberada entre el INSERT y la consulta
+
+                if existing.expires_at < now:
+                    db.delete(existing)
+                    db.commit()
+                    continue
+
+                if existing.request_hash != self.fingerprint:
+                    raise HTTPException(
+                        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                        detail="La Idempotency-Key ya se usó con otro cuerpo de petición"
+                    )
+                if existing.status in ("completed", "applied"):
+                    db.expunge(existing)
+                    return existing
+
+                abandoned = existing.created_at < now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+                if abandoned and transactional:
+                    # No confirmó nada (si no, estaría `applied`): se puede reejecutar
+                    db.delete(existing)
+                    db.commit()
+                    continue
+                if abandoned:
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail="No se puede saber si la petición con esta Idempotency-Key se aplicó; "
+                               "comprueba el resultado antes de repetirla con otra clave"
+                    )
+            finally:
+                db.close()
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Una petición con esta Idempotency-Key sigue en curso"
+                )
+            self._wait(remaining)
+
+    def _wait(self, remaining: float):
+        with _in_flight_lock:
+            event = _in_flight.get(self._flight_key)
+        if event is not None:
+            # Misma instancia: se despierta en cuanto termina la primera
+            event.wait(timeout=remaining)
+        else:
+            time.sleep(min(remaining, POLL_INTERVAL))
+
+    # ------------------------------------------------------------------------
+    # Marca en la transacción del endpoint
+    # ------------------------------------------------------------------------
+    def _after_flush(self, session: Session, flush_context):
+        for obj in session.new:
+            name = type(obj).__name__
+            if name not in self.created and getattr(obj, "id", None) is not None:
+                self.created[name] = obj.id
+
+    def _before_commit(self, session: Session):
+        # Los SAVEPOINT (begin_nested) también disparan before_commit: la marca
+        # va solo en el commit de la transacción exterior, que es el del efecto
+        if self.applied or session.in_nested_transaction():
+            return
+        session.flush()
+        marked = session.execute(
+            update(models.IdempotencyKey).where(
+                models.IdempotencyKey.id == self.record_id,
+                models.IdempotencyKey.status == "in_progress",
+            ).values(status="applied", response_status=self.status_code,
+                     response_body={"created": self.created})
+        ).rowcount
+        if marked != 1:
+            # Otra petición se quedó la reserva por abandonada: no confirmar
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="La reserva de esta Idempotency-Key caducó durante la ejecución"
+            )
+        self.applied = True
+        self._marked_in = session.get_transaction()
+
+    def _after_soft_rollback(self, session: Session, previous_transaction):
+        # El commit que llevaba la marca falló: se deshizo con la transacción
+        if previous_transaction is self._marked_in:
+            self.applied = False
+            self._marked_in = None
+
+    def attach(self, db: Session, status_code: int):
+        """Marca la clave `applied` en el primer commit de `db` (el del efecto)."""
+        self.status_code = status_code
+        event.listen(db, "after_flush", self._after_flush)
+        event.listen(db, "before_commit", self._before_commit)
+        event.listen(db, "after_soft_rollback", self._after_soft_rollback)
+
+    def detach(self, db: Session):
+        event.remove(db, "after_flush", self._after_flush)
+        event.remove(db, "before_commit", self._before_commit)
+        event.remove(db, "after_soft_rollback", self._after_soft_rollback)
+
+    def complete(self, status_code: int, body: Any):
+        db = SessionLocal()
+        try:
+            db.query(models.IdempotencyKey).filter(models.IdempotencyKey.id == self.record_id).update({
+                models.IdempotencyKey.status: "completed",
+                models.IdempotencyKey.response_status: status_code,
+                models.IdempotencyKey.response_body: body,
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        self._wake()
+
+    def release(self):
+        """Libera la reserva si no llegó a confirmarse ningún efecto."""
+        db = SessionLocal()
+        try:
+            db.query(models.IdempotencyKey).filter(
+                models.IdempotencyKey.id == self.record_id,
+                models.IdempotencyKey.status == "in_progress"
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        self._wake()
+
+    def _wake(self):
+        with _in_flight_lock:
+            event = _in_flight.pop(self._flight_key, None)
+        if event is not None:
+            event.set()
+
+
+def execute(request: Request, scope: str, user_id: int, payload: BaseModel,
+            response_model: Type[BaseModel], status_code: int, func: Callable[[], Any],
+            db: Optional[Session] = None, recover: Optional[Callable[[Dict[str, int]], Any]] = None):
+    """
+    Ejecuta `func` respetando la cabecera Idempotency-Key (si no viene, se
+    ejecuta sin más). Usar desde endpoints `def` (bloquea mientras espera).
+
+    - `db`: sesión en la que `func` confirma su efecto; la clave se marca
+      `applied` en esa misma transacción.
+    - `recover(created)`: rehace el resultado a partir de los ids creados
+      (`{"Order": 7}`) si el efecto se confirmó pero no llegó a guardarse la
+      respuesta.
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return ORJSONResponse(content=_serialize(response_model, func()), status_code=status_code)
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"La Idempotency-Key no puede superar {MAX_KEY_LENGTH} caracteres"
+        )
+
+    call = IdempotentCall(scope, key, user_id, request_fingerprint(payload))
+    existing = call.acquire(transactional=db is not None)
+    if existing is not None:
+        return _replay(call, existing, response_model, recover)
+
+    if db is not None:
+        call.attach(db, status_code)
+    try:
+        body = _serialize(response_model, func())
+    except BaseException:
+        if db is not None:
+            db.rollback()  # soltar sus bloqueos antes de liberar la reserva
+        call.release()
+        raise
+    finally:
+        if db is not None:
+            call.detach(db)
+    try:
+        call.complete(status_code, body)
+    except Exception:
+        # El efecto ya está confirmado (`applied`): el reintento usa `recover`
+        logger.exception("Error guardando la respuesta idempotente", extra={"scope": scope})
+        call._wake()
+    return ORJSONResponse(content=body, status_code=status_code)
+
+
+def _replay(call: IdempotentCall, existing: models.IdempotencyKey, response_model: Type[BaseModel],
+            recover: Optional[Callable[[Dict[str, int]], Any]]) -> ORJSONResponse:
+    if existing.status == "completed":
+        return ORJSONResponse(
+            content=existing.response_body,
+            status_code=existing.response_status,
+            headers={REPLAYED_HEADER: "true"},
+        )
+    # `applied`: efecto confirmado sin respuesta guardada
+    result = recover((existing.response_body or {}).get("created", {})) if recover else None
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="La petición con esta Idempotency-Key ya se aplicó"
+        )
+    body = _serialize(response_model, result)
+    call.record_id = existing.id
+    call.complete(existing.response_status, body)
+    return ORJSONResponse(content=body, status_code=existing.response_status,
+                          headers={REPLAYED_HEADER: "true"})
+
+
+def _serialize(response_model: Type[BaseModel], result: Any):
+    """
+    Serializa con el modelo indicado, no con el `response_model` de la ruta
+    (un endpoint puede responder 202 con la intención encolada).
+    """
+    return response_model.model_validate(result).model_dump(mode="json")
+
+
+# ============================================================================
+# LIMPIEZA
+# ============================================================================
+def purge_expired() -> int:
+    """Borra las claves caducadas."""
+    db = SessionLocal()
+    try:
+        deleted = db.query(models.IdempotencyKey).filter(
+            models.IdempotencyKey.expires_at < datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+async def purge_periodically(interval: float = 3600):
+    """Tarea del lifespan: limpieza de claves caducadas cada `interval` segundos."""
+    while True:
+        try:
+            deleted = await run_in_threadpool(purge_expired)
+            if deleted:
+                logger.info("Idempotency keys caducadas eliminadas", extra={"deleted": deleted})
+        except Exception:
+            logger.exception("Error limpiando idempotency keys")
+        await asyncio.sleep(interval)
@@ -0,0 +1,319 @@
+"""
+Identificadores públicos de pedidos y tickets (`ORD-…`, `TKT-…`).
+
+Cada identificador es un entero de 70 bits ordenado por tiempo, al estilo
+snowflake:
+
+    | 42 bits: ms desde EPOCH | 8 bits: nodo | 8 bits: proceso | 12 bits: secuencia |
+
+- El prefijo temporal hace que los nuevos valores vayan siempre al final del
+  índice único (inserciones locales, sin páginas dispersas como con uuid).
+- Nodo + proceso (16 bits) identifican al generador. Cada proceso los
+  alquila en `id_worker_leases` (la BD compartida), así que dos procesos
+  vivos nunca usan el mismo, estén en el mismo servidor o no. Con NODE_ID
+  el proceso solo alquila entre los 256 de su nodo. El alquiler dura
+  LEASE_SECONDS y un hilo lo renueva; si no se ha podido renovar, se
+  vuelve a alquilar antes de generar (quizá otro valor).
+- Dentro de un proceso la secuencia garantiza unicidad y orden: hasta 4096
+  valores por milisegundo; si se agotan (o el reloj retrocede) se toma
+  prestado el milisegundo siguiente en lugar de esperar.
+- Quien inserta los códigos reintenta con valores nuevos si aun así choca
+  con el índice único (ver `crud.build_order`).
+
+Se codifican en base32 de Crockford (sin I, L, O, U: no se confunden al
+dictarlos) más un símbolo de control módulo 37, así que un código mal
+tecleado se rechaza sin consultar la BD: `ORD-` + 15 caracteres.
+"""
+import logging
+import os
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from .config import settings
+from .database import SessionLocal
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# 2024-01-01T00:00:00Z en ms: 42 bits dan para ~139 años
+EPOCH_MS = 1704067200000
+
+NODE_BITS = 8
+PROCESS_BITS = 8
+SEQUENCE_BITS = 12
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+CHECK_ALPHABET = ALPHABET + "*~$=U"
+BODY_LENGTH = 14  # 70 bits / 5 bits por carácter
+
+LEASE_SECONDS = 600
+# Se deja de usar un alquiler este margen antes de que caduque en la BD
+# (tolerancia a desfases de reloj entre servidores)
+LEASE_MARGIN_SECONDS = 60
+
+ORDER_PREFIX = "ORD-"
+TICKET_PREFIX = "TKT-"
+
+# Códigos anteriores: 8 caracteres hexadecimales de un uuid
+_LEGACY = re.compile(r"^[0-9A-F]{8}$")
+# Lectura tolerante: minúsculas, I/L por 1 y O por 0
+_DECODE = {c: i for i, c in enumerate(ALPHABET)}
+_DECODE.update({"I": 1, "L": 1, "O": 0})
+
+
+def _worker_range() -> range:
+    """Valores de nodo + proceso que puede alquilar este proceso."""
+    if settings.NODE_ID:
+        node = int(settings.NODE_ID) % (1 << NODE_BITS)
+        return range(node << PROCESS_BITS, (node + 1) << PROCESS_BITS)
+    return range(1 << (NODE_BITS + PROCESS_BITS))
+
+
+class WorkerLease:
+    """Alquiler en la BD del valor de nodo + proceso de este proceso."""
+
+    def __init__(self):
+        self.holder = f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.worker_id: Optional[int] = None
+        self._valid_until = 0.0  # monotonic
+
+    def valid(self) -> bool:
+        return self.worker_id is not None and time.monotonic() < self._valid_until
+
+    def _held(self, started: float):
+        self._valid_until = started + LEASE_SECONDS - LEASE_MARGIN_SECONDS
+
+    def renew(self) -> bool:
+        """Prolonga el alquiler actual. False si se ha perdido (o no hay)."""
+        if self.worker_id is None:
+            return False
+        started = time.monotonic()
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            renewed = db.query(models.IdWorkerLease).filter(
+                models.IdWorkerLease.worker_id == self.worker_id,
+                models.IdWorkerLease.holder == self.holder,
+            ).update({models.IdWorkerLease.expires_at: now + timedelta(seconds=LEASE_SECONDS)},
+                     synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        if renewed:
+            self._held(started)
+            return True
+        self.worker_id = None
+        return False
+
+    def acquire(self) -> int:
+        """Alquila un valor libre (o caducado) del rango de este proceso."""
+        if self.renew():
+            return self.worker_id
+        candidates = _worker_range()
+        while True:
+            started = time.monotonic()
+            db = SessionLocal()
+            try:
+                now = datetime.utcnow()
+                leases = db.query(models.IdWorkerLease.worker_id, models.IdWorkerLease.expires_at).filter(
+                    models.IdWorkerLease.worker_id >= candidates.start,
+                    models.IdWorkerLease.worker_id < candidates.stop,
+                ).all()
+                taken = {worker_id for worker_id, expires_at in leases if expires_at >= now}
+                free = [w for w in candidates if w not in taken]
+                if not free:
+                    raise RuntimeError("No quedan identificadores de proceso libres (NODE_ID)")
+                # Al azar: varios procesos arrancando a la vez rara vez eligen el mismo
+                worker_id = random.choice(free[:64])
+                expires_at = now + timedelta(seconds=LEASE_SECONDS)
+                if any(w == worker_id for w, _ in leases):
+                    # Caducado: solo se lo queda quien lo actualiza primero
+                    won = db.query(models.IdWorkerLease).filter(
+                        models.IdWorkerLease.worker_id == worker_id,
+                        models.IdWorkerLease.expires_at < now,
+                    ).update({models.IdWorkerLease.holder: self.holder,
+                              models.IdWorkerLease.expires_at: expires_at},
+                             synchronize_session=False)
+                else:
+                    db.add(models.IdWorkerLease(worker_id=worker_id, holder=self.holder, expires_at=expires_at))
+                    won = 1
+                try:
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()
+                    won = 0
+            finally:
+                db.close()
+            if won:
+                self.worker_id = worker_id
+                self._held(started)
+                logger.info("Identificador de proceso alquilado", extra={"worker_id": worker_id})
+                return worker_id
+
+    def release(self):
+        if self.worker_id is None:
+            return
+        db = SessionLocal()
+        try:
+            db.query(models.IdWorkerLease).filter(
+                models.IdWorkerLease.worker_id == self.worker_id,
+                models.IdWorkerLease.holder == self.holder,
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        self.worker_id = None
+
+
+class IdGenerator:
+    """Generador por proceso; se reinicia solo tras un fork (workers de uvicorn)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self.lease = WorkerLease()
+        self._last_ms = 0
+        self._sequence = 0
+
+    def _worker(self) -> int:
+        """Valor de nodo + proceso vigente; lo (re)alquila si hace falta. Llamar con `_lock`."""
+        if os.getpid() != self._pid:
+            self._reset()  # el alquiler es del proceso padre
+        if not self.lease.valid():
+            self.lease.acquire()
+        return self.lease.worker_id
+
+    def next_values(self, count: int) -> List[int]:
+        """Reserva `count` identificadores consecutivos de una vez."""
+        with self._lock:
+            worker = self._worker()
+            values = []
+            while len(values) < count:
+                now = int(time.time() * 1000) - EPOCH_MS
+                if now > self._last_ms:
+                    self._last_ms, self._sequence = now, 0
+                elif self._sequence > SEQUENCE_MASK:
+                    # Secuencia agotada o reloj hacia atrás: siguiente milisegundo
+                    self._last_ms, self._sequence = self._last_ms + 1, 0
+                take = min(count - len(values), SEQUENCE_MASK + 1 - self._sequence)
+                prefix = ((self._last_ms << (NODE_BITS + PROCESS_BITS)) | worker) << SEQUENCE_BITS
+                values.extend(prefix | seq for seq in range(self._sequence, self._sequence + take))
+                self._sequence += take
+            return values
+
+    def renew(self):
+        with self._lock:
+            if os.getpid() != self._pid:
+                self._reset()
+            if not self.lease.renew():
+                self.lease.acquire()
+
+    def release(self):
+        with self._lock:
+            if os.getpid() == self._pid:
+                self.lease.release()
+
+
+_generator = IdGenerator()
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+# ============================================================================
+# RENOVACIÓN DEL ALQUILER
+# ============================================================================
+def _renew_loop():
+    while not _stop.wait(LEASE_SECONDS / 3):
+        try:
+            _generator.renew()
+        except Exception:
+            logger.exception("Error renovando el identificador de proceso")
+
+
+def start():
+    """Alquila el identificador de proceso y lo renueva en segundo plano (lifespan)."""
+    global _thread
+    if _thread is not None:
+        return
+    _generator.renew()
+    _stop.clear()
+    _thread = threading.Thread(target=_renew_loop, name="id-lease", daemon=True)
+    _thread.start()
+
+
+def stop(timeout: float = 5):
+    """Detiene la renovación y libera el alquiler."""
+    global _thread
+    if _thread is None:
+        return
+    _stop.set()
+    _thread.join(timeout)
+    _thread = None
+    _generator.release()
+
+
+# ============================================================================
+# CODIFICACIÓN
+# ============================================================================
+def encode(value: int) -> str:
+    """Base32 de Crockford con longitud fija más el símbolo de control."""
+    chars = []
+    n = value
+    for _ in range(BODY_LENGTH):
+        chars.append(ALPHABET[n & 31])
+        n >>= 5
+    return "".join(reversed(chars)) + CHECK_ALPHABET[value % 37]
+
+
+def decode(text: str) -> Optional[int]:
+    """Valor de un código (sin prefijo) o None si está mal formado o el control no cuadra."""
+    text = text.strip().upper().replace("-", "")
+    if len(text) != BODY_LENGTH + 1:
+        return None
+    value = 0
+    for char in text[:-1]:
+        digit = _DECODE.get(char)
+        if digit is None:
+            return None
+        value = (value << 5) | digit
+    if CHECK_ALPHABET[value % 37] != text[-1]:
+        return None
+    return value
+
+
+def normalize(code: str, prefix: str) -> Optional[str]:
+    """
+    Forma canónica de un código introducido por una persona, o None si no
+    puede ser válido. Acepta también el formato antiguo (`TKT-` + 8 hex).
+    """
+    code = code.strip().upper()
+    if not code.startswith(prefix):
+        return None
+    body = code[len(prefix):]
+    if _LEGACY.match(body):
+        return code
+    value = decode(body)
+    return None if value is None else prefix + encode(value)
+
+
+# ============================================================================
+# API
+# ============================================================================
+def order_number() -> str:
+    return ORDER_PREFIX + encode(_generator.next_values(1)[0])
+
+
+def ticket_codes(count: int) -> List[str]:
+    return [TICKET_PREFIX + encode(value) for value in _generator.next_values(count)]
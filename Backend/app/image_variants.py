@@ -0,0 +1,191 @@
+"""
+Variantes redimensionadas de las imágenes de producto.
+
+Tras crear o actualizar un producto con una imagen subida, el endpoint solo
+encola el trabajo; un pool de procesos genera versiones WebP y JPEG de cada
+tamaño (thumbnail, card, full) y al terminar se guardan en
+`Product.thumbnail_url` y `Product.gallery_urls`.
+
+Las variantes se guardan en el mismo almacenamiento que el original
+(app/storage.py) con clave `<sha256>_<variante>.<ext>`, así que se sirven
+con caché inmutable y regenerar una variante existente no hace nada.
+"""
+import logging
+import os
+import tempfile
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from threading import Lock
+from typing import List, Optional
+
+from .config import settings
+from .database import SessionLocal
+from .storage import Storage, get_storage
+from . import models
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow es opcional: sin él no se generan variantes
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# (nombre, lado mayor en píxeles)
+VARIANTS = (("thumbnail", 160), ("card", 480), ("full", 1200))
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+_executor: Optional[ProcessPoolExecutor] = None
+# Escrituras en la BD de los resultados: fuera del hilo de gestión del pool
+_recorder: Optional[ThreadPoolExecutor] = None
+_executor_lock = Lock()
+
+
+# ============================================================================
+# TRABAJO EN EL PROCESO HIJO
+# ============================================================================
+def render_variants(source_key: str, digest: str, store: Optional[Storage] = None) -> List[dict]:
+    """
+    Genera todas las variantes de una imagen. Se ejecuta en el pool de
+    procesos, por lo que solo recibe y devuelve tipos serializables; el
+    almacenamiento se obtiene de la configuración en el propio proceso.
+    """
+    store = store or get_storage()
+    results = []
+    with store.fetch(source_key) as source_path, Image.open(source_path) as original, \
+            tempfile.TemporaryDirectory() as work_dir:
+        original.load()
+        # GIF animados y paletas: se usa el primer frame en RGB(A)
+        has_alpha = original.mode in ("RGBA", "LA") or "transparency" in original.info
+        base = original.convert("RGBA" if has_alpha else "RGB")
+
+        for name, max_side in VARIANTS:
+            image = base.copy()
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+            webp_name = f"{digest}_{name}.webp"
+            if not store.exists(webp_name):
+                _render(store, work_dir, webp_name, "image/webp", image, "WEBP",
+                        quality=WEBP_QUALITY, method=4)
+
+            jpeg_name = f"{digest}_{name}.jpg"
+            if not store.exists(jpeg_name):
+                _render(store, work_dir, jpeg_name, "image/jpeg", image.convert("RGB"), "JPEG",
+                        quality=JPEG_QUALITY, optimize=True, progressive=True)
+
+            results.append({
+                "variant": name,
+                "width": image.width,
+                "height": image.height,
+                "webp": webp_name,
+                "jpeg": jpeg_name,
+            })
+    return results
+
+
+def _render(store: Storage, work_dir: str, key: str, content_type: str, image, fmt: str, **options):
+    path = os.path.join(work_dir, key)
+    image.save(path, fmt, **options)
+    store.put_file(key, path, content_type)
+
+
+# ============================================================================
+# COLA
+# ============================================================================
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor, _recorder
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=settings.IMAGE_WORKERS or None)
+            _recorder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-variants-db")
+        return _executor
+
+
+def shutdown():
+    """
+    Detiene el pool de procesos (al cerrar la aplicación). Los resultados sin
+    guardar se pierden: `enqueue_missing_variants` los regenera al arrancar.
+    """
+    global _executor, _recorder
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _recorder.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+            _recorder = None
+
+
+def enqueue_product_variants(product_id: int, image_url: Optional[str]) -> bool:
+    """
+    Encola la generación de variantes para la imagen de un producto.
+    Devuelve False si la imagen no es una subida propia o falta Pillow.
+    """
+    if Image is None:
+        return False
+    # Solo se procesan imágenes subidas por la API (clave = sha256)
+    key = get_storage().key_from_url(image_url)
+    if key is None or "_" in key:
+        return False
+
+    digest = key.split(".", 1)[0]
+    executor = _get_executor()
+    recorder = _recorder
+    future = executor.submit(render_variants, key, digest)
+    future.add_done_callback(lambda f: _hand_off(recorder, product_id, image_url, f))
+    return True
+
+
+def _hand_off(recorder: ThreadPoolExecutor, product_id: int, image_url: str, future: Future):
+    """
+    Callback del future: corre en el hilo de gestión del ProcessPoolExecutor,
+    que también reparte el trabajo y recoge los resultados de los procesos.
+    No debe esperar a la BD, así que solo pasa el resultado a `recorder`.
+    """
+    try:
+        recorder.submit(_record_variants, product_id, image_url, future)
+    except RuntimeError:  # apagado en curso
+        pass
+
+
+def _record_variants(product_id: int, image_url: str, future: Future):
+    """Guarda las URLs de las variantes en el producto (hilo de `_recorder`)."""
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        logger.error("Error generando variantes", exc_info=error,
+                     extra={"product_id": product_id, "image_url": image_url})
+        return
+
+    base_url = image_url.rsplit("/", 1)[0]
+    gallery = [
+        {**v, "webp": f"{base_url}/{v['webp']}", "jpeg": f"{base_url}/{v['jpeg']}"}
+        for v in future.result()
+    ]
+
+    db = SessionLocal()
+    try:
+        product = db.query(models.Product).filter(models.Product.id == product_id).first()
+        # La imagen pudo cambiar mientras se procesaba
+        if product is None or product.image_url != image_url:
+            return
+        product.thumbnail_url = gallery[0]["webp"]
+        product.gallery_urls = gallery
+        db.commit()
+        logger.info("Variantes de imagen generadas", extra={"product_id": product_id})
+    finally:
+        db.close()
+
+
+def enqueue_missing_variants() -> int:
+    """Encola los productos con imagen subida que aún no tienen variantes."""
+    if Image is None:
+        return 0
+    db = SessionLocal()
+    try:
+        pending = db.query(models.Product.id, models.Product.image_url).filter(
+            models.Product.thumbnail_url.is_(None),
+            models.Product.image_url.isnot(None)
+        ).all()
+    finally:
+        db.close()
+    return sum(1 for product_id, image_url in pending if enqueue_product_variants(product_id, image_url))
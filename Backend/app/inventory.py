@@ -0,0 +1,322 @@
+"""
+Reservas temporales de stock (holds) para los carritos.
+
+`Product.stock` sigue siendo el stock sin vender; las reservas activas se
+acumulan por producto en `product_inventory.held`, de modo que:
+
+    disponible = Product.stock - held
+
+- Reservar bloquea el contador del producto y comprueba el disponible (un
+  UPDATE guardado por producto, sin sumar filas de `inventory_holds`).
+- Al crear el pedido se consumen las reservas del comprador: su cantidad
+  reservada cuenta como disponible para él y deja de estar retenida.
+- Un hilo barredor libera por lotes las reservas caducadas.
+- `index` mantiene en memoria la cantidad reservada por producto para las
+  lecturas de disponibilidad; se actualiza al confirmar cada transacción y
+  se resincroniza con la BD en cada pasada del barredor (otros procesos).
+
+Orden de bloqueo (evita interbloqueos): contadores de producto por id y
+después filas de reservas.
+"""
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .database import SessionLocal
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# Reservas caducadas liberadas por pasada del barredor
+SWEEP_BATCH_SIZE = 1000
+
+
+# ============================================================================
+# ÍNDICE EN MEMORIA
+# ============================================================================
+class HoldIndex:
+    """Cantidad reservada por producto, para leer disponibilidad sin ir a la BD."""
+
+    def __init__(self):
+        self._held: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def held(self, product_id: int) -> int:
+        return self._held.get(product_id, 0)
+
+    def apply(self, deltas: Dict[int, int]):
+        with self._lock:
+            for product_id, delta in deltas.items():
+                self._held[product_id] = max(self._held.get(product_id, 0) + delta, 0)
+
+    def replace(self, snapshot: Dict[int, int]):
+        with self._lock:
+            self._held = dict(snapshot)
+
+
+index = HoldIndex()
+
+
+def _pending_deltas(db: Session) -> Dict[int, int]:
+    return db.info.setdefault("hold_deltas", defaultdict(int))
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _publish_deltas(db: Session):
+    deltas = db.info.pop("hold_deltas", None)
+    if deltas:
+        index.apply(deltas)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_deltas(db: Session):
+    db.info.pop("hold_deltas", None)
+
+
+# ============================================================================
+# CONTADORES Y RESERVAS
+# ============================================================================
+def lock_counters(db: Session, product_ids: Iterable[int]) -> Dict[int, models.ProductInventory]:
+    """Bloquea (creándolos si faltan) los contadores de los productos, por orden de id."""
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return {}
+    counters = {
+        c.product_id: c for c in db.query(models.ProductInventory).filter(
+            models.ProductInventory.product_id.in_(product_ids)
+        ).order_by(models.ProductInventory.product_id).with_for_update().all()
+    }
+    for product_id in product_ids:
+        if product_id in counters:
+            continue
+        try:
+            with db.begin_nested():
+                db.add(models.ProductInventory(product_id=product_id, held=0))
+        except IntegrityError:
+            pass  # lo ha creado otra petición a la vez
+        counters[product_id] = db.query(models.ProductInventory).filter(
+            models.ProductInventory.product_id == product_id
+        ).with_for_update().one()
+    return counters
+
+
+def _adjust(db: Session, counter: models.ProductInventory, delta: int):
+    counter.held = max(counter.held + delta, 0)
+    _pending_deltas(db)[counter.product_id] += delta
+
+
+def _release_expired(db: Session, counters: Dict[int, models.ProductInventory], now: datetime) -> int:
+    """Libera las reservas caducadas de los productos cuyos contadores ya están bloqueados."""
+    expired = db.query(models.InventoryHold).filter(
+        models.InventoryHold.product_id.in_(list(counters)),
+        models.InventoryHold.expires_at <= now
+    ).with_for_update().all()
+    for hold in expired:
+        _adjust(db, counters[hold.product_id], -hold.quantity)
+        db.delete(hold)
+    return len(expired)
+
+
+def set_hold(db: Session, user_id: int, product_id: int, quantity: int) -> Optional[models.InventoryHold]:
+    """
+    Fija la cantidad reservada por el usuario para un producto y renueva su
+    caducidad. Con `quantity=0` libera la reserva. Lanza 409 si no hay stock.
+    """
+    if quantity < 0 or quantity > settings.HOLD_MAX_QUANTITY:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Solo se pueden reservar entre 0 y {settings.HOLD_MAX_QUANTITY} unidades"
+        )
+    product = db.query(models.Product).filter(models.Product.id == product_id).first()
+    if product is None or (quantity > 0 and not product.is_active):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Producto no encontrado")
+
+    now = datetime.utcnow()
+    counter = lock_counters(db, [product_id])[product_id]
+    _release_expired(db, {product_id: counter}, now)
+
+    hold = db.query(models.InventoryHold).filter(
+        models.InventoryHold.user_id == user_id,
+        models.InventoryHold.product_id == product_id
+    ).with_for_update().first()
+    current = hold.quantity if hold else 0
+    delta = quantity - current
+
+    if delta > 0 and product.stock - counter.held < delta:
+        available = max(product.stock - counter.held + current, 0)
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Solo quedan {available} unidades disponibles de {product.name}"
+        )
+
+    _adjust(db, counter, delta)
+    if quantity == 0:
+        if hold:
+            db.delete(hold)
+        hold = None
+    elif hold:
+        hold.quantity = quantity
+        hold.expires_at = now + timedelta(seconds=settings.HOLD_TTL_SECONDS)
+    else:
+        hold = models.InventoryHold(
+            user_id=user_id,
+            product_id=product_id,
+            quantity=quantity,
+            expires_at=now + timedelta(seconds=settings.HOLD_TTL_SECONDS),
+        )
+        db.add(hold)
+
+    db.commit()
+    if hold is not None:
+        db.refresh(hold)
+    return hold
+
+
+def get_user_holds(db: Session, user_id: int) -> List[models.InventoryHold]:
+    return db.query(models.InventoryHold).filter(
+        models.InventoryHold.user_id == user_id,
+        models.InventoryHold.expires_at > datetime.utcnow()
+    ).order_by(models.InventoryHold.product_id).all()
+
+
+def release_user_holds(db: Session, user_id: int) -> int:
+    """Libera todas las reservas del usuario (vaciar carrito)."""
+    product_ids = [pid for (pid,) in db.query(models.InventoryHold.product_id).filter(
+        models.InventoryHold.user_id == user_id
+    )]
+    if not product_ids:
+        return 0
+    counters = lock_counters(db, product_ids)
+    holds = db.query(models.InventoryHold).filter(
+        models.InventoryHold.user_id == user_id
+    ).with_for_update().all()
+    for hold in holds:
+        _adjust(db, counters[hold.product_id], -hold.quantity)
+        db.delete(hold)
+    db.commit()
+    return len(holds)
+
+
+def claim_for_order(db: Session, user_ids: Iterable[int],
+                    product_ids: Iterable[int]) -> Tuple[Dict[int, models.ProductInventory], Dict[Tuple[int, int], models.InventoryHold]]:
+    """
+    Para crear pedidos: bloquea los contadores de los productos y devuelve
+    también las reservas vigentes de los compradores, por (user_id, product_id).
+    Las caducadas se liberan aquí mismo. No hace commit.
+    """
+    now = datetime.utcnow()
+    counters = lock_counters(db, product_ids)
+    if not counters:
+        return counters, {}
+    _release_expired(db, counters, now)
+    holds = db.query(models.InventoryHold).filter(
+        models.InventoryHold.user_id.in_(list(set(user_ids))),
+        models.InventoryHold.product_id.in_(list(counters))
+    ).with_for_update().all()
+    return counters, {(h.user_id, h.product_id): h for h in holds}
+
+
+def available_for(product: models.Product, counters: Dict[int, models.ProductInventory],
+                  own_hold: Optional[models.InventoryHold]) -> int:
+    """Stock que puede comprar un usuario: lo libre más lo que él mismo tiene reservado."""
+    counter = counters.get(product.id)
+    held = counter.held if counter else 0
+    own = own_hold.quantity if own_hold else 0
+    return product.stock - held + own
+
+
+def consume_hold(db: Session, counters: Dict[int, models.ProductInventory], hold: Optional[models.InventoryHold]):
+    """La reserva se convierte en compra: deja de retener stock. No hace commit."""
+    if hold is None:
+        return
+    _adjust(db, counters[hold.product_id], -hold.quantity)
+    db.delete(hold)
+
+
+def availability(db: Session, product_ids: List[int]) -> List[dict]:
+    """Disponibilidad de varios productos: stock de la BD menos el índice en memoria."""
+    rows = db.query(models.Product.id, models.Product.stock).filter(
+        models.Product.id.in_(product_ids)
+    ).all()
+    result = []
+    for product_id, stock in rows:
+        held = index.held(product_id)
+        result.append({
+            "product_id": product_id,
+            "stock": stock,
+            "held": held,
+            "available": max(stock - held, 0),
+        })
+    return result
+
+
+# ============================================================================
+# BARREDOR
+# ============================================================================
+def sweep_expired() -> int:
+    """Libera por lotes las reservas caducadas y resincroniza el índice."""
+    db = SessionLocal()
+    released = 0
+    try:
+        now = datetime.utcnow()
+        product_ids = [pid for (pid,) in db.query(models.InventoryHold.product_id).filter(
+            models.InventoryHold.expires_at <= now
+        ).distinct().limit(SWEEP_BATCH_SIZE)]
+        if product_ids:
+            counters = lock_counters(db, product_ids)
+            released = _release_expired(db, counters, now)
+            db.commit()
+        else:
+            db.rollback()
+
+        index.replace({
+            product_id: held for product_id, held in db.query(
+                models.ProductInventory.product_id, models.ProductInventory.held
+            ).filter(models.ProductInventory.held > 0)
+        })
+        db.rollback()
+        return released
+    finally:
+        db.close()
+
+
+_sweeper: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+
+def _sweep_loop():
+    while not _stop.wait(settings.HOLD_SWEEP_SECONDS):
+        try:
+            released = sweep_expired()
+            if released:
+                logger.info("Reservas de stock caducadas liberadas", extra={"released": released})
+        except Exception:
+            logger.exception("Error liberando reservas de stock caducadas")
+
+
+def start_sweeper():
+    """Carga el índice y arranca el barredor (lifespan)."""
+    global _sweeper
+    if _sweeper is not None:
+        return
+    sweep_expired()
+    _stop.clear()
+    _sweeper = threading.Thread(target=_sweep_loop, name="hold-sweeper", daemon=True)
+    _sweeper.start()
+
+
+def stop_sweeper():
+    global _sweeper
+    _stop.set()
+    if _sweeper is not None:
+        _sweeper.join(timeout=5)
+        _sweeper = None
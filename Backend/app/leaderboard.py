@@ -0,0 +1,198 @@
+"""
+Leaderboards por ventana: diario, semanal y por evento.
+
+- Rollup: `leaderboard_entries` guarda la mejor puntuación de cada usuario
+  por (ventana, clave, juego). Se actualiza al registrar cada puntuación con
+  un UPDATE condicionado (`points < nuevos`), así que consultar una ventana
+  es leer las primeras filas de un índice, sin recorrer `scores`.
+- Claves: la ventana sale de la fecha de la partida ("2026-10-19",
+  "2026-W42") o del evento ("7"). Cambiar de día o de semana no requiere
+  ninguna tarea: las puntuaciones nuevas caen en una clave nueva y las
+  anteriores quedan como histórico consultable.
+- Top-K: cada proceso guarda en memoria las LEADERBOARD_TOP_K primeras
+  posiciones de las ventanas consultadas. Las puntuaciones de este proceso
+  se aplican al momento; las de otros procesos llegan al caducar la entrada
+  (LEADERBOARD_CACHE_TTL_SECONDS).
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .config import settings
+from . import models
+
+WINDOWS = ("daily", "weekly", "event")
+
+# Ventanas distintas que se recuerdan en memoria (las antiguas salen solas)
+MAX_CACHED_WINDOWS = 256
+
+
+# ============================================================================
+# CLAVES DE VENTANA
+# ============================================================================
+def window_key(window_type: str, when: Optional[datetime] = None, event_id: Optional[int] = None) -> str:
+    """Clave de la ventana que contiene `when` (UTC) o del evento indicado."""
+    if window_type == "event":
+        return str(event_id)
+    day = ((when or datetime.utcnow()) - timedelta(hours=settings.LEADERBOARD_DAY_START_HOUR)).date()
+    if window_type == "daily":
+        return day.isoformat()
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def windows_for(played_at: datetime, event_id: Optional[int]) -> List[Tuple[str, str]]:
+    """Ventanas en las que cuenta una partida."""
+    windows = [("daily", window_key("daily", played_at)), ("weekly", window_key("weekly", played_at))]
+    if event_id is not None:
+        windows.append(("event", window_key("event", event_id=event_id)))
+    return windows
+
+
+# ============================================================================
+# ROLLUP
+# ============================================================================
+def _raise_best(db: Session, window_type: str, key: str, game_type: str, user_id: int,
+                points: int, now: datetime) -> bool:
+    """Sube la mejor puntuación de la ventana si `points` la supera. True si cambia."""
+    for _ in range(2):
+        updated = db.query(models.LeaderboardEntry).filter(
+            models.LeaderboardEntry.window_type == window_type,
+            models.LeaderboardEntry.window_key == key,
+            models.LeaderboardEntry.game_type == game_type,
+            models.LeaderboardEntry.user_id == user_id,
+            models.LeaderboardEntry.points < points
+        ).update(
+            {models.LeaderboardEntry.points: points, models.LeaderboardEntry.updated_at: now},
+            synchronize_session=False
+        )
+        if updated:
+            return True
+
+        # O ya tiene una puntuación mejor en la ventana, o es su primera partida en ella
+        if db.get(models.LeaderboardEntry, (window_type, key, game_type, user_id)) is not None:
+            return False
+        try:
+            with db.begin_nested():
+                db.add(models.LeaderboardEntry(
+                    window_type=window_type, window_key=key, game_type=game_type,
+                    user_id=user_id, points=points, updated_at=now
+                ))
+            return True
+        except IntegrityError:
+            continue  # otra partida simultánea la ha creado: reintentar el UPDATE
+    return False
+
+
+def record(db: Session, user_id: int, game_type: str, points: int, played_at: datetime,
+           event_id: Optional[int] = None) -> List[Tuple[str, str]]:
+    """
+    Aplica una partida a sus ventanas. Devuelve las ventanas en las que ha
+    mejorado la marca del usuario (para `offer` tras el commit). No hace commit.
+    """
+    improved = []
+    for window_type, key in windows_for(played_at, event_id):
+        if _raise_best(db, window_type, key, game_type, user_id, points, played_at):
+            improved.append((window_type, key))
+    return improved
+
+
+# ============================================================================
+# TOP-K EN MEMORIA
+# ============================================================================
+# Fila: (points, updated_at, user_id, game_type); orden: más puntos y, a
+# igualdad, quien llegó antes.
+Row = Tuple[int, datetime, int, str]
+
+
+def _order(row: Row):
+    return (-row[0], row[1], row[2])
+
+
+class TopKCache:
+    """Primeras posiciones por (ventana, clave, juego), seguro entre hilos."""
+
+    def __init__(self, k: int, ttl: float):
+        self.k = k
+        self.ttl = ttl
+        self._data: "OrderedDict[tuple, Tuple[float, List[Row]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cache_key: tuple) -> Optional[List[Row]]:
+        with self._lock:
+            entry = self._data.get(cache_key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            self._data.move_to_end(cache_key)
+            return entry[1]
+
+    def set(self, cache_key: tuple, rows: List[Row]):
+        with self._lock:
+            self._data[cache_key] = (time.monotonic() + self.ttl, rows[:self.k])
+            self._data.move_to_end(cache_key)
+            while len(self._data) > MAX_CACHED_WINDOWS:
+                self._data.popitem(last=False)
+
+    def offer(self, cache_key: tuple, row: Row):
+        """Aplica una marca nueva a la ventana si está en memoria."""
+        with self._lock:
+            entry = self._data.get(cache_key)
+            if entry is None:
+                return
+            expires, rows = entry
+            same = lambda r: r[2] == row[2] and r[3] == row[3]
+            if any(same(r) and r[0] >= row[0] for r in rows):
+                return
+            rows = sorted([r for r in rows if not same(r)] + [row], key=_order)
+            self._data[cache_key] = (expires, rows[:self.k])
+
+    def invalidate(self):
+        with self._lock:
+            self._data.clear()
+
+
+top_cache = TopKCache(settings.LEADERBOARD_TOP_K, settings.LEADERBOARD_CACHE_TTL_SECONDS)
+
+
+def offer(improved: List[Tuple[str, str]], user_id: int, game_type: str, points: int, played_at: datetime):
+    """Lleva a la caché las marcas que `record` ha mejorado (una vez confirmadas)."""
+    row = (points, played_at, user_id, game_type)
+    for window_type, key in improved:
+        top_cache.offer((window_type, key, game_type), row)
+        top_cache.offer((window_type, key, None), row)
+
+
+def top(db: Session, window_type: str, key: str, game_type: Optional[str], limit: int) -> List[Row]:
+    """Primeras `limit` posiciones de la ventana (todas las partidas si no hay `game_type`)."""
+    cache_key = (window_type, key, game_type)
+    rows = top_cache.get(cache_key)
+    if rows is None or (len(rows) < limit and len(rows) == top_cache.k):
+        query = db.query(
+            models.LeaderboardEntry.points, models.LeaderboardEntry.updated_at,
+            models.LeaderboardEntry.user_id, models.LeaderboardEntry.game_type
+        ).filter(
+            models.LeaderboardEntry.window_type == window_type,
+            models.LeaderboardEntry.window_key == key
+        )
+        if game_type:
+            query = query.filter(models.LeaderboardEntry.game_type == game_type)
+        rows = [tuple(r) for r in query.order_by(
+            models.LeaderboardEntry.points.desc(),
+            models.LeaderboardEntry.updated_at,
+            models.LeaderboardEntry.user_id
+        ).limit(max(limit, top_cache.k))]
+        top_cache.set(cache_key, rows)
+    return rows[:limit]
+
+
+def players(db: Session, rows: List[Row]) -> Dict[int, models.User]:
+    """Usuarios de las filas, con una sola consulta por clave primaria."""
+    user_ids = {row[2] for row in rows}
+    if not user_ids:
+        return {}
+    return {u.id: u for u in db.query(models.User).filter(models.User.id.in_(user_ids))}
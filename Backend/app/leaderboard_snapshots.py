@@ -0,0 +1,213 @@
+"""
+Snapshots estáticos del leaderboard público.
+
+El leaderboard es el mismo para todos los visitantes anónimos, así que en
+lugar de consultarlo en cada visita un hilo lo publica como JSON en
+`static/leaderboard/<game_type>.json` (y `all.json` sin filtro), con sus
+hermanos `.br`/`.gz`, cada LEADERBOARD_SNAPSHOT_SECONDS o poco después de
+registrarse una puntuación en este proceso. `leaderboard.js` los descarga
+como estáticos (Cache-Control corto, ETag) y `GET /games/leaderboard` los usa
+mientras estén frescos.
+
+- Cada snapshot guarda las LEADERBOARD_SNAPSHOT_SIZE primeras posiciones, con
+  el mismo formato que `GET /games/leaderboard`.
+- Un fichero solo se reescribe si su contenido cambia, así el ETag se
+  mantiene y los navegadores reciben 304. Por eso la frescura no se mide con
+  la fecha de cada snapshot sino con un latido (`.publisher.heartbeat`) que
+  el publicador toca al terminar cada publicación.
+- Con varios workers publica solo uno (bloqueo flock sobre un fichero);
+  los demás leen los snapshots del disco.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+from sqlalchemy.orm import joinedload
+
+from .compression import precompress_file
+from .config import settings
+from .database import SessionLocal
+from . import models, schemas
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos (un solo proceso)
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), "static", "leaderboard")
+# Prefijo bajo /static y caché de los snapshots en el navegador/CDN
+STATIC_PREFIX = "leaderboard/"
+CACHE_CONTROL = f"public, max-age={max(int(settings.LEADERBOARD_SNAPSHOT_SECONDS), 1)}"
+ALL = "all"
+HEARTBEAT = os.path.join(SNAPSHOT_DIR, ".publisher.heartbeat")
+# Espera mínima entre publicaciones para agrupar ráfagas de puntuaciones
+DEBOUNCE_SECONDS = 1.0
+
+_changed = threading.Event()
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+_lock_file = None
+
+# Último contenido publicado o leído por clave: (mtime, hash, filas)
+_snapshots: Dict[str, Tuple[float, str, List[dict]]] = {}
+_snapshots_lock = threading.Lock()
+
+
+def _path(key: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"{key}.json")
+
+
+# ============================================================================
+# PUBLICACIÓN
+# ============================================================================
+def _top(db, game_type: Optional[str]) -> List[dict]:
+    query = db.query(models.Score).options(joinedload(models.Score.player))
+    if game_type:
+        query = query.filter(models.Score.game_type == game_type)
+    scores = query.order_by(models.Score.points.desc(), models.Score.id).limit(
+        settings.LEADERBOARD_SNAPSHOT_SIZE
+    ).all()
+    return [schemas.ScoreWithUser.model_validate(s).model_dump(mode="json") for s in scores]
+
+
+def _write(key: str, rows: List[dict]) -> bool:
+    """Escribe el snapshot si ha cambiado. True si se ha reescrito."""
+    body = orjson.dumps(rows)
+    digest = hashlib.sha256(body).hexdigest()
+    current = _snapshots.get(key)
+    if current is not None and current[1] == digest and os.path.exists(_path(key)):
+        return False
+    path = _path(key)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(body)
+    os.replace(tmp, path)
+    precompress_file(path, minimum_size=0)
+    with _snapshots_lock:
+        _snapshots[key] = (os.stat(path).st_mtime, digest, rows)
+    return True
+
+
+def _beat():
+    """Marca que el publicador sigue vivo (aunque no haya reescrito nada)."""
+    with open(HEARTBEAT, "a"):
+        pass
+    os.utime(HEARTBEAT, None)
+
+
+def publish() -> int:
+    """
+    Regenera los snapshots de todos los juegos y renueva el latido. Devuelve
+    los reescritos.
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    db = SessionLocal()
+    try:
+        game_types = sorted(g for (g,) in db.query(models.Score.game_type).distinct() if g)
+        written = _write(ALL, _top(db, None))
+        for game_type in game_types:
+            written += _write(game_type, _top(db, game_type))
+    finally:
+        db.close()
+    _beat()
+    return written
+
+
+def notify():
+    """Avisa de que hay puntuaciones nuevas (se publica en breve)."""
+    _changed.set()
+
+
+# ============================================================================
+# LECTURA
+# ============================================================================
+def get(game_type: Optional[str]) -> Optional[List[dict]]:
+    """
+    Filas del snapshot si el publicador ha terminado una publicación hace
+    menos de dos intervalos, o None. En los workers que no publican se lee
+    del disco cuando cambia.
+    """
+    if not settings.LEADERBOARD_SNAPSHOT_ENABLED:
+        return None
+    key = game_type or ALL
+    try:
+        beat = os.stat(HEARTBEAT).st_mtime
+        mtime = os.stat(_path(key)).st_mtime
+    except OSError:
+        return None
+    if time.time() - beat > 2 * settings.LEADERBOARD_SNAPSHOT_SECONDS:
+        return None  # el publicador no está funcionando
+    current = _snapshots.get(key)
+    if current is None or current[0] != mtime:
+        try:
+            with open(_path(key), "rb") as f:
+                body = f.read()
+            rows = orjson.loads(body)
+        except (OSError, orjson.JSONDecodeError):
+            return None
+        current = (mtime, hashlib.sha256(body).hexdigest(), rows)
+        with _snapshots_lock:
+            _snapshots[key] = current
+    return current[2]
+
+
+# ============================================================================
+# HILO PUBLICADOR
+# ============================================================================
+def _acquire_publisher() -> bool:
+    """Solo un proceso publica: el que consigue el bloqueo."""
+    global _lock_file
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    _lock_file = open(os.path.join(SNAPSHOT_DIR, ".publisher.lock"), "a")
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(_lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        _lock_file.close()
+        _lock_file = None
+        return False
+
+
+def _publish_loop():
+    while not _stop.is_set():
+        try:
+            publish()
+        except Exception:
+            logger.exception("Error publicando los snapshots del leaderboard")
+        _changed.wait(settings.LEADERBOARD_SNAPSHOT_SECONDS)
+        _changed.clear()
+        _stop.wait(DEBOUNCE_SECONDS)
+
+
+def start():
+    """Arranca el publicador (lifespan) si este proceso consigue el bloqueo."""
+    global _thread
+    if not settings.LEADERBOARD_SNAPSHOT_ENABLED or _thread is not None:
+        return
+    if not _acquire_publisher():
+        logger.info("Snapshots del leaderboard publicados por otro proceso")
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_publish_loop, name="leaderboard-snapshots", daemon=True)
+    _thread.start()
+
+
+def stop(timeout: float = 5):
+    global _thread, _lock_file
+    if _thread is None:
+        return
+    _stop.set()
+    _changed.set()
+    _thread.join(timeout)
+    _thread = None
+    if _lock_file is not None:
+        _lock_file.close()
+        _lock_file = None
@@ -1,7 +1,6 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 from sqlalchemy.exc import SQLAlchemyError
 from slowapi import Limiter, _rate_limit_exceeded_handler
@@ -9,7 +8,14 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 from .database import engine, Base, SessionLocal
-from .routers import user, products, games, orders, upload
+from .routers import user, products, games, orders, upload, profiling, holds, exports, events
+from . import metrics, migrations, image_variants, idempotency, order_queue, inventory, bulk_orders, score_buffer, leaderboard_snapshots, google_jwks, identifiers
+from .responses import ORJSONResponse
+from .compression import CompressionMiddleware, PrecompressedStaticFiles
+from .logging_config import setup_logging, shutdown_logging, RequestIdMiddleware
+import asyncio
+import hmac
+import logging
 import os
 
 # ... (Previous code) ... (It's better to just do the import change and the include change)
@@ -19,6 +25,13 @@ import os
 # Let's target the imports first
 
 
+# ============================================================================
+# LOGGING
+# ============================================================================
+# Logging JSON asíncrono (ver app/logging_config.py); se configura al importar
+# para que también los mensajes del arranque salgan estructurados.
+setup_logging()
+logger = logging.getLogger(__name__)
 
 # ============================================================================
 # LIFESPAN - STARTUP/SHUTDOWN EVENTS
@@ -31,21 +44,59 @@ async def lifespan(app: FastAPI):
     - Shutdown: Limpieza si es necesaria
     """
     # --- STARTUP ---
-    print("🚀 Iniciando La Previa Maldita API...")
+    setup_logging()
+    logger.info("🚀 Iniciando La Previa Maldita API...")
     
     # Crear todas las tablas en la base de datos
     Base.metadata.create_all(bind=engine)
-    print("✅ Tablas de base de datos verificadas/creadas")
+    logger.info("✅ Tablas de base de datos verificadas/creadas")
+
+    # Índices y restricciones que create_all no añade a tablas existentes
+    migrations.upgrade_schema(engine)
     
     # Seed inicial de datos
     seed_database()
+
+    # Miniaturas pendientes de imágenes subidas antes de activar las variantes
+    image_variants.enqueue_missing_variants()
+
+    # Limpieza periódica de Idempotency-Keys caducadas
+    purge_task = asyncio.create_task(idempotency.purge_periodically())
+
+    # Identificador de proceso para números de pedido y códigos de ticket
+    identifiers.start()
+
+    # Workers del checkout en cola (solo con ORDER_QUEUE_ENABLED)
+    order_queue.start()
+
+    # Índice de reservas de stock y barredor de reservas caducadas
+    inventory.start_sweeper()
+
+    # Búfer de puntuaciones (solo con SCORE_BUFFER_ENABLED): recupera logs pendientes
+    score_buffer.start()
+
+    # Snapshots estáticos del leaderboard (un solo proceso los publica)
+    leaderboard_snapshots.start()
+
+    # Claves públicas de Google para verificar los logins en local
+    google_jwks.start()
     
-    print("🎃 API lista para recibir solicitudes!")
+    logger.info("🎃 API lista para recibir solicitudes!")
     
     yield  # La aplicación se ejecuta aquí
     
     # --- SHUTDOWN ---
-    print("👋 Cerrando La Previa Maldita API...")
+    logger.info("👋 Cerrando La Previa Maldita API...")
+    purge_task.cancel()
+    order_queue.stop()
+    score_buffer.stop()
+    leaderboard_snapshots.stop()
+    google_jwks.stop()
+    identifiers.stop()
+    inventory.stop_sweeper()
+    image_variants.shutdown()
+    bulk_orders.shutdown()
+    shutdown_logging()
 
 
 # ============================================================================
@@ -106,6 +157,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ============================================================================
+# COMPRESSION MIDDLEWARE
+# ============================================================================
+# Brotli/GZip para JSON y texto por encima de COMPRESSION_MIN_SIZE.
+# Los estáticos precomprimidos ya llevan Content-Encoding y no se recomprimen.
+app.add_middleware(CompressionMiddleware)
+
+# ============================================================================
+# PROFILING MIDDLEWARE (OPCIONAL)
+# ============================================================================
+# Solo se registra si PROFILING_ENABLED=True; desactivado no tiene coste.
+if settings.PROFILING_ENABLED:
+    from .profiling import ProfilingMiddleware
+    app.add_middleware(ProfilingMiddleware)
+
+# ============================================================================
+# METRICS MIDDLEWARE
+# ============================================================================
+# Se añade después del resto para quedar como el middleware más externo
+# y medir también el tiempo de rate limiting y CORS.
+metrics.registry.register_collector(metrics.pool_collector(engine))
+app.add_middleware(metrics.MetricsMiddleware)
+
+# El request_id envuelve a todo lo demás para que cualquier log lo incluya
+app.add_middleware(RequestIdMiddleware)
+
 # Exception handler para asegurar que los errores también tengan headers CORS
 from fastapi.exceptions import HTTPException
 
@@ -119,7 +196,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
         headers["Access-Control-Allow-Origin"] = origin
         headers["Access-Control-Allow-Credentials"] = "true"
     
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={"detail": exc.detail},
         headers=headers
@@ -134,8 +211,8 @@ async def sqlalchemy_exception_handler(request: Request, exc: SQLAlchemyError):
         headers["Access-Control-Allow-Origin"] = origin
         headers["Access-Control-Allow-Credentials"] = "true"
         
-    print(f"Database error: {exc}") # Registro interno del error
-    return JSONResponse(
+    logger.error("Database error", exc_info=exc, extra={"path": request.url.path}) # Registro interno del error
+    return ORJSONResponse(
         status_code=500,
         content={"detail": "Error interno en la base de datos."},
         headers=headers
@@ -146,7 +223,10 @@ static_path = os.path.join(os.path.dirname(__file__), "static")
 if not os.path.exists(static_path):
     os.makedirs(static_path)
     
-app.mount("/static", StaticFiles(directory=static_path), name="static")
+app.mount("/static", PrecompressedStaticFiles(
+    directory=static_path,
+    cache_control={leaderboard_snapshots.STATIC_PREFIX: leaderboard_snapshots.CACHE_CONTROL},
+), name="static")
 
 
 # ============================================================================
@@ -156,7 +236,11 @@ app.include_router(user.router)
 app.include_router(products.router)
 app.include_router(games.router)
 app.include_router(orders.router)
+app.include_router(events.router)
+app.include_router(holds.router)
+app.include_router(exports.router)
 app.include_router(upload.router)
+app.include_router(profiling.router)
 
 
 # ============================================================================
@@ -184,6 +268,29 @@ def health_check():
     return {"status": "healthy", "message": "🎃 La Previa Maldita está viva!"}
 
 
+@app.get("/metrics", tags=["Health"], include_in_schema=False)
+def metrics_endpoint(request: Request):
+    """
+    Métricas en formato de texto de Prometheus. Solo con
+    `Authorization: Bearer <METRICS_TOKEN>`; sin token configurado no existe.
+    """
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, credentials = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(
+        credentials.strip().encode(), settings.METRICS_TOKEN.encode()
+    ):
+        raise HTTPException(
+            status_code=401,
+            detail="Token de métricas no válido",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return PlainTextResponse(
+        metrics.registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 # ============================================================================
 # DATABASE SEED
 # ============================================================================
@@ -199,10 +306,10 @@ def seed_database():
         # Verificar si ya hay productos
         existing_products = crud.get_products(db, limit=1)
         if existing_products:
-            print("📦 Base de datos ya contiene productos, saltando seed...")
+            logger.info("📦 Base de datos ya contiene productos, saltando seed...")
             return
         
-        print("🌱 Iniciando seed de base de datos...")
+        logger.info("🌱 Iniciando seed de base de datos...")
         
         # Productos iniciales
         initial_products = [
@@ -275,9 +382,9 @@ def seed_database():
         for product in initial_products:
             crud.create_product(db, product)
         
-        print(f"✅ Seed completado: {len(initial_products)} productos creados")
+        logger.info("✅ Seed completado", extra={"products_created": len(initial_products)})
         
     except Exception as e:
-        print(f"❌ Error durante el seed: {e}")
+        logger.exception("❌ Error durante el seed")
     finally:
         db.close()
\ No newline at end of file
@@ -0,0 +1,215 @@
+"""
+Métricas de la API en formato de texto de Prometheus.
+
+El middleware es ASGI puro (sin BaseHTTPMiddleware) y todas las escrituras
+ocurren en el hilo del event loop, por lo que no se necesitan locks: cada
+petición solo incrementa enteros en estructuras ya creadas.
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Buckets de latencia (segundos) y tamaño de respuesta (bytes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# Etiqueta para peticiones que no encajan con ninguna ruta (evita cardinalidad infinita)
+UNMATCHED_ROUTE = "unmatched"
+
+# Un colector devuelve muestras (nombre, tipo, ayuda, etiquetas, valor)
+Sample = Tuple[str, str, str, Dict[str, str], float]
+Collector = Callable[[], Iterable[Sample]]
+
+
+# ============================================================================
+# REGISTRO
+# ============================================================================
+class _RouteStats:
+    """Contadores de una combinación (método, ruta, estado)."""
+    __slots__ = ("count", "latency_buckets", "latency_sum", "size_buckets", "size_sum")
+
+    def __init__(self):
+        self.count = 0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.size_buckets = [0] * (len(SIZE_BUCKETS) + 1)
+        self.size_sum = 0
+
+
+class MetricsRegistry:
+    """
+    Almacena las métricas HTTP del proceso y los colectores externos
+    (pool de la BD, etc.) que se evalúan solo al renderizar /metrics.
+    """
+
+    def __init__(self):
+        self.routes: Dict[Tuple[str, str, int], _RouteStats] = {}
+        self.in_flight = 0
+        self.background_pending = 0
+        self.collectors: List[Collector] = []
+
+    def observe(self, method: str, route: str, status_code: int, duration: float, size: int):
+        key = (method, route, status_code)
+        stats = self.routes.get(key)
+        if stats is None:
+            stats = self.routes[key] = _RouteStats()
+        stats.count += 1
+        stats.latency_buckets[bisect_left(LATENCY_BUCKETS, duration)] += 1
+        stats.latency_sum += duration
+        stats.size_buckets[bisect_left(SIZE_BUCKETS, size)] += 1
+        stats.size_sum += size
+
+    def register_collector(self, collector: Collector):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        """Genera la exposición en formato de texto de Prometheus (v0.0.4)."""
+        lines: List[str] = []
+
+        lines.append("# HELP http_requests_total Total de peticiones HTTP atendidas.")
+        lines.append("# TYPE http_requests_total counter")
+        # Copia para no iterar un dict que el event loop podría ampliar
+        routes = list(self.routes.items())
+        for (method, route, code), stats in routes:
+            labels = _labels({"method": method, "route": route, "status": str(code)})
+            lines.append(f"http_requests_total{labels} {stats.count}")
+
+        lines.append("# HELP http_request_duration_seconds Latencia de las peticiones HTTP.")
+        lines.append("# TYPE http_request_duration_seconds histogram")
+        for (method, route, code), stats in routes:
+            base = {"method": method, "route": route, "status": str(code)}
+            _render_histogram(lines, "http_request_duration_seconds", base,
+                              LATENCY_BUCKETS, stats.latency_buckets, stats.latency_sum, stats.count)
+
+        lines.append("# HELP http_response_size_bytes Tamaño del cuerpo de las respuestas HTTP.")
+        lines.append("# TYPE http_response_size_bytes histogram")
+        for (method, route, code), stats in routes:
+            base = {"method": method, "route": route, "status": str(code)}
+            _render_histogram(lines, "http_response_size_bytes", base,
+                              SIZE_BUCKETS, stats.size_buckets, stats.size_sum, stats.count)
+
+        lines.append("# HELP http_requests_in_flight Peticiones HTTP en curso.")
+        lines.append("# TYPE http_requests_in_flight gauge")
+        lines.append(f"http_requests_in_flight {self.in_flight}")
+
+        lines.append("# HELP background_tasks_pending Respuestas enviadas cuyas BackgroundTasks siguen en ejecución.")
+        lines.append("# TYPE background_tasks_pending gauge")
+        lines.append(f"background_tasks_pending {self.background_pending}")
+
+        declared = set()
+        for collector in self.collectors:
+            for name, metric_type, help_text, labels, value in collector():
+                if name not in declared:
+                    declared.add(name)
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} {metric_type}")
+                lines.append(f"{name}{_labels(labels)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _render_histogram(lines, name, base_labels, bounds, buckets, total_sum, count):
+    cumulative = 0
+    for bound, bucket_count in zip(bounds, buckets):
+        cumulative += bucket_count
+        lines.append(f"{name}_bucket{_labels({**base_labels, 'le': str(bound)})} {cumulative}")
+    lines.append(f"{name}_bucket{_labels({**base_labels, 'le': '+Inf'})} {count}")
+    lines.append(f"{name}_sum{_labels(base_labels)} {total_sum}")
+    lines.append(f"{name}_count{_labels(base_labels)} {count}")
+
+
+# Registro global del proceso
+registry = MetricsRegistry()
+
+
+# ============================================================================
+# MIDDLEWARE
+# ============================================================================
+class MetricsMiddleware:
+    """
+    Registra latencia, tamaño y estado por plantilla de ruta (`/orders/{order_id}`),
+    no por URL concreta, para mantener acotada la cardinalidad.
+
+    La latencia se mide hasta el último fragmento del cuerpo; el tiempo que
+    pasa después (BackgroundTasks de Starlette) se refleja en
+    `background_tasks_pending`.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry = registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        reg = self.registry
+        reg.in_flight += 1
+        start = time.perf_counter()
+        status_code = 500
+        size = 0
+        response_done = False
+
+        async def send_wrapper(message):
+            nonlocal status_code, size, response_done
+            message_type = message["type"]
+            if message_type == "http.response.start":
+                status_code = message["status"]
+            elif message_type == "http.response.body":
+                size += len(message.get("body", b""))
+                if not message.get("more_body", False) and not response_done:
+                    response_done = True
+                    reg.in_flight -= 1
+                    reg.background_pending += 1
+                    reg.observe(scope["method"], _route_template(scope), status_code,
+                                time.perf_counter() - start, size)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if response_done:
+                reg.background_pending -= 1
+            else:
+                # Error o desconexión antes de completar la respuesta
+                reg.in_flight -= 1
+                reg.observe(scope["method"], _route_template(scope), status_code,
+                            time.perf_counter() - start, size)
+
+
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    return path or UNMATCHED_ROUTE
+
+
+# ============================================================================
+# COLECTORES
+# ============================================================================
+def pool_collector(engine) -> Collector:
+    """Estadísticas del pool de conexiones de SQLAlchemy (QueuePool)."""
+
+    def collect():
+        pool = engine.pool
+        for name, attr, help_text in (
+            ("db_pool_size", "size", "Tamaño configurado del pool de conexiones."),
+            ("db_pool_checked_out", "checkedout", "Conexiones actualmente en uso."),
+            ("db_pool_checked_in", "checkedin", "Conexiones libres en el pool."),
+            ("db_pool_overflow", "overflow", "Conexiones abiertas por encima del tamaño del pool."),
+        ):
+            fn = getattr(pool, attr, None)
+            if fn is not None:
+                yield name, "gauge", help_text, {}, fn()
+
+    return collect
@@ -0,0 +1,131 @@
+"""
+Ajustes de esquema que `Base.metadata.create_all` no hace en una BD ya creada.
+
+`create_all` solo crea las tablas que faltan: no añade índices ni
+restricciones a tablas existentes. Cada ajuste de este módulo comprueba
+primero si ya está aplicado, así que `upgrade_schema` se ejecuta en cada
+arranque (lifespan, después de `create_all`) y puede lanzarse a la vez
+desde varios workers.
+
+Si un ajuste no se puede aplicar, el arranque falla: es preferible a servir
+peticiones con un esquema en el que el código no funciona.
+
+    python -m app.migrations        # aplicar sin arrancar la API
+"""
+import logging
+from itertools import groupby
+from typing import List
+
+from sqlalchemy import Index, func, inspect, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+DELETE_BATCH = 1000
+# Reintentos si entran duplicados (procesos con la versión anterior) mientras se crea el índice
+INDEX_ATTEMPTS = 3
+
+
+# ============================================================================
+# SCORES: UNA FILA POR USUARIO Y JUEGO
+# ============================================================================
+def _has_unique(engine: Engine, table: str, columns: List[str]) -> bool:
+    """¿Hay una restricción o índice único exactamente sobre `columns`?"""
+    inspector = inspect(engine)
+    wanted = set(columns)
+    for constraint in inspector.get_unique_constraints(table):
+        if set(constraint["column_names"]) == wanted:
+            return True
+    for index in inspector.get_indexes(table):
+        if index.get("unique") and set(index["column_names"]) == wanted:
+            return True
+    return False
+
+
+def _dedupe_scores(conn) -> int:
+    """
+    Deja una fila por (user_id, game_type): la de más puntos (a igualdad, la
+    más antigua). Las filas sin game_type pasan al valor por defecto de la
+    columna, porque un índice único no las considera duplicadas entre sí.
+    Devuelve cuántas filas se han borrado.
+    """
+    table = models.Score.__table__
+    conn.execute(update(table).where(table.c.game_type.is_(None)).values(game_type="ghost_hunt"))
+
+    duplicated = select(table.c.user_id, table.c.game_type).group_by(
+        table.c.user_id, table.c.game_type
+    ).having(func.count() > 1).subquery()
+    rows = conn.execute(
+        select(table.c.id, table.c.user_id, table.c.game_type)
+        .join(duplicated, (table.c.user_id == duplicated.c.user_id)
+              & (table.c.game_type == duplicated.c.game_type))
+        .order_by(table.c.user_id, table.c.game_type, table.c.points.desc(), table.c.id)
+    ).all()
+
+    losers = []
+    for _, group in groupby(rows, key=lambda row: (row.user_id, row.game_type)):
+        next(group)  # la que se queda
+        losers.extend(row.id for row in group)
+    for start in range(0, len(losers), DELETE_BATCH):
+        conn.execute(table.delete().where(table.c.id.in_(losers[start:start + DELETE_BATCH])))
+    return len(losers)
+
+
+def ensure_score_unique(engine: Engine):
+    """
+    Añade `uq_score_user_game` a una tabla `scores` anterior a la restricción.
+    Sin ella el upsert de puntuaciones (`crud.upsert_high_scores`) inserta
+    filas nuevas en lugar de mejorar la existente y las lecturas del high
+    score fallan con MultipleResultsFound.
+    """
+    columns = ["user_id", "game_type"]
+    if _has_unique(engine, "scores", columns):
+        return
+    table = models.Score.__table__
+    index = Index("uq_score_user_game", table.c.user_id, table.c.game_type, unique=True)
+
+    for attempt in range(1, INDEX_ATTEMPTS + 1):
+        with engine.begin() as conn:
+            removed = _dedupe_scores(conn)
+        if removed:
+            logger.warning("Puntuaciones duplicadas eliminadas antes de crear uq_score_user_game",
+                           extra={"deleted": removed})
+        try:
+            # En MySQL el DDL hace commit implícito: va en su propia transacción
+            with engine.begin() as conn:
+                index.create(conn)
+        except (IntegrityError, OperationalError, ProgrammingError) as exc:
+            # Otro worker lo creó a la vez, o entró un duplicado entre medias
+            if _has_unique(engine, "scores", columns):
+                return
+            logger.warning("No se pudo crear uq_score_user_game, reintentando",
+                           extra={"attempt": attempt, "error": str(exc.orig)})
+            continue
+        logger.info("✅ Restricción uq_score_user_game añadida a scores")
+        return
+    raise RuntimeError(
+        "La tabla scores no tiene la restricción única (user_id, game_type) y no se pudo "
+        "añadir. Detén los procesos con la versión anterior y vuelve a arrancar."
+    )
+
+
+# ============================================================================
+# PUNTO DE ENTRADA
+# ============================================================================
+def upgrade_schema(engine: Engine):
+    """Aplica los ajustes pendientes. Se llama en el arranque tras `create_all`."""
+    ensure_score_unique(engine)
+
+
+if __name__ == "__main__":
+    from .database import engine as default_engine
+    from .logging_config import setup_logging, shutdown_logging
+
+    setup_logging()
+    try:
+        upgrade_schema(default_engine)
+    finally:
+        shutdown_logging()
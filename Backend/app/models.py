@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Text, Boolean, Enum, JSON, Date, DECIMAL
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Text, Boolean, Enum, JSON, Date, DECIMAL, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -342,7 +342,12 @@ class OrderItem(Base):
 # SCORE MODEL
 # ============================================================================
 class Score(Base):
+    """High score de cada usuario por juego (una fila por usuario y juego)."""
     __tablename__ = "scores"
+    # En BD ya creadas la añade migrations.ensure_score_unique al arrancar
+    __table_args__ = (
+        UniqueConstraint("user_id", "game_type", name="uq_score_user_game"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     
@@ -387,4 +392,188 @@ class AuditLog(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relaciones
-    user = relationship("User")
\ No newline at end of file
+    user = relationship("User")
+
+
+# ============================================================================
+# IDEMPOTENCY KEY MODEL
+# ============================================================================
+class IdempotencyKey(Base):
+    """Respuesta guardada de una petición con cabecera Idempotency-Key."""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("user_id", "scope", "key", name="uq_idempotency_user_scope_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    scope = Column(String(50), nullable=False)  # endpoint, p. ej. "orders.create"
+    key = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False)
+
+    # in_progress -> completed
+    status = Column(String(20), nullable=False, default="in_progress")
+    response_status = Column(Integer, nullable=True)
+    response_body = Column(JSON, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+# ============================================================================
+# ORDER INTENT MODEL
+# ============================================================================
+class OrderIntent(Base):
+    """Pedido en cola (checkout asíncrono), procesado por app/order_queue.py."""
+    __tablename__ = "order_intents"
+
+    # El id autoincremental define el orden FIFO de procesamiento
+    id = Column(Integer, primary_key=True, index=True)
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    payload = Column(JSON, nullable=False)  # OrderCreate serializado
+
+    # queued -> processing -> completed | failed
+    status = Column(String(20), nullable=False, default="queued", index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    claimed_at = Column(DateTime, nullable=True)
+    claimed_by = Column(String(32), nullable=True)  # token del lote que la procesa
+
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="SET NULL"), nullable=True)
+    error = Column(Text, nullable=True)
+    error_status = Column(Integer, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
+
+    # Relaciones
+    order = relationship("Order")
+
+
+# ============================================================================
+# ID WORKER LEASE MODEL
+# ============================================================================
+class IdWorkerLease(Base):
+    """Valor de nodo + proceso alquilado por un generador de identificadores (ver app/identifiers.py)."""
+    __tablename__ = "id_worker_leases"
+
+    worker_id = Column(Integer, primary_key=True, autoincrement=False)
+    holder = Column(String(64), nullable=False)  # host:pid:aleatorio
+    expires_at = Column(DateTime, nullable=False)
+
+
+# ============================================================================
+# BULK ORDER JOB MODEL
+# ============================================================================
+class BulkOrderJob(Base):
+    """Operación masiva de pedidos (ver app/bulk_orders.py); visible desde cualquier worker."""
+    __tablename__ = "bulk_order_jobs"
+
+    id = Column(String(32), primary_key=True)
+    action = Column(String(20), nullable=False)
+    requested_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+
+    # queued -> running -> completed | failed
+    status = Column(String(20), nullable=False, default="queued")
+    total = Column(Integer, nullable=False, default=0)
+    processed = Column(Integer, nullable=False, default=0)
+    changed = Column(Integer, nullable=False, default=0)
+    skipped = Column(Integer, nullable=False, default=0)
+    stock_restored = Column(Integer, nullable=False, default=0)
+    souls_refunded = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+# ============================================================================
+# INVENTORY HOLD MODELS
+# ============================================================================
+class InventoryHold(Base):
+    """Reserva temporal de stock de un producto para el carrito de un usuario."""
+    __tablename__ = "inventory_holds"
+    __table_args__ = (
+        UniqueConstraint("user_id", "product_id", name="uq_inventory_hold_user_product"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ProductInventory(Base):
+    """
+    Cantidad reservada por producto (suma de sus holds). El stock disponible
+    es `Product.stock - held`.
+    """
+    __tablename__ = "product_inventory"
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    held = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# ============================================================================
+# EVENT CAPACITY MODEL
+# ============================================================================
+class EventTicketCounter(Base):
+    """
+    Entradas vendidas por evento, mantenido en la misma transacción que los
+    pedidos: comprobar el aforo (`venue_capacity`) es leer una fila.
+    """
+    __tablename__ = "event_ticket_counters"
+
+    event_id = Column(Integer, ForeignKey("events.id", ondelete="CASCADE"), primary_key=True)
+    tickets_sold = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class UserEventPurchase(Base):
+    """Entradas compradas por un usuario para un evento (límite max_tickets_per_user)."""
+    __tablename__ = "user_event_purchases"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    event_id = Column(Integer, ForeignKey("events.id", ondelete="CASCADE"), primary_key=True)
+    tickets = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# ============================================================================
+# LEADERBOARD ROLLUP MODEL
+# ============================================================================
+class LeaderboardEntry(Base):
+    """
+    Mejor puntuación de un usuario en una ventana del leaderboard (día,
+    semana ISO o evento), mantenida al registrar cada puntuación.
+    """
+    __tablename__ = "leaderboard_entries"
+    __table_args__ = (
+        Index("ix_leaderboard_window_points", "window_type", "window_key", "game_type", "points"),
+    )
+
+    window_type = Column(String(10), primary_key=True)   # daily, weekly, event
+    window_key = Column(String(20), primary_key=True)    # 2026-10-19, 2026-W42, id del evento
+    game_type = Column(String(50), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    points = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+# ============================================================================
+# SCORE BUFFER MODEL
+# ============================================================================
+class ScoreFlush(Base):
+    """Lotes del búfer de puntuaciones ya aplicados (ver app/score_buffer.py)."""
+    __tablename__ = "score_buffer_flushes"
+
+    batch_id = Column(String(32), primary_key=True)
+    entries = Column(Integer, nullable=False, default=0)
+    flushed_at = Column(DateTime, default=datetime.utcnow, index=True)
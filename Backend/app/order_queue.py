@@ -0,0 +1,396 @@
+"""
+Checkout en cola para picos de venta (apertura de entradas).
+
+Con ORDER_QUEUE_ENABLED, `POST /orders/` con la cabecera
+`Prefer: respond-async` no toca `products`: guarda la intención de compra en
+`order_intents` y responde 202 al instante. Un pequeño pool de hilos procesa
+la cola en orden FIFO por lotes:
+
+- cada lote bloquea una sola vez las filas de los productos implicados,
+- reparte el stock disponible entre las intenciones por orden de llegada,
+- crea los pedidos, inserta todas sus líneas en un solo INSERT y aplica
+  un único UPDATE de stock por producto,
+- y confirma todo en una transacción.
+
+El cliente consulta el resultado con `GET /orders/intents/{id}` (admite
+long-polling con `?wait=`).
+"""
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import or_, and_
+
+from .config import settings
+from .database import SessionLocal
+from .email_utils import send_ticket_email
+from . import crud, events, inventory, metrics, models, schemas
+
+logger = logging.getLogger(__name__)
+
+# Intentos antes de dar por fallida una intención cuyo lote falla (errores de BD)
+MAX_ATTEMPTS = 3
+# Una intención "processing" más antigua que esto es de un worker caído
+STALE_CLAIM = timedelta(minutes=5)
+
+_wakeup = threading.Event()
+_stop = threading.Event()
+_workers: List[threading.Thread] = []
+# Los correos se envían fuera de los workers para no frenar la cola
+_mail_executor: Optional[ThreadPoolExecutor] = None
+
+_stats = {"completed": 0, "failed": 0, "batches": 0}
+_stats_lock = threading.Lock()
+
+
+# ============================================================================
+# ENCOLAR Y CONSULTAR
+# ============================================================================
+def enqueue(db, user_id: int, order: schemas.OrderCreate) -> dict:
+    """Guarda la intención de compra y despierta a los workers."""
+    intent = models.OrderIntent(
+        user_id=user_id,
+        payload=order.model_dump(mode="json"),
+        status="queued",
+    )
+    db.add(intent)
+    db.commit()
+    db.refresh(intent)
+    _wakeup.set()
+    return intent_status(db, intent)
+
+
+def intent_status(db, intent: models.OrderIntent, with_position: bool = True) -> dict:
+    """Estado de la intención. `with_position=False` evita el COUNT del puesto en la cola."""
+    position = None
+    if intent.status == "queued" and with_position:
+        position = db.query(models.OrderIntent).filter(
+            models.OrderIntent.status == "queued",
+            models.OrderIntent.id < intent.id
+        ).count() + 1
+    return {
+        "id": intent.id,
+        "status": intent.status,
+        "position": position,
+        "order": intent.order if intent.status == "completed" else None,
+        "error": intent.error,
+        "error_status": intent.error_status,
+        "created_at": intent.created_at,
+        "processed_at": intent.processed_at,
+    }
+
+
+def get_intent(intent_id: int, user_id: int, with_position: bool = True) -> Optional[dict]:
+    """Estado de una intención del usuario (sesión propia: se usa en long-polling)."""
+    db = SessionLocal()
+    try:
+        intent = db.query(models.OrderIntent).filter(
+            models.OrderIntent.id == intent_id,
+            models.OrderIntent.user_id == user_id
+        ).first()
+        if intent is None:
+            return None
+        # Serializar dentro de la sesión (la respuesta incluye el pedido y sus items)
+        return schemas.OrderIntentResponse.model_validate(
+            intent_status(db, intent, with_position)
+        ).model_dump()
+    finally:
+        db.close()
+
+
+# ============================================================================
+# PROCESAMIENTO POR LOTES
+# ============================================================================
+def _claim_batch(db) -> List[models.OrderIntent]:
+    """
+    Reserva las intenciones más antiguas. SKIP LOCKED reparte los lotes entre
+    workers sin esperas; el UPDATE condicionado con un token propio garantiza
+    además que ninguna intención se procesa dos veces.
+    """
+    now = datetime.utcnow()
+    claimable = or_(
+        models.OrderIntent.status == "queued",
+        and_(models.OrderIntent.status == "processing",
+             models.OrderIntent.claimed_at < now - STALE_CLAIM),
+    )
+    ids = [row.id for row in db.query(models.OrderIntent.id).filter(claimable).order_by(
+        models.OrderIntent.id
+    ).limit(settings.ORDER_QUEUE_BATCH_SIZE).with_for_update(skip_locked=True)]
+    if not ids:
+        db.rollback()
+        return []
+
+    token = uuid.uuid4().hex
+    db.query(models.OrderIntent).filter(models.OrderIntent.id.in_(ids), claimable).update({
+        models.OrderIntent.status: "processing",
+        models.OrderIntent.claimed_at: now,
+        models.OrderIntent.claimed_by: token,
+        models.OrderIntent.attempts: models.OrderIntent.attempts + 1,
+    }, synchronize_session=False)
+    db.commit()
+    return db.query(models.OrderIntent).filter(
+        models.OrderIntent.claimed_by == token
+    ).order_by(models.OrderIntent.id).all()
+
+
+def _fail(intent: models.OrderIntent, status_code: int, detail: str):
+    intent.status = "failed"
+    intent.error = detail
+    intent.error_status = status_code
+    intent.processed_at = datetime.utcnow()
+
+
+def process_batch() -> int:
+    """Procesa un lote de la cola. Devuelve cuántas intenciones se han tratado."""
+    db = SessionLocal()
+    try:
+        intents = _claim_batch(db)
+        if not intents:
+            return 0
+
+        try:
+            emails = _apply_batch(db, intents)
+            db.commit()
+        except Exception:
+            logger.exception("Error procesando lote de pedidos", extra={"intents": len(intents)})
+            db.rollback()
+            for intent in intents:
+                if intent.attempts >= MAX_ATTEMPTS:
+                    _fail(intent, 500, "No se pudo procesar el pedido")
+                else:
+                    intent.status = "queued"
+            db.commit()
+            return len(intents)
+
+        completed = sum(1 for i in intents if i.status == "completed")
+        with _stats_lock:
+            _stats["batches"] += 1
+            _stats["completed"] += completed
+            _stats["failed"] += len(intents) - completed
+
+        _send_emails(emails)
+        return len(intents)
+    finally:
+        db.close()
+
+
+def _send_email(email: dict):
+    try:
+        asyncio.run(send_ticket_email(**email))
+    except Exception:
+        logger.exception("Error enviando los tickets de un pedido en cola", extra={"email_to": email["email_to"]})
+
+
+def _send_emails(emails: List[dict]):
+    """
+    Envía los correos en el hilo de correo. Si `stop()` ya lo ha cerrado (un
+    worker que termina su lote después del timeout) se envían aquí mismo.
+    """
+    mailer = _mail_executor
+    for email in emails:
+        try:
+            if mailer is not None:
+                mailer.submit(_send_email, email)
+                continue
+        except RuntimeError:  # executor cerrado entre medias
+            pass
+        _send_email(email)
+
+
+def _apply_batch(db, intents: List[models.OrderIntent]) -> List[dict]:
+    """
+    Crea los pedidos del lote en orden FIFO. Los productos y usuarios se
+    bloquean una vez, en orden de id para evitar interbloqueos entre workers.
+    """
+    orders = {intent.id: schemas.OrderCreate.model_validate(intent.payload) for intent in intents}
+
+    product_ids = sorted({item.product_id for order in orders.values() for item in order.items})
+    products = {
+        p.id: p for p in db.query(models.Product).filter(
+            models.Product.id.in_(product_ids)
+        ).order_by(models.Product.id).with_for_update().all()
+    }
+    user_ids = sorted({intent.user_id for intent in intents})
+    users = {
+        u.id: u for u in db.query(models.User).filter(
+            models.User.id.in_(user_ids)
+        ).order_by(models.User.id).with_for_update().all()
+    }
+
+    # Contadores de reservas (siempre después de bloquear products y antes que
+    # las reservas): lo reservado por otros no se puede vender
+    counters, holds = inventory.claim_for_order(db, user_ids, products)
+    # Aforo de los eventos: contadores bloqueados una vez para todo el lote
+    capacity = events.CapacityLedger(db, {
+        p.event_id for p in products.values() if p.type == "ticket" and p.event_id is not None
+    })
+
+    # Stock disponible, descontado en memoria a medida que se asigna
+    remaining = {pid: p.stock for pid, p in products.items()}
+    rows = []
+    emails = []
+
+    for intent in intents:
+        order = orders[intent.id]
+        user = users.get(intent.user_id)
+        if user is None:
+            _fail(intent, 404, "Usuario no encontrado")
+            continue
+
+        needed = Counter()
+        for item in order.items:
+            needed[item.product_id] += item.quantity
+
+        missing = next((pid for pid in needed if pid not in products), None)
+        if missing is not None:
+            _fail(intent, 404, f"Producto {missing} no encontrado")
+            continue
+        too_many = next((pid for pid, qty in needed.items()
+                         if products[pid].max_per_order and qty > products[pid].max_per_order), None)
+        if too_many is not None:
+            _fail(intent, 400, f"Máximo {products[too_many].max_per_order} unidades de {products[too_many].name} por pedido")
+            continue
+        short = next((
+            pid for pid, qty in needed.items()
+            if inventory.available_for(products[pid], counters, holds.get((user.id, pid)))
+            - (products[pid].stock - remaining[pid]) < qty
+        ), None)
+        if short is not None:
+            _fail(intent, 400, f"Stock insuficiente para {products[short].name}")
+            continue
+
+        tickets = events.tickets_by_event(products, needed)
+        full = capacity.exceeded(tickets)
+        if full is not None:
+            _fail(intent, 409, f"Aforo completo para {full.name}")
+            continue
+
+        total_cost = sum(float(products[item.product_id].price) * item.quantity for item in order.items)
+        if user.soul_balance < total_cost:
+            _fail(intent, 402, f"¡Tu alma es débil! Necesitas {total_cost} almas, pero solo tienes {user.soul_balance}. Juega más para ganar almas.")
+            continue
+
+        if tickets:
+            # Límite por persona: si falla se deshacen solo los incrementos de esta intención
+            savepoint = db.begin_nested()
+            over_limit = events.add_user_tickets(db, user.id, tickets, capacity.events)
+            if over_limit is not None:
+                savepoint.rollback()
+                _fail(intent, 400, events.limit_exceeded_detail(over_limit))
+                continue
+            savepoint.commit()
+
+        user.soul_balance -= int(total_cost)
+        capacity.add(tickets)
+        for pid, qty in needed.items():
+            remaining[pid] -= qty
+            inventory.consume_hold(db, counters, holds.pop((user.id, pid), None))
+
+        db_order = crud.build_order(db, user.id, user)
+        order_rows = []
+        for item in order.items:
+            order_rows.extend(crud.order_item_rows(db_order.id, products[item.product_id], item.quantity))
+        db_order.total = float(sum(row["subtotal"] for row in order_rows))
+        rows.extend(order_rows)
+
+        intent.status = "completed"
+        intent.order_id = db_order.id
+        intent.processed_at = datetime.utcnow()
+
+        if any(row["ticket_code"] for row in order_rows):
+            emails.append({
+                "email_to": user.email,
+                "customer_name": user.username,
+                "rows": order_rows,
+            })
+
+    # Las líneas de todos los pedidos del lote en un solo INSERT (los códigos
+    # de ticket pueden regenerarse si chocan: se leen después)
+    crud.insert_order_items(db, rows)
+    for email in emails:
+        email["ticket_codes"] = [row["ticket_code"] for row in email.pop("rows") if row["ticket_code"]]
+
+    # Un único UPDATE de stock por producto para todo el lote
+    for pid, product in products.items():
+        if product.stock != remaining[pid]:
+            product.stock = remaining[pid]
+
+    db.flush()
+    return emails
+
+
+# ============================================================================
+# WORKERS
+# ============================================================================
+def _worker_loop():
+    poll = settings.ORDER_QUEUE_POLL_MS / 1000.0
+    while not _stop.is_set():
+        try:
+            processed = process_batch()
+        except Exception:
+            logger.exception("Error en el worker de la cola de pedidos")
+            processed = 0
+        if processed == 0:
+            # Sin trabajo: esperar a un nuevo pedido (este proceso) o al sondeo (otros)
+            _wakeup.wait(poll)
+            _wakeup.clear()
+
+
+def start():
+    """Arranca los workers (lifespan). No hace nada si la cola está desactivada."""
+    global _mail_executor
+    if not settings.ORDER_QUEUE_ENABLED or _workers:
+        return
+    _stop.clear()
+    _mail_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="order-mail")
+    for n in range(max(settings.ORDER_QUEUE_WORKERS, 1)):
+        worker = threading.Thread(target=_worker_loop, name=f"order-queue-{n}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+    logger.info("Cola de pedidos activa", extra={"workers": len(_workers)})
+
+
+def stop(timeout: float = 10):
+    """Detiene los workers tras terminar el lote en curso."""
+    global _mail_executor
+    _stop.set()
+    _wakeup.set()
+    deadline = time.monotonic() + timeout
+    for worker in _workers:
+        worker.join(max(deadline - time.monotonic(), 0))
+    alive = sum(1 for worker in _workers if worker.is_alive())
+    if alive:
+        logger.warning("Workers de la cola de pedidos sin terminar al cerrar", extra={"workers": alive})
+    _workers.clear()
+    if _mail_executor is not None:
+        _mail_executor.shutdown(wait=False)
+        _mail_executor = None
+
+
+# ============================================================================
+# MÉTRICAS
+# ============================================================================
+def queue_collector():
+    if not settings.ORDER_QUEUE_ENABLED:
+        return
+    db = SessionLocal()
+    try:
+        depth = db.query(models.OrderIntent).filter(models.OrderIntent.status == "queued").count()
+    finally:
+        db.close()
+    yield "order_queue_depth", "gauge", "Intenciones de pedido pendientes en la cola.", {}, depth
+    with _stats_lock:
+        stats = dict(_stats)
+    yield "order_queue_batches_total", "counter", "Lotes de pedidos procesados por este proceso.", {}, stats["batches"]
+    for result in ("completed", "failed"):
+        yield ("order_queue_intents_total", "counter", "Intenciones de pedido procesadas por resultado.",
+               {"result": result}, stats[result])
+
+
+metrics.registry.register_collector(queue_collector)
@@ -0,0 +1,313 @@
+"""
+Profiling estadístico bajo demanda de peticiones individuales.
+
+Cuando una petición se marca para profiling (cabecera `X-Profile` con el
+token de administración o muestreo aleatorio), un hilo muestrea las pilas
+de ejecución a intervalos fijos mientras dura la petición y guarda el
+resultado en memoria en formato speedscope (https://www.speedscope.app).
+
+Si PROFILING_ENABLED es falso el middleware no se registra y no añade coste.
+
+Los endpoints `def` se ejecutan en el threadpool: los routers usan
+`ProfiledRoute`, que anota en qué hilo corre el endpoint de cada petición
+muestreada para atribuirle solo las pilas de ese hilo.
+"""
+import functools
+import hmac
+import inspect
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from fastapi.routing import APIRoute
+
+from .config import settings
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+
+# (nombre, fichero, línea) identifica un frame en el perfil
+FrameKey = Tuple[str, str, int]
+
+# Muestreador de la petición en curso (se copia al contexto del threadpool)
+_active_sampler: ContextVar[Optional["RequestSampler"]] = ContextVar("profiling_sampler", default=None)
+
+
+# ============================================================================
+# MUESTREADOR
+# ============================================================================
+def _thread_cpu_time(thread_id: int) -> Optional[float]:
+    """Tiempo de CPU consumido por un hilo (solo en plataformas con pthread)."""
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+    except (AttributeError, OSError):
+        return None
+
+
+class RequestSampler:
+    """
+    Muestrea las pilas que pertenecen a una petición:
+    - En el hilo del event loop, las que contienen el frame del middleware.
+    - En el threadpool, las de los hilos que están ejecutando el endpoint
+      `def` de esta petición (`threads`, ver ProfiledRoute). Con el código
+      del endpoint no basta: dos peticiones simultáneas al mismo endpoint
+      se mezclarían.
+    """
+
+    def __init__(self, scope, request_frame, interval: float):
+        self.scope = scope
+        self.request_frame = request_frame
+        self.loop_thread_id = threading.get_ident()
+        self.threads: Set[int] = set()
+        self.interval = interval
+        self.frames: List[FrameKey] = []
+        self.frame_index: Dict[FrameKey, int] = {}
+        self.samples: List[List[int]] = []
+        self.wall_weights: List[float] = []
+        self.cpu_weights: List[float] = []
+        self._stop = threading.Event()
+        self._on_done: Optional[Callable[[], None]] = None
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, on_done: Optional[Callable[[], None]] = None):
+        """
+        Pide al hilo que termine sin esperarle: se llama desde el event loop,
+        que no debe bloquearse. `on_done` se ejecuta en el hilo muestreador
+        cuando ya no va a añadir más muestras.
+        """
+        self._on_done = on_done
+        self._stop.set()
+
+    def _run(self):
+        try:
+            self._sample()
+        finally:
+            if self._on_done is not None:
+                self._on_done()
+
+    def _sample(self):
+        last_tick = time.perf_counter()
+        last_cpu: Dict[int, Optional[float]] = {}
+
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            elapsed = now - last_tick
+            last_tick = now
+
+            for thread_id, frame in sys._current_frames().items():
+                stack = self._stack_for(thread_id, frame)
+                if stack is None:
+                    continue
+
+                cpu_now = _thread_cpu_time(thread_id)
+                cpu_prev = last_cpu.get(thread_id)
+                last_cpu[thread_id] = cpu_now
+                cpu_spent = 0.0
+                if cpu_now is not None and cpu_prev is not None:
+                    cpu_spent = min(cpu_now - cpu_prev, elapsed)
+
+                self.samples.append(stack)
+                self.wall_weights.append(elapsed)
+                self.cpu_weights.append(cpu_spent)
+
+    def _stack_for(self, thread_id, frame) -> Optional[List[int]]:
+        in_loop = thread_id == self.loop_thread_id
+        if not in_loop and thread_id not in self.threads:
+            return None
+        codes = []
+        belongs = not in_loop
+        f = frame
+        while f is not None:
+            if f is self.request_frame:
+                belongs = True
+            codes.append(f.f_code)
+            f = f.f_back
+        if not belongs:
+            return None
+
+        stack = []
+        for code in reversed(codes):  # speedscope espera raíz -> hoja
+            key = (getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+            index = self.frame_index.get(key)
+            if index is None:
+                index = self.frame_index[key] = len(self.frames)
+                self.frames.append(key)
+            stack.append(index)
+        return stack
+
+
+def _track_thread(endpoint):
+    """Envuelve un endpoint `def` para anotar su hilo en el muestreador de la petición."""
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        sampler = _active_sampler.get()
+        if sampler is None:
+            return endpoint(*args, **kwargs)
+        thread_id = threading.get_ident()
+        sampler.threads.add(thread_id)
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            sampler.threads.discard(thread_id)
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """
+    `route_class` de los routers. Con PROFILING_ENABLED envuelve los
+    endpoints `def` con `_track_thread`; si no, es un APIRoute normal.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if settings.PROFILING_ENABLED and not inspect.iscoroutinefunction(endpoint):
+            endpoint = _track_thread(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+# ============================================================================
+# ALMACÉN DE PERFILES
+# ============================================================================
+class ProfileStore:
+    """Guarda los últimos N perfiles en memoria (por proceso)."""
+
+    def __init__(self, max_profiles: int):
+        self._profiles = deque(maxlen=max_profiles)
+        self._lock = threading.Lock()
+
+    def add(self, profile: dict):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            profiles = list(self._profiles)
+        return [{k: v for k, v in p.items() if k != "sampler"} for p in reversed(profiles)]
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        with self._lock:
+            for profile in self._profiles:
+                if profile["id"] == profile_id:
+                    return profile
+        return None
+
+
+store = ProfileStore(settings.PROFILING_MAX_STORED)
+
+
+def to_speedscope(profile: dict) -> dict:
+    """Convierte un perfil guardado al formato de fichero de speedscope."""
+    sampler: RequestSampler = profile["sampler"]
+    name = f"{profile['method']} {profile['path']}"
+
+    def sampled(kind: str, weights: List[float]) -> dict:
+        return {
+            "type": "sampled",
+            "name": f"{name} ({kind})",
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": sampler.samples,
+            "weights": weights,
+        }
+
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": settings.PROJECT_NAME,
+        "activeProfileIndex": 0,
+        "shared": {
+            "frames": [{"name": n, "file": f, "line": line} for n, f, line in sampler.frames],
+        },
+        "profiles": [
+            sampled("wall", sampler.wall_weights),
+            sampled("cpu", sampler.cpu_weights),
+        ],
+    }
+
+
+def to_collapsed(profile: dict, weight: str = "wall") -> str:
+    """Formato 'folded stacks' compatible con flamegraph.pl (pesos en microsegundos)."""
+    sampler: RequestSampler = profile["sampler"]
+    weights = sampler.cpu_weights if weight == "cpu" else sampler.wall_weights
+    folded: Dict[str, float] = {}
+    for stack, w in zip(sampler.samples, weights):
+        key = ";".join(sampler.frames[i][0] for i in stack)
+        folded[key] = folded.get(key, 0.0) + w
+    return "\n".join(f"{k} {int(v * 1_000_000)}" for k, v in folded.items() if v > 0) + "\n"
+
+
+# ============================================================================
+# MIDDLEWARE
+# ============================================================================
+class ProfilingMiddleware:
+    """
+    Activa el muestreo para peticiones con `X-Profile: <PROFILING_TOKEN>`
+    o, aleatoriamente, con probabilidad PROFILING_SAMPLE_RATE.
+    El id del perfil se devuelve en la cabecera `X-Profile-Id`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.token = settings.PROFILING_TOKEN.encode()
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.interval = settings.PROFILING_INTERVAL_MS / 1000.0
+
+    def _should_profile(self, scope) -> bool:
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER:
+                    return hmac.compare_digest(value, self.token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        sampler = RequestSampler(scope, sys._getframe(), self.interval)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(PROFILE_ID_HEADER, profile_id.encode())]
+            await send(message)
+
+        started_at = datetime.utcnow()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        sampler.start()
+        token = _active_sampler.set(sampler)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _active_sampler.reset(token)
+            profile = {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "created_at": started_at.isoformat(),
+                "wall_ms": round((time.perf_counter() - wall_start) * 1000, 3),
+                "process_cpu_ms": round((time.process_time() - cpu_start) * 1000, 3),
+                "sampler": sampler,
+            }
+
+            def done():
+                # El perfil aparece en el almacén cuando el muestreador termina
+                profile["samples"] = len(sampler.samples)
+                store.add(profile)
+
+            sampler.stop(done)
@@ -0,0 +1,224 @@
+"""
+Posición global de cada jugador por juego (`GET /games/my-rank`).
+
+Cada proceso mantiene, por `game_type`, las marcas de todos los jugadores
+en una lista ordenada partida en sublistas de como mucho 2·LOAD entradas,
+con un árbol de Fenwick sobre sus longitudes. El tamaño depende del número
+de jugadores, nunca del valor de los puntos:
+
+- cuántos jugadores tienen más puntos (rango y percentil) es una bisección
+  sobre los máximos de las sublistas, una suma de prefijos del árbol y una
+  bisección en la sublista: O(log n);
+- el jugador en una posición dada (vecinos de arriba y de abajo) se busca
+  bajando por el árbol: O(log n);
+- una marca nueva quita e inserta una entrada: O(log n) más el
+  desplazamiento dentro de una sublista, acotado por LOAD.
+
+El árbol de un juego se construye con una sola lectura de `scores` la
+primera vez que se consulta y `crud.create_score` lo mantiene al momento.
+Las marcas registradas en otros procesos llegan al reconstruirlo, como
+mucho RANK_REFRESH_SECONDS después.
+"""
+import bisect
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .config import settings
+from . import models
+
+# Entrada: (points, -user_id). En orden ascendente, a igualdad de puntos va
+# antes (más arriba en la clasificación) el user_id menor.
+Entry = Tuple[int, int]
+
+# Tamaño nominal de las sublistas: se parten al doble y se funden al vaciarse
+LOAD = 512
+
+
+class FenwickTree:
+    """Árbol de Fenwick de recuentos (índices desde 0)."""
+
+    def __init__(self, counts: List[int]):
+        # Construcción en O(n)
+        self.size = len(counts)
+        self.tree = [0] + list(counts)
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+
+    def add(self, index: int, delta: int):
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, index: int) -> int:
+        """Suma de los índices 0..index."""
+        i = min(index, self.size - 1) + 1
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, k: int) -> Tuple[int, int]:
+        """Índice que contiene el k-ésimo elemento (desde 1) y cuántos hay antes."""
+        pos, before = 0, 0
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and before + self.tree[nxt] < k:
+                pos = nxt
+                before += self.tree[nxt]
+            step >>= 1
+        return pos, before
+
+
+class RankedEntries:
+    """Lista ordenada de entradas con búsqueda por posición en O(log n)."""
+
+    def __init__(self, entries: List[Entry]):
+        entries = sorted(entries)
+        self.lists: List[List[Entry]] = [entries[i:i + LOAD] for i in range(0, len(entries), LOAD)]
+        self._reindex()
+
+    def _reindex(self):
+        self.maxes = [sub[-1] for sub in self.lists]
+        self.tree = FenwickTree([len(sub) for sub in self.lists])
+        self.total = sum(len(sub) for sub in self.lists)
+
+    def __len__(self):
+        return self.total
+
+    def insert(self, entry: Entry):
+        if not self.lists:
+            self.lists.append([entry])
+            self._reindex()
+            return
+        i = min(bisect.bisect_left(self.maxes, entry), len(self.lists) - 1)
+        sub = self.lists[i]
+        bisect.insort(sub, entry)
+        self.maxes[i] = sub[-1]
+        self.total += 1
+        if len(sub) > 2 * LOAD:
+            self.lists[i:i + 1] = [sub[:LOAD], sub[LOAD:]]
+            self._reindex()
+        else:
+            self.tree.add(i, 1)
+
+    def remove(self, entry: Entry):
+        i = bisect.bisect_left(self.maxes, entry)
+        sub = self.lists[i]
+        del sub[bisect.bisect_left(sub, entry)]
+        self.total -= 1
+        if not sub:
+            del self.lists[i]
+            self._reindex()
+        else:
+            self.maxes[i] = sub[-1]
+            self.tree.add(i, -1)
+
+    def count_below(self, entry) -> int:
+        """Entradas menores que `entry`."""
+        i = bisect.bisect_left(self.maxes, entry)
+        if i == len(self.lists):
+            return self.total
+        return (self.tree.prefix(i - 1) if i else 0) + bisect.bisect_left(self.lists[i], entry)
+
+    def at(self, index: int) -> Entry:
+        """Entrada en la posición `index` (desde 0, orden ascendente)."""
+        i, before = self.tree.find(index + 1)
+        return self.lists[i][index - before]
+
+
+class GameRanking:
+    """Clasificación de un juego: una marca (la mejor) por jugador."""
+
+    def __init__(self, rows: List[Tuple[int, int]]):
+        self.points: Dict[int, int] = {user_id: points for user_id, points in rows}
+        self.entries = RankedEntries([(points, -user_id) for user_id, points in self.points.items()])
+        self.built_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.points)
+
+    def update(self, user_id: int, points: int):
+        """Sube la marca del jugador; nunca la baja (se comprueba con el lock tomado)."""
+        with self.lock:
+            if points <= self.points.get(user_id, -1):
+                return
+            if user_id in self.points:
+                self.entries.remove((self.points[user_id], -user_id))
+            self.entries.insert((points, -user_id))
+            self.points[user_id] = points
+
+    def _at(self, position: int) -> Entry:
+        """Entrada en la posición `position` (1 = primero)."""
+        return self.entries.at(len(self.points) - position)
+
+    def rank(self, user_id: int, neighbors: int) -> Optional[dict]:
+        with self.lock:
+            points = self.points.get(user_id)
+            if points is None:
+                return None
+            total = len(self.points)
+            position = total - self.entries.count_below((points, -user_id))
+            # Los empatados a puntos comparten rango
+            greater = total - self.entries.count_below((points, float("inf")))
+            around = lambda positions: [
+                {"position": p, "user_id": -entry[1], "points": entry[0]}
+                for p in positions for entry in [self._at(p)]
+            ]
+            return {
+                "points": points,
+                "rank": greater + 1,
+                "position": position,
+                "total_players": total,
+                "percentile": round(100 * (total - greater) / total, 2),
+                "above": around(range(max(position - neighbors, 1), position)),
+                "below": around(range(position + 1, min(position + neighbors, total) + 1)),
+            }
+
+
+# ============================================================================
+# CLASIFICACIONES POR JUEGO
+# ============================================================================
+_rankings: Dict[str, GameRanking] = {}
+_rankings_lock = threading.Lock()
+
+
+def _load(db: Session, game_type: str) -> GameRanking:
+    rows = db.query(models.Score.user_id, models.Score.points).filter(
+        models.Score.game_type == game_type
+    ).all()
+    return GameRanking(rows)
+
+
+def get_ranking(db: Session, game_type: str) -> GameRanking:
+    """Clasificación del juego, (re)construida si falta o ha caducado."""
+    ranking = _rankings.get(game_type)
+    if ranking is None or time.monotonic() - ranking.built_at > settings.RANK_REFRESH_SECONDS:
+        ranking = _load(db, game_type)
+        with _rankings_lock:
+            _rankings[game_type] = ranking
+    return ranking
+
+
+def record(game_type: str, user_id: int, points: int):
+    """Aplica una partida ya confirmada (si el juego está cargado); solo sube marcas."""
+    ranking = _rankings.get(game_type)
+    if ranking is not None:
+        ranking.update(user_id, points)
+
+
+def invalidate(game_type: Optional[str] = None):
+    """Descarta clasificaciones (tras editar o borrar puntuaciones)."""
+    with _rankings_lock:
+        if game_type is None:
+            _rankings.clear()
+        else:
+            _rankings.pop(game_type, None)
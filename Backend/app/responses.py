@@ -0,0 +1,37 @@
+"""
+Clases de respuesta de la API.
+
+La app deja la clase de respuesta por defecto de FastAPI (JSONResponse): los
+endpoints con `response_model` los vuelca FastAPI, y en las versiones con
+camino rápido (p. ej. 0.143) lo hace directamente a bytes con el `dump_json`
+de pydantic, más rápido que cualquier clase propia (ver
+benchmarks/bench_serialization.py). Fijar una clase por defecto propia
+desactivaría ese camino.
+
+ORJSONResponse (orjson: datetimes, enums y UUIDs de forma nativa) se usa de
+forma explícita solo donde el contenido ya es un dict/lista: cachés del
+catálogo y del leaderboard, idempotencia, profiling y manejadores de errores.
+"""
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+def _default(obj: Any):
+    """Tipos que orjson no serializa por sí mismo."""
+    if isinstance(obj, Decimal):
+        # Como pydantic en modo JSON: texto, sin perder precisión
+        return str(obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class ORJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
@@ -0,0 +1,163 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from typing import List
+from .. import crud, schemas, database, dependencies, models, events
+from ..profiling import ProfiledRoute
+
+router = APIRouter(
+    prefix="/events",
+    tags=["Events"],
+    responses={404: {"description": "No encontrado"}},
+    route_class=ProfiledRoute,
+)
+
+
+def _capacity(db: Session, event_id: int, venue_capacity) -> dict:
+    sold = events.get_tickets_sold(db, event_id)
+    remaining = None if venue_capacity is None else max(venue_capacity - sold, 0)
+    return {
+        "venue_capacity": venue_capacity,
+        "tickets_sold": sold,
+        "tickets_remaining": remaining,
+        "sold_out": remaining == 0,
+    }
+
+
+def _visible(event: models.Event) -> bool:
+    return event.is_public and event.status != "draft"
+
+
+# ============================================================================
+# PUBLIC ENDPOINTS
+# ============================================================================
+
+@router.get("/", response_model=List[schemas.EventResponse])
+def get_events(
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(database.get_db)
+):
+    """Obtener los eventos publicados, por fecha"""
+    return crud.get_events(db, skip=skip, limit=limit)
+
+
+@router.get("/{slug}", response_model=schemas.EventDetailResponse)
+def get_event(
+    slug: str,
+    db: Session = Depends(database.get_db)
+):
+    """
+    Ficha de un evento por su slug, con sus productos y el aforo disponible.
+
+    La ficha se sirve desde una caché en memoria (EVENT_CACHE_TTL_SECONDS);
+    el aforo se lee siempre del contador de entradas vendidas.
+    """
+    page = events.page_cache.get(slug)
+    if page is None:
+        event = crud.get_event_by_slug(db, slug)
+        if event is None or not _visible(event):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Evento no encontrado"
+            )
+        page = schemas.EventDetailResponse.model_validate(event).model_dump()
+        page["products"] = [p for p in page["products"] if p["is_active"]]
+        events.page_cache.set(slug, page)
+    return {**page, "capacity": _capacity(db, page["id"], page["venue_capacity"])}
+
+
+@router.get("/{slug}/capacity", response_model=schemas.EventCapacity)
+def get_event_capacity(
+    slug: str,
+    db: Session = Depends(database.get_db)
+):
+    """Aforo disponible del evento (para refrescar la ficha sin recargarla)"""
+    page = events.page_cache.get(slug)
+    if page is not None:
+        event_id, venue_capacity = page["id"], page["venue_capacity"]
+    else:
+        event = db.query(models.Event).filter(models.Event.slug == slug).first()
+        if event is None or not _visible(event):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Evento no encontrado"
+            )
+        event_id, venue_capacity = event.id, event.venue_capacity
+    return _capacity(db, event_id, venue_capacity)
+
+
+# ============================================================================
+# ADMIN ENDPOINTS
+# ============================================================================
+
+@router.get("/admin/all", response_model=List[schemas.EventResponse])
+def get_all_events(
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(dependencies.get_current_admin_user)
+):
+    """Obtener todos los eventos, incluidos borradores. **Solo administradores.**"""
+    return crud.get_events(db, skip=skip, limit=limit, include_unpublished=True)
+
+
+@router.post("/", response_model=schemas.EventDetailResponse, status_code=status.HTTP_201_CREATED)
+def create_event(
+    event: schemas.EventCreate,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(dependencies.get_current_admin_user)
+):
+    """Crear un nuevo evento. **Solo administradores.**"""
+    if db.query(models.Event.id).filter(models.Event.slug == event.slug).first():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Ya existe un evento con ese slug"
+        )
+    db_event = crud.create_event(db, event, current_user.id)
+    return {
+        **schemas.EventDetailResponse.model_validate(db_event).model_dump(),
+        "capacity": _capacity(db, db_event.id, db_event.venue_capacity),
+    }
+
+
+@router.put("/{event_id}", response_model=schemas.EventDetailResponse)
+def update_event(
+    event_id: int,
+    event_update: schemas.EventUpdate,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(dependencies.get_current_admin_user)
+):
+    """Actualizar un evento. **Solo administradores.**"""
+    db_event = crud.get_event(db, event_id)
+    if db_event is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Evento no encontrado"
+        )
+    old_slug = db_event.slug
+    db_event = crud.update_event(db, event_id, event_update)
+    events.page_cache.invalidate(old_slug)
+    events.page_cache.invalidate(db_event.slug)
+    return {
+        **schemas.EventDetailResponse.model_validate(db_event).model_dump(),
+        "capacity": _capacity(db, db_event.id, db_event.venue_capacity),
+    }
+
+
+@router.delete("/{event_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_event(
+    event_id: int,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(dependencies.get_current_admin_user)
+):
+    """Eliminar un evento. **Solo administradores.**"""
+    db_event = crud.get_event(db, event_id)
+    if db_event is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Evento no encontrado"
+        )
+    slug = db_event.slug
+    crud.delete_event(db, event_id)
+    events.page_cache.invalidate(slug)
+    return None
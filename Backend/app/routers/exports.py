@@ -0,0 +1,48 @@
+from datetime import date, datetime
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from typing import Literal, Optional
+from .. import dependencies, models, exports
+from ..profiling import ProfiledRoute
+
+router = APIRouter(
+    prefix="/exports",
+    tags=["Exports"],
+    responses={403: {"description": "Solo administradores"}},
+    route_class=ProfiledRoute,
+)
+
+QUERIES = {
+    "orders": exports.orders_query,
+    "tickets": exports.tickets_query,
+    "users": exports.users_query,
+}
+
+
+# ============================================================================
+# ADMIN ENDPOINTS
+# ============================================================================
+
+@router.get("/{dataset}")
+def export_dataset(
+    dataset: Literal["orders", "tickets", "users"],
+    format: Literal["csv", "ndjson"] = "csv",
+    date_from: Optional[date] = Query(None, description="Desde (incluido)"),
+    date_to: Optional[date] = Query(None, description="Hasta (incluido)"),
+    status: Optional[str] = Query(None, description="Pedido: status; ticket: ticket_status; usuario: active/inactive"),
+    event_id: Optional[int] = Query(None, description="Solo lo relacionado con este evento"),
+    current_user: models.User = Depends(dependencies.get_current_admin_user)
+):
+    """
+    Exportar pedidos, tickets o usuarios en CSV o NDJSON. **Solo administradores.**
+
+    El fichero se genera y envía en streaming, fila a fila desde un cursor de
+    la BD, así que sirve para exportaciones de millones de filas.
+    """
+    query = QUERIES[dataset](date_from=date_from, date_to=date_to, status=status, event_id=event_id)
+    filename = f"{dataset}-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}"
+    return StreamingResponse(
+        exports.stream_rows(query, format),
+        media_type=exports.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -1,14 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
 from sqlalchemy.orm import Session
 from typing import List
-from .. import crud, schemas, database, dependencies, models
+from ..config import settings
+from ..responses import ORJSONResponse
+from .. import crud, schemas, database, dependencies, models, idempotency, leaderboard, ranking, score_buffer, leaderboard_snapshots, singleflight
+from ..profiling import ProfiledRoute
 
 router = APIRouter(
     prefix="/games",
     tags=["Games & Scores"],
     responses={404: {"description": "No encontrado"}},
+    route_class=ProfiledRoute,
 )
 
+# Si el snapshot no está fresco, las peticiones concurrentes comparten la consulta
+leaderboard_flight = singleflight.group("leaderboard")
+
 
 # ============================================================================
 # PUBLIC ENDPOINTS
@@ -25,12 +32,70 @@ def get_leaderboard(
     
     - **limit**: Número de posiciones a mostrar (máximo 100)
     - **game_type**: Filtrar por juego específico (opcional)
+
+    Se sirve del snapshot publicado en `/static/leaderboard/` mientras esté
+    fresco (ver app/leaderboard_snapshots.py).
     """
-    from sqlalchemy.orm import joinedload
-    query = db.query(models.Score).options(joinedload(models.Score.player))
-    if game_type:
-        query = query.filter(models.Score.game_type == game_type)
-    return query.order_by(models.Score.points.desc()).limit(limit).all()
+    if limit <= settings.LEADERBOARD_SNAPSHOT_SIZE:
+        snapshot = leaderboard_snapshots.get(game_type)
+        if snapshot is not None:
+            return ORJSONResponse(snapshot[:limit])
+    def load():
+        from sqlalchemy.orm import joinedload
+        query = db.query(models.Score).options(joinedload(models.Score.player))
+        if game_type:
+            query = query.filter(models.Score.game_type == game_type)
+        # Mismo desempate que el snapshot, para que no cambie el orden al caducar
+        scores = query.order_by(models.Score.points.desc(), models.Score.id).limit(limit).all()
+        return [schemas.ScoreWithUser.model_validate(s).model_dump(mode="json") for s in scores]
+
+    return ORJSONResponse(leaderboard_flight.do((limit, game_type), load))
+
+
+@router.get("/leaderboard/{window}", response_model=schemas.WindowLeaderboardResponse)
+def get_window_leaderboard(
+    window: schemas.LeaderboardWindow,
+    limit: int = Query(10, ge=1, le=100, description="Número de posiciones a mostrar"),
+    game_type: str = Query(None, description="Filtrar por tipo de juego: ghost_hunt, trivia, memory"),
+    event_id: int = Query(None, description="Evento (obligatorio con window=event)"),
+    key: str = Query(None, max_length=20, description="Ventana anterior: 2026-10-18 (daily) o 2026-W42 (weekly)"),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Leaderboard de una ventana: hoy (`daily`), esta semana (`weekly`) o un
+    evento (`event`), con la mejor partida de cada jugador en ella.
+
+    Se lee de los rollups por ventana y de una caché en memoria, sin
+    recorrer el histórico de puntuaciones.
+    """
+    if window == schemas.LeaderboardWindow.event:
+        if event_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Indica event_id para el leaderboard del evento"
+            )
+        window_key = leaderboard.window_key("event", event_id=event_id)
+    else:
+        window_key = key or leaderboard.window_key(window.value)
+
+    rows = leaderboard.top(db, window.value, window_key, game_type, limit)
+    players = leaderboard.players(db, rows)
+    return {
+        "window": window,
+        "window_key": window_key,
+        "game_type": game_type,
+        "entries": [
+            {
+                "position": position,
+                "user_id": user_id,
+                "game_type": row_game_type,
+                "points": points,
+                "updated_at": updated_at,
+                "player": players.get(user_id),
+            }
+            for position, (points, updated_at, user_id, row_game_type) in enumerate(rows, start=1)
+        ],
+    }
 
 
 # ============================================================================
@@ -40,6 +105,7 @@ def get_leaderboard(
 @router.post("/score", response_model=schemas.ScoreResponse, status_code=status.HTTP_201_CREATED)
 def submit_score(
     score: schemas.ScoreCreate,
+    request: Request,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(dependencies.get_current_user)
 ):
@@ -47,19 +113,41 @@ def submit_score(
     Guardar una nueva puntuación del usuario actual.
     
     - **points**: Puntos obtenidos en el juego
+    - **event_id**: Evento en el que se juega (opcional, para su leaderboard)
+
+    Admite la cabecera `Idempotency-Key`: un reintento no suma las almas dos veces.
+
+    Con el búfer de puntuaciones activo (SCORE_BUFFER_ENABLED) responde 202
+    al aceptar la partida; se guarda en la BD en el siguiente volcado.
     """
-    # Guardar puntuación
-    new_score = crud.create_score(db=db, score=score, user_id=current_user.id)
-    
-    # ---------------------------------------------------------
-    # GAMIFICATION: Sumar puntos al saldo del usuario
-    # ---------------------------------------------------------
-    # Por simplicidad, 1 punto de score = 1 Alma
-    current_user.soul_balance += score.points
-    db.commit()
-    db.refresh(current_user)
-    
-    return new_score
+    if score.event_id is not None and crud.get_event(db, score.event_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Evento no encontrado"
+        )
+
+    if score_buffer.enabled():
+        return idempotency.execute(
+            request, "games.score", current_user.id, score,
+            schemas.ScoreAccepted, status.HTTP_202_ACCEPTED,
+            lambda: score_buffer.submit(current_user.id, score)
+        )
+
+    def save_score():
+        # Puntuación, almas (1 punto = 1 alma) y rango en una sola transacción
+        return crud.create_score(db=db, score=score, user_id=current_user.id)
+
+    # Reintento tras un fallo al guardar la respuesta: el high score del juego
+    recover = lambda created: db.query(models.Score).filter(
+        models.Score.user_id == current_user.id,
+        models.Score.game_type == score.game_type
+    ).first()
+
+    return idempotency.execute(
+        request, "games.score", current_user.id, score,
+        schemas.ScoreResponse, status.HTTP_201_CREATED, save_score,
+        db=db, recover=recover
+    )
 
 
 @router.get("/my-scores", response_model=List[schemas.ScoreResponse])
@@ -92,6 +180,32 @@ def get_my_best_score(
     return best_score
 
 
+@router.get("/my-rank", response_model=schemas.MyRankResponse)
+def get_my_rank(
+    game_type: str = Query("ghost_hunt", description="Tipo de juego: ghost_hunt, trivia, memory"),
+    neighbors: int = Query(2, ge=0, le=10, description="Jugadores a mostrar por encima y por debajo"),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(dependencies.get_current_user)
+):
+    """
+    Posición global del usuario actual en un juego: rango, percentil y los
+    jugadores inmediatamente por encima y por debajo.
+    """
+    result = ranking.get_ranking(db, game_type).rank(current_user.id, neighbors)
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Aún no tienes puntuaciones en este juego"
+        )
+    neighbor_ids = [n["user_id"] for n in result["above"] + result["below"]]
+    usernames = dict(
+        db.query(models.User.id, models.User.username).filter(models.User.id.in_(neighbor_ids))
+    ) if neighbor_ids else {}
+    for n in result["above"] + result["below"]:
+        n["username"] = usernames.get(n["user_id"])
+    return {"game_type": game_type, **result}
+
+
 # ============================================================================
 # ADMIN ENDPOINTS
 # ============================================================================
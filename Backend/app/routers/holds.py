@@ -0,0 +1,91 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.orm import Session
+from typing import List
+from .. import schemas, database, dependencies, models, inventory
+from ..config import settings
+from ..profiling import ProfiledRoute
+
+router = APIRouter(
+    prefix="/holds",
+    tags=["Holds"],
+    responses={404: {"description": "No encontrado"}},
+    route_class=ProfiledRoute,
+)
+
+# Productos por consulta de disponibilidad
+MAX_AVAILABILITY_IDS = 100
+
+
+# ============================================================================
+# PUBLIC ENDPOINTS
+# ============================================================================
+
+@router.get("/availability", response_model=List[schemas.ProductAvailability])
+def get_availability(
+    product_ids: List[int] = Query(..., description="IDs de producto"),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Stock disponible de varios productos (stock menos unidades reservadas en
+    carritos). Las reservas se leen del índice en memoria.
+    """
+    if len(product_ids) > MAX_AVAILABILITY_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Máximo {MAX_AVAILABILITY_IDS} productos por consulta"
+        )
+    return inventory.availability(db, product_ids)
+
+
+# ============================================================================
+# AUTHENTICATED USER ENDPOINTS
+# ============================================================================
+
+@router.get("/", response_model=List[schemas.HoldResponse])
+def get_my_holds(
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(dependencies.get_current_user)
+):
+    """Reservas vigentes del carrito del usuario actual"""
+    return inventory.get_user_holds(db, current_user.id)
+
+
+@router.post("/", response_model=schemas.HoldResponse)
+def set_hold(
+    hold: schemas.HoldRequest,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(dependencies.get_current_user)
+):
+    """
+    Reservar unidades de un producto para el carrito.
+
+    - **quantity**: cantidad total del producto en el carrito (no incremental)
+
+    La reserva caduca a los HOLD_TTL_SECONDS; cada llamada la renueva.
+    Responde 409 si no quedan unidades suficientes.
+    """
+    if hold.quantity == 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Para liberar una reserva usa DELETE /holds/{product_id}"
+        )
+    return inventory.set_hold(db, current_user.id, hold.product_id, hold.quantity)
+
+
+@router.delete("/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
+def release_hold(
+    product_id: int,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(dependencies.get_current_user)
+):
+    """Liberar la reserva de un producto"""
+    inventory.set_hold(db, current_user.id, product_id, 0)
+
+
+@router.delete("/", status_code=status.HTTP_204_NO_CONTENT)
+def release_all_holds(
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(dependencies.get_current_user)
+):
+    """Liberar todas las reservas del usuario (vaciar carrito)"""
+    inventory.release_user_holds(db, current_user.id)
@@ -1,23 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, BackgroundTasks
+import asyncio
+import time
+from fastapi import APIRouter, Depends, HTTPException, status, Query, BackgroundTasks, Request
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
-from .. import crud, schemas, database, dependencies, models
+from .. import crud, schemas, database, dependencies, models, idempotency, order_queue, bulk_orders, singleflight
+from ..config import settings
 from ..email_utils import send_ticket_email
+from ..profiling import ProfiledRoute
 
 router = APIRouter(
     prefix="/orders",
     tags=["Orders"],
     responses={404: {"description": "No encontrado"}},
+    route_class=ProfiledRoute,
 )
 
+# Los recuentos del panel de admin se calculan una vez por ráfaga de peticiones
+stats_flight = singleflight.group("admin_stats")
+
 
 # ============================================================================
 # AUTHENTICATED USER ENDPOINTS
 # ============================================================================
 
 @router.post("/", response_model=schemas.OrderWithItems, status_code=status.HTTP_201_CREATED)
-async def create_order(
+def create_order(
     order: schemas.OrderCreate,
+    request: Request,
     background_tasks: BackgroundTasks,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(dependencies.get_current_user)
@@ -27,6 +37,13 @@ async def create_order(
     
     El stock se descuenta automáticamente al crear el pedido.
     Si el pedido contiene tickets, se envían por correo en segundo plano.
+
+    Con la cabecera `Idempotency-Key`, un reintento con la misma clave
+    devuelve el pedido ya creado sin cobrar ni enviar los tickets otra vez.
+
+    Si el checkout en cola está activo (ORDER_QUEUE_ENABLED) y se envía
+    `Prefer: respond-async`, responde 202 con la intención encolada; el
+    resultado se consulta en `GET /orders/intents/{id}`.
     
     **Ejemplo de body:**
     ```json
@@ -38,47 +55,89 @@ async def create_order(
     }
     ```
     """
-    # -------------------------------------------------------------
-    # ECONOMÍA DE ALMAS: Validar y descontar saldo
-    # -------------------------------------------------------------
-    # Calcular el costo total antes de procesar
-    total_cost = 0.0
-    for item in order.items:
-        prod = crud.get_product(db, item.product_id)
-        if not prod:
-             raise HTTPException(status_code=404, detail=f"Producto {item.product_id} no encontrado")
-        total_cost += float(prod.price) * item.quantity
-    
-    # Verificar saldo
-    if current_user.soul_balance < total_cost:
-        raise HTTPException(
-            status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail=f"¡Tu alma es débil! Necesitas {total_cost} almas, pero solo tienes {current_user.soul_balance}. Juega más para ganar almas."
-        )
+    def place_order():
+        # -------------------------------------------------------------
+        # ECONOMÍA DE ALMAS: Validar y descontar saldo
+        # -------------------------------------------------------------
+        # Calcular el costo total antes de procesar
+        total_cost = 0.0
+        for item in order.items:
+            prod = crud.get_product(db, item.product_id)
+            if not prod:
+                 raise HTTPException(status_code=404, detail=f"Producto {item.product_id} no encontrado")
+            total_cost += float(prod.price) * item.quantity
     
-    # Descontar saldo (El commit se hace dentro de crud.create_order)
-    current_user.soul_balance -= int(total_cost)
+        # Verificar y descontar saldo (El commit se hace dentro de crud.create_order)
+        if crud.debit_souls(db, current_user.id, total_cost) is None:
+            db.refresh(current_user, ["soul_balance"])
+            raise HTTPException(
+                status_code=status.HTTP_402_PAYMENT_REQUIRED,
+                detail=f"¡Tu alma es débil! Necesitas {total_cost} almas, pero solo tienes {current_user.soul_balance}. Juega más para ganar almas."
+            )
     
-    new_order = crud.create_order(db=db, order=order, user_id=current_user.id)
-
-    # -------------------------------------------------------------
-    # EMAIL: Verificar si hay tickets y enviar correo
-    # -------------------------------------------------------------
-    ticket_codes = []
-    # Usamos new_order.items que ya está poblado desde la BD
-    for item in new_order.items:
-        if item.product_type == "ticket" and item.ticket_code:
-            ticket_codes.append(item.ticket_code)
+        new_order = crud.create_order(db=db, order=order, user_id=current_user.id)
+
+        # -------------------------------------------------------------
+        # EMAIL: Verificar si hay tickets y enviar correo
+        # -------------------------------------------------------------
+        ticket_codes = []
+        # Usamos new_order.items que ya está poblado desde la BD
+        for item in new_order.items:
+            if item.product_type == "ticket" and item.ticket_code:
+                ticket_codes.append(item.ticket_code)
     
-    if ticket_codes:
-        background_tasks.add_task(
-            send_ticket_email, 
-            email_to=current_user.email,
-            customer_name=current_user.username,
-            ticket_codes=ticket_codes
+        if ticket_codes:
+            background_tasks.add_task(
+                send_ticket_email, 
+                email_to=current_user.email,
+                customer_name=current_user.username,
+                ticket_codes=ticket_codes
+            )
+
+        return new_order
+
+    if settings.ORDER_QUEUE_ENABLED and "respond-async" in request.headers.get("prefer", ""):
+        return idempotency.execute(
+            request, "orders.create", current_user.id, order,
+            schemas.OrderIntentResponse, status.HTTP_202_ACCEPTED,
+            lambda: order_queue.enqueue(db, current_user.id, order),
+            db=db, recover=lambda created: order_queue.get_intent(created.get("OrderIntent"), current_user.id)
         )
 
-    return new_order
+    return idempotency.execute(
+        request, "orders.create", current_user.id, order,
+        schemas.OrderWithItems, status.HTTP_201_CREATED, place_order,
+        db=db, recover=lambda created: crud.get_order_with_items(db, created.get("Order"))
+    )
+
+
+@router.get("/intents/{intent_id}", response_model=schemas.OrderIntentResponse)
+async def get_order_intent(
+    intent_id: int,
+    wait: float = Query(0, ge=0, le=25, description="Segundos de espera (long-polling) hasta que se resuelva"),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(dependencies.get_current_user)
+):
+    """
+    Estado de un pedido encolado: `queued` (con su puesto en la cola),
+    `processing`, `completed` (con el pedido) o `failed` (con el motivo).
+    """
+    user_id = current_user.id
+    # No retener una conexión del pool durante el long-polling
+    await run_in_threadpool(db.close)
+    deadline = time.monotonic() + wait
+    while True:
+        # El puesto en la cola (un COUNT) solo se calcula en la consulta que se devuelve
+        last_poll = time.monotonic() >= deadline
+        intent = await run_in_threadpool(order_queue.get_intent, intent_id, user_id, last_poll)
+        if intent is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Pedido en cola no encontrado"
+            )
+        if intent["status"] in ("completed", "failed") or last_poll:
+            return intent
+        await asyncio.sleep(min(0.25, max(deadline - time.monotonic(), 0)))
 
 
 @router.get("/my-orders", response_model=List[schemas.OrderWithItems])
@@ -203,7 +262,7 @@ def get_orders_count(
     """
     Obtener el total de pedidos. **Solo administradores.**
     """
-    count = crud.get_orders_count(db)
+    count = stats_flight.do("orders_count", lambda: crud.get_orders_count(db))
     return {"total": count}
 
 
@@ -215,10 +274,10 @@ def get_orders_stats(
     """
     Obtener estadísticas de pedidos. **Solo administradores.**
     """
-    return {
+    return stats_flight.do("orders_stats", lambda: {
         "total_orders": crud.get_orders_count(db),
         "tickets_sold": crud.get_tickets_sold_count(db)
-    }
+    })
 
 
 @router.get("/recent", response_model=List[schemas.OrderWithItems])
@@ -252,6 +311,73 @@ def get_order(
     return db_order
 
 
+@router.post("/bulk", response_model=schemas.BulkJobResponse, status_code=status.HTTP_202_ACCEPTED)
+def bulk_orders_action(
+    request: schemas.BulkOrderRequest,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(dependencies.get_current_admin_user)
+):
+    """
+    Cancelar o actualizar muchos pedidos a la vez. **Solo administradores.**
+
+    - **order_ids** y/o **filter**: pedidos afectados (al menos uno de los
+      dos, no vacíos: un filtro sin criterios no selecciona "todos")
+    - **expected_total**: cuántos pedidos se espera afectar; obligatorio con
+      **filter**. Si no coincide responde 409 con el recuento real
+    - **action=cancel**: restaura stock, anula los tickets y, con
+      `refund_souls`, devuelve las almas cobradas
+    - **action=update**: aplica los campos de **update** a todos
+
+    Se procesa en segundo plano por lotes; el progreso se consulta en
+    `GET /orders/bulk/{job_id}`.
+    """
+    if not bulk_orders.has_selection(request):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Indica order_ids o un filter con al menos un criterio"
+        )
+    if request.action == "update":
+        if request.update is None or not request.update.model_fields_set:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Indica los campos a actualizar en update"
+            )
+        if request.update.status == schemas.OrderStatus.cancelled:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Para cancelar usa action=cancel (restaura el stock)"
+            )
+    if request.filter is not None and request.expected_total is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Con filter indica expected_total (pedidos que esperas afectar)"
+        )
+
+    order_ids = bulk_orders.select_order_ids(db, request)
+    if request.expected_total is not None and len(order_ids) != request.expected_total:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"La selección afecta a {len(order_ids)} pedidos, no a {request.expected_total}"
+        )
+    return bulk_orders.submit(db, request, order_ids, requested_by=current_user.id)
+
+
+@router.get("/bulk/{job_id}", response_model=schemas.BulkJobResponse)
+def get_bulk_job(
+    job_id: str,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(dependencies.get_current_admin_user)
+):
+    """Progreso de una operación masiva. **Solo administradores.**"""
+    job = bulk_orders.get_job(db, job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Operación no encontrada"
+        )
+    return job
+
+
 @router.put("/{order_id}", response_model=schemas.OrderResponse)
 def update_order(
     order_id: int,
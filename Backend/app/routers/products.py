@@ -1,40 +1,54 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, File, UploadFile, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
 from sqlalchemy.orm import Session
 from typing import List, Optional
-import shutil
-import os
-import uuid
-from .. import schemas, crud, database, dependencies, models
+from .. import schemas, crud, database, dependencies, models, upload_utils, image_variants, singleflight
+from ..responses import ORJSONResponse
+from ..profiling import ProfiledRoute
 
 router = APIRouter(
     prefix="/products",
     tags=["Products"],
     responses={404: {"description": "No encontrado"}},
+    route_class=ProfiledRoute,
 )
 
-@router.post("/upload/", response_model=dict)
+# Listados concurrentes idénticos comparten una sola consulta
+catalog_flight = singleflight.group("products")
+
+@router.post("/upload/", response_model=dict, openapi_extra=upload_utils.IMAGE_UPLOAD_OPENAPI)
 async def upload_image(
     request: Request,
-    file: UploadFile = File(...),
     current_user: models.User = Depends(dependencies.get_current_admin_user)
 ):
     """
-    Subir una imagen de producto. Retorna la URL relativa.
+    Subir una imagen de producto. Retorna la URL de la imagen.
+
+    Las imágenes se guardan por su hash SHA-256: subir dos veces la misma
+    imagen no la duplica en disco.
     """
-    UPLOAD_DIR = "app/static/uploads"
-    if not os.path.exists(UPLOAD_DIR):
-        os.makedirs(UPLOAD_DIR)
-    
-    # Generate unique filename
-    file_extension = file.filename.split(".")[-1]
-    unique_filename = f"{uuid.uuid4()}.{file_extension}"
-    file_path = os.path.join(UPLOAD_DIR, unique_filename)
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        
-    base_url = str(request.base_url).rstrip('/')
-    return {"url": f"{base_url}/static/uploads/{unique_filename}"}
+    stored = await upload_utils.receive_image(request)
+    return {"url": upload_utils.public_url(request, stored.filename)}
+
+@router.post("/upload/presign", response_model=schemas.DirectUploadResponse)
+async def presign_upload(
+    data: schemas.DirectUploadRequest,
+    request: Request,
+    current_user: models.User = Depends(dependencies.get_current_admin_user)
+):
+    """
+    URL firmada para subir la imagen directamente al almacenamiento.
+    Tras el PUT se confirma con POST /products/upload/complete.
+    """
+    return await upload_utils.prepare_direct_upload(request, data.sha256, data.content_type, data.size)
+
+@router.post("/upload/complete", response_model=dict)
+async def complete_upload(
+    data: schemas.DirectUploadComplete,
+    request: Request,
+    current_user: models.User = Depends(dependencies.get_current_admin_user)
+):
+    """Confirmar una subida directa. Retorna la URL de la imagen."""
+    return {"url": await upload_utils.confirm_direct_upload(request, data.key)}
 
 # ============================================================================
 # PUBLIC ENDPOINTS
@@ -54,11 +68,14 @@ def read_products(
     - **limit**: Número máximo de productos a retornar
     - **product_type**: Filtrar por tipo de producto ('ticket' o 'item')
     """
-    if product_type:
-        products = crud.get_products_by_type(db, product_type=product_type, skip=skip, limit=limit)
-    else:
-        products = crud.get_products(db, skip=skip, limit=limit)
-    return products
+    def load():
+        if product_type:
+            products = crud.get_products_by_type(db, product_type=product_type, skip=skip, limit=limit)
+        else:
+            products = crud.get_products(db, skip=skip, limit=limit)
+        return [schemas.ProductResponse.model_validate(p).model_dump(mode="json") for p in products]
+
+    return ORJSONResponse(catalog_flight.do(("list", skip, limit, product_type), load))
 
 
 @router.get("/tickets", response_model=List[schemas.ProductResponse])
@@ -140,8 +157,12 @@ def create_product(
     - **type**: Tipo de producto ('ticket' o 'item')
     - **stock**: Cantidad disponible
     - **image_url**: URL de la imagen del producto
+
+    Si la imagen es una subida propia, las miniaturas se generan en segundo plano.
     """
-    return crud.create_product(db=db, product=product)
+    db_product = crud.create_product(db=db, product=product)
+    image_variants.enqueue_product_variants(db_product.id, db_product.image_url)
+    return db_product
 
 
 @router.put("/{product_id}", response_model=schemas.ProductResponse)
@@ -160,6 +181,8 @@ def update_product(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Producto no encontrado"
         )
+    if "image_url" in product_update.model_fields_set:
+        image_variants.enqueue_product_variants(db_product.id, db_product.image_url)
     return db_product
 
 
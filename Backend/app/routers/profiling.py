@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import PlainTextResponse
+from typing import List
+from .. import dependencies, models, profiling
+from ..responses import ORJSONResponse
+
+router = APIRouter(
+    prefix="/profiles",
+    tags=["Profiling"],
+    responses={404: {"description": "No encontrado"}},
+    route_class=profiling.ProfiledRoute,
+)
+
+
+# ============================================================================
+# ADMIN ENDPOINTS
+# ============================================================================
+
+@router.get("/", response_model=List[dict])
+def list_profiles(
+    current_user: models.User = Depends(dependencies.get_current_admin_user)
+):
+    """
+    Listar los perfiles capturados en este proceso. **Solo administradores.**
+    """
+    return profiling.store.list()
+
+
+@router.get("/{profile_id}")
+def download_profile(
+    profile_id: str,
+    format: str = Query("speedscope", description="speedscope | collapsed"),
+    weight: str = Query("wall", description="Solo para 'collapsed': wall | cpu"),
+    current_user: models.User = Depends(dependencies.get_current_admin_user)
+):
+    """
+    Descargar un perfil. **Solo administradores.**
+
+    - **speedscope**: JSON para abrir en https://www.speedscope.app (perfiles wall y cpu)
+    - **collapsed**: stacks plegados para flamegraph.pl
+    """
+    profile = profiling.store.get(profile_id)
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Perfil no encontrado"
+        )
+
+    filename = f"profile-{profile_id}"
+    if format == "collapsed":
+        return PlainTextResponse(
+            profiling.to_collapsed(profile, weight=weight),
+            headers={"Content-Disposition": f'attachment; filename="{filename}.folded"'}
+        )
+    return ORJSONResponse(
+        profiling.to_speedscope(profile),
+        headers={"Content-Disposition": f'attachment; filename="{filename}.speedscope.json"'}
+    )
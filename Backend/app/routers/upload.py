@@ -1,42 +1,75 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Request
-from fastapi.responses import JSONResponse
-import shutil
-import os
-import uuid
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from .. import dependencies, models, schemas, storage, upload_utils
+from ..profiling import ProfiledRoute
 
 router = APIRouter(
     prefix="/upload",
     tags=["Upload"],
+    route_class=ProfiledRoute,
 )
 
-# Ensure uploads directory exists within static
-UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static", "uploads")
-if not os.path.exists(UPLOAD_DIR):
-    os.makedirs(UPLOAD_DIR)
-
-@router.post("/")
-async def upload_image(request: Request, file: UploadFile = File(...)):
+@router.post("/", openapi_extra=upload_utils.IMAGE_UPLOAD_OPENAPI)
+async def upload_image(
+    request: Request,
+    current_user: models.User = Depends(dependencies.get_current_admin_user)
+):
     """
-    Subir una imagen al servidor y obtener su URL.
+    Subir una imagen al servidor y obtener su URL (solo administradores).
     Soporta: jpeg, png, webp, gif.
-    """
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="El archivo debe ser una imagen")
 
+    Si la misma imagen ya se subió antes, se devuelve la URL existente.
+    """
     try:
-        # Generate unique filename
-        file_extension = os.path.splitext(file.filename)[1]
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = os.path.join(UPLOAD_DIR, unique_filename)
+        stored = await upload_utils.receive_image(request)
 
-        # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        file_url = upload_utils.public_url(request, stored.filename)
 
-        base_url = str(request.base_url).rstrip('/')
-        file_url = f"{base_url}/static/uploads/{unique_filename}"
-
-        return {"url": file_url, "filename": unique_filename}
+        return {"url": file_url, "filename": stored.filename}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al subir imagen: {str(e)}")
+
+@router.post("/presign", response_model=schemas.DirectUploadResponse)
+async def presign_upload(
+    data: schemas.DirectUploadRequest,
+    request: Request,
+    current_user: models.User = Depends(dependencies.get_current_admin_user)
+):
+    """
+    Obtener una URL firmada para subir la imagen directamente al
+    almacenamiento (con S3 los bytes no pasan por la API). Solo administradores.
+
+    Flujo: presign -> PUT de los bytes a `upload.url` con `upload.headers`
+    -> POST /upload/complete. Si la imagen ya existe, `upload` es null y
+    `url` ya es definitiva.
+    """
+    return await upload_utils.prepare_direct_upload(request, data.sha256, data.content_type, data.size)
+
+@router.post("/complete")
+async def complete_upload(
+    data: schemas.DirectUploadComplete,
+    request: Request,
+    current_user: models.User = Depends(dependencies.get_current_admin_user)
+):
+    """Confirmar una subida directa: valida la imagen y devuelve su URL."""
+    url = await upload_utils.confirm_direct_upload(request, data.key)
+    return {"url": url, "filename": data.key}
+
+@router.put("/direct/{key}", include_in_schema=False)
+async def direct_upload(
+    key: str,
+    request: Request,
+    size: int = Query(...),
+    expires: int = Query(...),
+    signature: str = Query(...),
+):
+    """Destino de las URLs firmadas del almacenamiento local."""
+    if not isinstance(storage.get_storage(), storage.LocalStorage):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No disponible")
+    if not storage.verify_direct_upload(key, size, expires, signature):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Firma inválida o caducada")
+
+    stored = await upload_utils.receive_direct_upload(request, key, size)
+    return {"url": upload_utils.public_url(request, stored.filename), "filename": stored.filename}
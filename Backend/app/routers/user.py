@@ -2,15 +2,24 @@ from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
 from sqlalchemy.orm import Session
 from datetime import timedelta
 from typing import List
-from .. import schemas, crud, database, auth, dependencies, models
+import logging
+from .. import schemas, crud, database, auth, dependencies, models, singleflight, google_jwks
+from ..config import settings
 from ..email_utils import send_welcome_email
+from ..profiling import ProfiledRoute
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/users",
     tags=["Users"],
     responses={404: {"description": "No encontrado"}},
+    route_class=ProfiledRoute,
 )
 
+# Los recuentos del panel de admin se calculan una vez por ráfaga de peticiones
+stats_flight = singleflight.group("admin_stats")
+
 
 # ============================================================================
 # PUBLIC ENDPOINTS
@@ -88,25 +97,15 @@ def google_auth(google_data: schemas.GoogleAuthRequest, db: Session = Depends(da
     Si el usuario existe (por email), se autentica.
     Si no existe, se crea automáticamente con los datos de Google.
     """
-    from google.oauth2 import id_token
-    from google.auth.transport import requests
-    import os
-    
     try:
-        # Verificar el token con Google
-        GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID", "")
-        
-        if not GOOGLE_CLIENT_ID:
+        if not settings.GOOGLE_CLIENT_ID:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Google Client ID no configurado en el servidor"
             )
         
-        idinfo = id_token.verify_oauth2_token(
-            google_data.token, 
-            requests.Request(), 
-            GOOGLE_CLIENT_ID
-        )
+        # Verificar el token en local con las claves de Google en caché
+        idinfo = google_jwks.verify(google_data.token, settings.GOOGLE_CLIENT_ID)
         
         # Extraer datos del token verificado
         email = idinfo.get('email')
@@ -136,13 +135,8 @@ def google_auth(google_data: schemas.GoogleAuthRequest, db: Session = Depends(da
             db.refresh(db_user)
         else:
             # Crear nuevo usuario
-            # Generar username único basado en el nombre
+            # Username único basado en el nombre (base, base_1, base_2...)
             base_username = full_name.replace(" ", "_").lower()[:20] if full_name else email.split('@')[0]
-            username = base_username
-            counter = 1
-            while crud.get_user_by_username(db, username=username):
-                username = f"{base_username}_{counter}"
-                counter += 1
             
             # Crear usuario con password random (no lo usará, entra por Google)
             import secrets
@@ -150,13 +144,13 @@ def google_auth(google_data: schemas.GoogleAuthRequest, db: Session = Depends(da
             
             # Crear el usuario en la base de datos
             new_user_data = schemas.UserCreate(
-                username=username,
+                username=base_username,
                 email=email,
                 password=random_password,
                 first_name=given_name or None,
                 last_name=family_name or None
             )
-            db_user = crud.create_user(db=db, user=new_user_data)
+            db_user = crud.create_user_unique_username(db=db, user=new_user_data)
             
             # Actualizar campos adicionales que no están en UserCreate
             db_user.avatar_url = picture if picture else None
@@ -230,7 +224,7 @@ def update_current_user(
         updated_user = crud.update_user(db, current_user.id, user_update)
         return updated_user
     except Exception as e:
-        print(f"❌ Error actualizando usuario: {e}") # Log simple para debug
+        logger.exception("❌ Error actualizando usuario", extra={"user_id": current_user.id})
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error interno al actualizar perfil: {str(e)}"
@@ -303,7 +297,7 @@ def get_users_count(
     """
     Obtener el total de usuarios registrados. **Solo administradores.**
     """
-    count = crud.get_users_count(db)
+    count = stats_flight.do("users_count", lambda: crud.get_users_count(db))
     return {"total": count}
 
 
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from typing import Optional, List, Dict, Literal
 from datetime import datetime, date
 from enum import Enum
 from decimal import Decimal
@@ -58,6 +58,11 @@ class TicketStatus(str, Enum):
     expired = "expired"
     cancelled = "cancelled"
 
+class LeaderboardWindow(str, Enum):
+    daily = "daily"
+    weekly = "weekly"
+    event = "event"
+
 class EventStatus(str, Enum):
     draft = "draft"
     published = "published"
@@ -184,7 +189,12 @@ class EventCreate(EventBase):
     venue_name: Optional[str] = None
     venue_address: Optional[str] = None
     venue_city: Optional[str] = None
-    venue_capacity: Optional[int] = None
+    venue_capacity: Optional[int] = Field(None, ge=0)
+    cover_image_url: Optional[str] = None
+    status: EventStatus = EventStatus.draft
+    is_featured: bool = False
+    is_public: bool = True
+    max_tickets_per_user: Optional[int] = Field(5, ge=1)
 
 class EventUpdate(BaseModel):
     name: Optional[str] = None
@@ -193,11 +203,16 @@ class EventUpdate(BaseModel):
     short_description: Optional[str] = None
     start_date: Optional[datetime] = None
     end_date: Optional[datetime] = None
+    doors_open_at: Optional[datetime] = None
     venue_name: Optional[str] = None
+    venue_address: Optional[str] = None
     venue_city: Optional[str] = None
+    venue_capacity: Optional[int] = Field(None, ge=0)
+    cover_image_url: Optional[str] = None
     status: Optional[EventStatus] = None
     is_featured: Optional[bool] = None
     is_public: Optional[bool] = None
+    max_tickets_per_user: Optional[int] = Field(None, ge=1)
 
 class EventResponse(EventBase):
     id: int
@@ -213,6 +228,13 @@ class EventResponse(EventBase):
     class Config:
         from_attributes = True
 
+class EventCapacity(BaseModel):
+    """Aforo del evento según el contador de entradas vendidas"""
+    venue_capacity: Optional[int] = None
+    tickets_sold: int
+    tickets_remaining: Optional[int] = None
+    sold_out: bool = False
+
 # ============================================================================
 # PRODUCT SCHEMAS
 # ============================================================================
@@ -255,6 +277,8 @@ class ProductResponse(ProductBase):
     original_price: Optional[float] = None
     stock: int = 0
     image_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    gallery_urls: Optional[List[dict]] = None
     is_active: bool = True
     is_featured: bool = False
     event_id: Optional[int] = None
@@ -264,20 +288,35 @@ class ProductResponse(ProductBase):
     class Config:
         from_attributes = True
 
+class EventDetailResponse(EventResponse):
+    """Ficha de un evento con sus productos y su aforo en vivo"""
+    doors_open_at: Optional[datetime] = None
+    venue_address: Optional[str] = None
+    venue_capacity: Optional[int] = None
+    map_url: Optional[str] = None
+    banner_image_url: Optional[str] = None
+    max_tickets_per_user: Optional[int] = None
+    products: List[ProductResponse] = []
+    capacity: Optional[EventCapacity] = None
+
 # ============================================================================
 # SCORE SCHEMAS
 # ============================================================================
+# Tope de puntos por partida: las partidas reales no pasan de unos miles
+MAX_SCORE_POINTS = 1_000_000
+
 class ScoreBase(BaseModel):
-    points: int = Field(..., ge=0)
+    points: int = Field(..., ge=0, le=MAX_SCORE_POINTS)
 
 class ScoreCreate(ScoreBase):
     game_type: str = "ghost_hunt"
     level_reached: int = 1
     time_played_seconds: Optional[int] = None
     device_type: Optional[str] = None
+    event_id: Optional[int] = None  # cuenta también para el leaderboard del evento
 
 class ScoreUpdate(BaseModel):
-    points: Optional[int] = None
+    points: Optional[int] = Field(None, ge=0, le=MAX_SCORE_POINTS)
 
 class ScoreResponse(ScoreBase):
     id: int
@@ -289,6 +328,14 @@ class ScoreResponse(ScoreBase):
     class Config:
         from_attributes = True
 
+class ScoreAccepted(BaseModel):
+    """Partida aceptada en el búfer de puntuaciones (202)"""
+    status: str = "buffered"
+    user_id: int
+    game_type: str
+    points: int
+    played_at: datetime
+
 class ScoreWithUser(ScoreResponse):
     """Puntuación con información del usuario (para leaderboard)"""
     player: Optional[UserResponse] = None
@@ -296,6 +343,38 @@ class ScoreWithUser(ScoreResponse):
     class Config:
         from_attributes = True
 
+class LeaderboardEntryResponse(BaseModel):
+    """Posición en un leaderboard por ventana"""
+    position: int
+    user_id: int
+    game_type: str
+    points: int
+    updated_at: datetime
+    player: Optional[UserResponse] = None
+
+class WindowLeaderboardResponse(BaseModel):
+    window: LeaderboardWindow
+    window_key: str
+    game_type: Optional[str] = None
+    entries: List[LeaderboardEntryResponse]
+
+class RankNeighbor(BaseModel):
+    position: int
+    user_id: int
+    username: Optional[str] = None
+    points: int
+
+class MyRankResponse(BaseModel):
+    """Posición del usuario en la clasificación global de un juego"""
+    game_type: str
+    points: int
+    rank: int                # los empatados comparten rango
+    position: int            # puesto exacto (desempate por antigüedad de la cuenta)
+    total_players: int
+    percentile: float        # % de jugadores con igual o menos puntos
+    above: List[RankNeighbor]
+    below: List[RankNeighbor]
+
 # ============================================================================
 # ORDER ITEM SCHEMAS
 # ============================================================================
@@ -373,6 +452,53 @@ class OrderWithItems(OrderResponse):
     class Config:
         from_attributes = True
 
+class OrderIntentResponse(BaseModel):
+    """Estado de un pedido en la cola de checkout asíncrono"""
+    id: int
+    status: str  # queued, processing, completed, failed
+    position: Optional[int] = None  # puesto en la cola si sigue en espera
+    order: Optional[OrderWithItems] = None
+    error: Optional[str] = None
+    error_status: Optional[int] = None
+    created_at: datetime
+    processed_at: Optional[datetime] = None
+
+class BulkOrderFilter(BaseModel):
+    """Selección de pedidos por filtro (alternativa a una lista de ids)"""
+    status: Optional[OrderStatus] = None
+    event_id: Optional[int] = None
+    user_id: Optional[int] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+
+class BulkOrderRequest(BaseModel):
+    """Cancelación o actualización masiva de pedidos"""
+    action: Literal["cancel", "update"]
+    order_ids: Optional[List[int]] = None
+    filter: Optional[BulkOrderFilter] = None
+    update: Optional[OrderUpdate] = None  # solo para action=update
+    refund_souls: bool = True  # solo para action=cancel
+    # Pedidos que se espera afectar; obligatorio con filter (409 si no coincide)
+    expected_total: Optional[int] = Field(None, ge=1)
+
+class BulkJobResponse(BaseModel):
+    """Progreso de una operación masiva en segundo plano"""
+    id: str
+    action: str
+    status: str  # queued, running, completed, failed
+    total: int
+    processed: int
+    changed: int  # pedidos cancelados/actualizados
+    skipped: int  # ya cancelados o inexistentes
+    stock_restored: int
+    souls_refunded: int
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 class OrderDetailResponse(OrderWithItems):
     """Respuesta detallada de orden (para admin)"""
     customer_phone: Optional[str] = None
@@ -412,6 +538,52 @@ class AuditLogResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# ============================================================================
+# UPLOAD SCHEMAS
+# ============================================================================
+class DirectUploadRequest(BaseModel):
+    """Solicitud de URL firmada: el cliente calcula el sha256 antes de subir"""
+    sha256: str = Field(..., min_length=64, max_length=64)
+    content_type: str
+    size: int = Field(..., gt=0)
+
+class DirectUploadInstructions(BaseModel):
+    method: str
+    url: str
+    headers: Dict[str, str]
+    expires_in: int
+
+class DirectUploadResponse(BaseModel):
+    key: str
+    url: str
+    deduplicated: bool
+    upload: Optional[DirectUploadInstructions] = None
+
+class DirectUploadComplete(BaseModel):
+    key: str
+
+# ============================================================================
+# INVENTORY HOLD SCHEMAS
+# ============================================================================
+class HoldRequest(BaseModel):
+    """Cantidad total del producto en el carrito (0 libera la reserva)"""
+    product_id: int
+    quantity: int = Field(..., ge=0)
+
+class HoldResponse(BaseModel):
+    product_id: int
+    quantity: int
+    expires_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class ProductAvailability(BaseModel):
+    product_id: int
+    stock: int
+    held: int
+    available: int
+
 # ============================================================================
 # FORWARD REFERENCES UPDATE
 # ============================================================================
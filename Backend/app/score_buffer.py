@@ -0,0 +1,446 @@
+"""
+Escritura diferida de puntuaciones (write-behind) para eventos con muchos
+jugadores a la vez.
+
+Con SCORE_BUFFER_ENABLED, `POST /games/score` valida la partida, la añade a
+un log local de solo-añadir y a un búfer en memoria y responde 202 sin tocar
+la BD. En el búfer las partidas se agrupan por (usuario, juego, evento, día):
+se queda la de más puntos y se suman las almas de todas. Cada
+SCORE_BUFFER_FLUSH_MS un hilo vuelca el búfer en una sola transacción:
+
+- un único upsert de los high scores de `scores` de todo el lote,
+- aplica las partidas a los leaderboards por ventana,
+- suma las almas y recalcula el rango con un UPDATE por usuario.
+
+Recuperación: al volcar, el log activo se renombra a `batch-<id>.log` y la
+transacción registra `<id>` en `score_buffer_flushes`. Al arrancar se
+reaplican los logs que no pertenecen a ningún proceso vivo (bloqueo flock)
+saltándose los lotes ya registrados, así que nada se aplica dos veces.
+
+Partidas que hacen fallar el volcado: si el lote falla por un error que no es
+de conexión, se parte en mitades (cada una en un SAVEPOINT) hasta aislar las
+partidas culpables; el resto se aplica. Las culpables vuelven al búfer y, a
+los SCORE_BUFFER_MAX_ATTEMPTS intentos, se apartan a `dead-letter.jsonl` para
+revisarlas a mano. Un error de conexión o bloqueo falla el lote entero y se
+reintenta sin contar intentos.
+
+Las puntuaciones tardan hasta SCORE_BUFFER_FLUSH_MS en verse en
+`/games/my-best`, el saldo de almas y los leaderboards.
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+from .config import settings
+from .database import SessionLocal
+from . import crud, leaderboard, leaderboard_snapshots, metrics, models, ranking, schemas
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos (un solo proceso)
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIR = os.path.join(os.path.dirname(__file__), "..", "var", "score_buffer")
+# Lotes ya volcados que se recuerdan para no reaplicar un log
+FLUSH_RETENTION = timedelta(days=7)
+DEAD_LETTER = "dead-letter.jsonl"
+# Errores del servidor de BD (conexión, bloqueos): no son culpa de ninguna partida
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+_lock = threading.Lock()
+_pending: Dict[tuple, dict] = {}
+_log = None
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+_stats = {"accepted": 0, "flushed": 0, "batches": 0, "failed": 0, "retried": 0, "dead_lettered": 0}
+
+
+def enabled() -> bool:
+    """True si el búfer está arrancado (SCORE_BUFFER_ENABLED y lifespan)."""
+    return _log is not None
+
+
+# ============================================================================
+# LOG
+# ============================================================================
+def _log_dir() -> str:
+    return settings.SCORE_BUFFER_DIR or DEFAULT_DIR
+
+
+def _try_lock(f) -> bool:
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _open_active():
+    path = os.path.join(_log_dir(), f"active-{os.getpid()}-{uuid.uuid4().hex}.log")
+    f = open(path, "a", encoding="utf-8")
+    _try_lock(f)
+    return f
+
+
+def _line(entry: dict) -> str:
+    return json.dumps({**entry, "played_at": entry["played_at"].isoformat()}) + "\n"
+
+
+def _append(entry: dict):
+    """Escribe la partida en el log activo. Llamar con `_lock`."""
+    _log.write(_line(entry))
+    _log.flush()
+    if settings.SCORE_BUFFER_FSYNC:
+        os.fsync(_log.fileno())
+
+
+def _read(f) -> Dict[tuple, dict]:
+    f.seek(0)
+    pending: Dict[tuple, dict] = {}
+    for line in f:
+        try:
+            entry = json.loads(line)
+            entry["played_at"] = datetime.fromisoformat(entry["played_at"])
+        except (ValueError, KeyError):
+            continue  # línea a medio escribir al caerse el proceso
+        _merge(pending, entry)
+    return pending
+
+
+def _discard(f, path: Optional[str] = None):
+    try:
+        os.remove(path or f.name)
+    except FileNotFoundError:
+        pass
+    f.close()
+
+
+# ============================================================================
+# BÚFER
+# ============================================================================
+def _merge(pending: Dict[tuple, dict], entry: dict):
+    """Agrupa por (usuario, juego, evento, día): máximo de puntos, suma de almas."""
+    key = (entry["user_id"], entry["game_type"], entry["event_id"],
+           leaderboard.window_key("daily", entry["played_at"]))
+    current = pending.get(key)
+    if current is None:
+        pending[key] = dict(entry)
+        return
+    current["souls"] += entry["souls"]
+    if entry["points"] > current["points"]:
+        current.update({k: v for k, v in entry.items() if k != "souls"})
+
+
+def submit(user_id: int, score: schemas.ScoreCreate) -> dict:
+    """Acepta una partida ya validada. Devuelve el acuse (202)."""
+    entry = {
+        "user_id": user_id,
+        "game_type": score.game_type,
+        "event_id": score.event_id,
+        "points": score.points,
+        "level_reached": score.level_reached,
+        "time_played_seconds": score.time_played_seconds,
+        "device_type": score.device_type,
+        "played_at": datetime.utcnow(),
+        # 1 punto = 1 alma (ver routers/games.py)
+        "souls": score.points,
+    }
+    with _lock:
+        if _log is None:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="El servidor se está reiniciando, inténtalo de nuevo"
+            )
+        _append(entry)
+        _merge(_pending, entry)
+        _stats["accepted"] += 1
+    return {"status": "buffered", **entry}
+
+
+# ============================================================================
+# VOLCADO
+# ============================================================================
+def apply_batch(db, batch_id: str, entries: List[dict]) -> Optional[Tuple[list, list]]:
+    """
+    Aplica un lote de partidas agrupadas y lo registra como volcado. Devuelve
+    (marcas para las cachés de leaderboard, [(partida, error)] que no se han
+    podido aplicar), o None si el lote ya se había aplicado. No hace commit.
+    """
+    if db.get(models.ScoreFlush, batch_id) is not None:
+        return None
+    marks, failed = _apply_isolating(db, entries)
+    db.add(models.ScoreFlush(batch_id=batch_id, entries=len(entries) - len(failed),
+                             flushed_at=datetime.utcnow()))
+    return marks, failed
+
+
+def _apply_isolating(db, entries: List[dict]) -> Tuple[list, list]:
+    """
+    Aplica las partidas en un SAVEPOINT; si fallan por los datos, parte el
+    grupo en mitades hasta aislar las que fallan. Los errores transitorios se
+    propagan (falla el lote entero).
+    """
+    try:
+        with db.begin_nested():
+            return _apply_entries(db, entries), []
+    except TRANSIENT_ERRORS:
+        raise
+    except Exception as exc:
+        if len(entries) == 1:
+            return [], [(entries[0], exc)]
+    middle = len(entries) // 2
+    marks, failed = _apply_isolating(db, entries[:middle])
+    more_marks, more_failed = _apply_isolating(db, entries[middle:])
+    return marks + more_marks, failed + more_failed
+
+
+def _apply_entries(db, entries: List[dict]) -> list:
+    # High scores: un único upsert para todo el lote
+    best: Dict[tuple, dict] = {}
+    for entry in entries:
+        key = (entry["user_id"], entry["game_type"])
+        if key not in best or entry["points"] > best[key]["points"]:
+            best[key] = entry
+    crud.upsert_high_scores(db, [{
+        "user_id": entry["user_id"],
+        "game_type": entry["game_type"],
+        "points": entry["points"],
+        "event_id": entry["event_id"],
+        "level_reached": entry["level_reached"],
+        "time_played_seconds": entry["time_played_seconds"],
+        "device_type": entry["device_type"],
+        "played_at": entry["played_at"],
+    } for entry in best.values()])
+
+    marks = []
+    for entry in entries:
+        improved = leaderboard.record(db, entry["user_id"], entry["game_type"], entry["points"],
+                                      entry["played_at"], entry["event_id"])
+        marks.append((improved, entry))
+
+    # Almas y rango: un UPDATE por usuario, en orden de id
+    souls = defaultdict(int)
+    for entry in entries:
+        souls[entry["user_id"]] += entry["souls"]
+    for user_id in sorted(souls):
+        crud.apply_soul_and_rank(db, user_id, souls[user_id])
+    return marks
+
+
+def _publish(marks: list):
+    """
+    Lleva las marcas confirmadas a las cachés en memoria. `ranking.record`
+    solo sube marcas: una partida agrupada con menos puntos que el high
+    score ya confirmado no lo baja.
+    """
+    for improved, entry in marks:
+        leaderboard.offer(improved, entry["user_id"], entry["game_type"], entry["points"], entry["played_at"])
+        ranking.record(entry["game_type"], entry["user_id"], entry["points"])
+    leaderboard_snapshots.notify()
+
+
+def _dead_letter(entry: dict, error: Exception):
+    with open(os.path.join(_log_dir(), DEAD_LETTER), "a", encoding="utf-8") as f:
+        f.write(_line({**entry, "error": repr(error)}))
+    logger.error("Partida apartada a dead-letter tras fallar el volcado",
+                 extra={"user_id": entry["user_id"], "game_type": entry["game_type"],
+                        "attempts": entry["attempts"], "error": repr(error)})
+
+
+def _retry_or_drop(failed: list):
+    """Devuelve al búfer las partidas que han fallado, o las aparta si agotan sus intentos."""
+    retry = []
+    for entry, error in failed:
+        entry = {**entry, "attempts": entry.get("attempts", 0) + 1}
+        if entry["attempts"] >= settings.SCORE_BUFFER_MAX_ATTEMPTS:
+            _dead_letter(entry, error)
+        else:
+            logger.warning("Partida que hace fallar el volcado, se reintentará",
+                           extra={"user_id": entry["user_id"], "game_type": entry["game_type"],
+                                  "attempts": entry["attempts"], "error": repr(error)})
+            retry.append(entry)
+    with _lock:
+        _stats["retried"] += len(retry)
+        _stats["dead_lettered"] += len(failed) - len(retry)
+        for entry in retry:
+            _append(entry)
+            _merge(_pending, entry)
+
+
+def _apply_file(f, path: str, batch_id: str, entries: List[dict]) -> Optional[int]:
+    """Aplica un log. Devuelve las partidas aplicadas, o None si ha fallado entero."""
+    db = SessionLocal()
+    try:
+        result = apply_batch(db, batch_id, entries)
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Error volcando puntuaciones", extra={"batch_id": batch_id, "entries": len(entries)})
+        return None
+    finally:
+        db.close()
+    if result is None:
+        _discard(f, path)
+        return 0
+    marks, failed = result
+    # Antes de borrar el log: si el proceso cae entre medias, las fallidas se pierden
+    # (el lote ya consta como volcado), pero nunca se duplican las aplicadas
+    if failed:
+        _retry_or_drop(failed)
+    _discard(f, path)
+    _publish(marks)
+    return len(entries) - len(failed)
+
+
+def flush() -> int:
+    """Vuelca el búfer. Devuelve las partidas (agrupadas) aplicadas."""
+    global _pending, _log
+    with _lock:
+        if not _pending or _log is None:
+            return 0
+        batch, _pending = _pending, {}
+        current, _log = _log, _open_active()
+
+    # El descriptor (y su bloqueo) sigue abierto tras renombrar
+    batch_id = uuid.uuid4().hex
+    path = os.path.join(_log_dir(), f"batch-{batch_id}.log")
+    os.rename(current.name, path)
+
+    entries = list(batch.values())
+    applied = _apply_file(current, path, batch_id, entries)
+    if applied is not None:
+        with _lock:
+            _stats["batches"] += 1
+            _stats["flushed"] += applied
+        return applied
+
+    # Fallo transitorio: las partidas vuelven al búfer (y al log activo) para el siguiente intento
+    with _lock:
+        _stats["failed"] += 1
+        for entry in entries:
+            _append(entry)
+            _merge(_pending, entry)
+    _discard(current, path)
+    return 0
+
+
+def recover() -> int:
+    """Reaplica los logs de procesos caídos. Devuelve las partidas recuperadas."""
+    recovered = 0
+    for path in sorted(glob.glob(os.path.join(_log_dir(), "*.log"))):
+        name = os.path.basename(path)
+        if _log is not None and path == _log.name:
+            continue
+        f = open(path, "a+", encoding="utf-8")
+        if not _try_lock(f):
+            f.close()  # de un proceso vivo
+            continue
+        # Un log activo nunca se ha aplicado; uno de lote quizá sí (ver apply_batch)
+        batch_id = name[len("batch-"):-len(".log")] if name.startswith("batch-") else uuid.uuid4().hex
+        entries = list(_read(f).values())
+        if not entries:
+            _discard(f)
+            continue
+        applied = _apply_file(f, path, batch_id, entries)
+        if applied is None:
+            f.close()
+        else:
+            recovered += applied
+    if recovered:
+        logger.warning("Puntuaciones recuperadas del log", extra={"entries": recovered})
+    return recovered
+
+
+def _purge_flushes():
+    db = SessionLocal()
+    try:
+        db.query(models.ScoreFlush).filter(
+            models.ScoreFlush.flushed_at < datetime.utcnow() - FLUSH_RETENTION
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+# ============================================================================
+# HILO DE VOLCADO
+# ============================================================================
+def _flush_loop():
+    interval = settings.SCORE_BUFFER_FLUSH_MS / 1000.0
+    while not _stop.wait(interval):
+        try:
+            flush()
+        except Exception:
+            logger.exception("Error en el hilo de volcado de puntuaciones")
+
+
+def start():
+    """Recupera logs pendientes y arranca el volcado (lifespan). Solo con SCORE_BUFFER_ENABLED."""
+    global _log, _thread
+    if not settings.SCORE_BUFFER_ENABLED or _thread is not None:
+        return
+    os.makedirs(_log_dir(), exist_ok=True)
+    # El log activo se abre antes: recover() devuelve a él las partidas que fallen
+    with _lock:
+        _log = _open_active()
+    recover()
+    _purge_flushes()
+    _stop.clear()
+    _thread = threading.Thread(target=_flush_loop, name="score-buffer", daemon=True)
+    _thread.start()
+    logger.info("Búfer de puntuaciones activo", extra={"flush_ms": settings.SCORE_BUFFER_FLUSH_MS})
+
+
+def stop(timeout: float = 10):
+    """Detiene el hilo y vuelca lo pendiente."""
+    global _log, _thread
+    if _thread is None:
+        return
+    _stop.set()
+    _thread.join(timeout)
+    _thread = None
+    flush()
+    with _lock:
+        if _log is not None and not _pending:
+            _discard(_log)
+        elif _log is not None:
+            _log.close()  # no se pudo volcar: se recupera al arrancar
+        _log = None
+
+
+# ============================================================================
+# MÉTRICAS
+# ============================================================================
+def buffer_collector():
+    if not settings.SCORE_BUFFER_ENABLED:
+        return
+    with _lock:
+        pending = len(_pending)
+        stats = dict(_stats)
+    yield "score_buffer_pending", "gauge", "Partidas agrupadas pendientes de volcar.", {}, pending
+    yield "score_buffer_accepted_total", "counter", "Partidas aceptadas en el búfer.", {}, stats["accepted"]
+    yield "score_buffer_flushed_total", "counter", "Partidas agrupadas volcadas a la BD.", {}, stats["flushed"]
+    yield "score_buffer_batches_total", "counter", "Volcados completados.", {}, stats["batches"]
+    yield "score_buffer_failures_total", "counter", "Volcados fallidos (se reintentan).", {}, stats["failed"]
+    yield ("score_buffer_entry_retries_total", "counter",
+           "Partidas aisladas por hacer fallar el volcado y devueltas al búfer.", {}, stats["retried"])
+    yield ("score_buffer_dead_letter_total", "counter",
+           "Partidas apartadas a dead-letter.jsonl tras SCORE_BUFFER_MAX_ATTEMPTS intentos.",
+           {}, stats["dead_lettered"])
+
+
+metrics.registry.register_collector(buffer_collector)
@@ -0,0 +1,114 @@
+"""
+Agrupación de peticiones concurrentes (single-flight).
+
+Cuando muchas peticiones piden a la vez lo mismo (la primera carga del
+catálogo tras un cambio, el leaderboard, las estadísticas del panel...),
+solo la primera ejecuta la consulta; las demás esperan y reciben el mismo
+resultado (o la misma excepción). No es una caché: en cuanto termina la
+ejecución la siguiente petición vuelve a calcular.
+
+    products_flight = singleflight.group("products")
+    data = products_flight.do(key, lambda: ...)            # endpoints `def`
+    data = await products_flight.do_async(key, coro_func)  # código async
+
+Las llamadas síncronas y asíncronas con la misma clave comparten ejecución.
+El resultado se entrega a varias peticiones: debe ser un dato plano (dicts,
+listas), nunca objetos ORM de la sesión de quien lo calculó.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from . import metrics
+
+
+class SingleFlight:
+    """Ejecuciones en curso por clave dentro de un grupo, seguro entre hilos."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.executions = 0  # ejecuciones reales (líderes)
+        self.shared = 0      # peticiones que esperaron a otra
+
+    def _join(self, key: Hashable):
+        """(future, es_líder)."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = self._calls[key] = Future()
+            self.executions += 1
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future, result=None, exc: BaseException = None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if exc is not None:
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = func()
+        except BaseException as exc:
+            self._finish(key, future, exc=exc)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def do_async(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await func()
+        except BaseException as exc:
+            self._finish(key, future, exc=exc)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def group(name: str) -> SingleFlight:
+    """Grupo con nombre (una etiqueta en las métricas)."""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+# ============================================================================
+# MÉTRICAS
+# ============================================================================
+def singleflight_collector():
+    with _groups_lock:
+        groups = list(_groups.values())
+    for flight in groups:
+        yield ("singleflight_executions_total", "counter",
+               "Cálculos ejecutados (uno por grupo de peticiones concurrentes).",
+               {"group": flight.name}, flight.executions)
+    for flight in groups:
+        yield ("singleflight_shared_total", "counter",
+               "Peticiones que recibieron el resultado de un cálculo ajeno (estampidas evitadas).",
+               {"group": flight.name}, flight.shared)
+    for flight in groups:
+        yield "singleflight_in_flight", "gauge", "Cálculos en curso.", {"group": flight.name}, flight.in_flight()
+
+
+metrics.registry.register_collector(singleflight_collector)
@@ -0,0 +1,485 @@
+"""
+Almacenamiento de ficheros subidos (imágenes de productos y eventos).
+
+Dos backends con la misma interfaz, elegidos con STORAGE_BACKEND:
+- LocalStorage: directorio local servido por /static/uploads (un solo nodo).
+- S3Storage: bucket S3 o compatible (MinIO, R2...) compartido por todos los
+  nodos; las imágenes se sirven desde el bucket o su CDN (S3_PUBLIC_URL).
+
+Los ficheros se identifican por una clave plana `<sha256>.<ext>` (y sus
+variantes `<sha256>_<variante>.<ext>`); la URL pública se obtiene siempre
+con `url()`, y `key_from_url()` hace el camino inverso.
+
+Además de la escritura en streaming desde la API, ambos backends generan
+URLs firmadas de subida directa: con S3 los bytes van del navegador al
+bucket sin pasar por los workers de la API.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from threading import Lock
+from typing import ContextManager, Iterator, Optional
+from urllib.parse import quote, urlencode
+
+from fastapi import Request
+
+from .compression import IMMUTABLE_CACHE_CONTROL
+from .config import settings
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # boto3 solo es necesario con STORAGE_BACKEND=s3
+    boto3 = None
+
+    class ClientError(Exception):
+        """Sustituto de botocore.exceptions.ClientError (cliente de prueba sin boto3)."""
+
+        def __init__(self, error_response: dict, operation_name: str):
+            super().__init__(f"{operation_name}: {error_response}")
+            self.response = error_response
+
+DEFAULT_LOCAL_DIR = os.path.join(os.path.dirname(__file__), "static", "uploads")
+# Temporales de escritura: fuera de /static para que nunca se sirvan a medio escribir
+DEFAULT_LOCAL_TMP_DIR = os.path.join(os.path.dirname(__file__), "..", "var", "upload_tmp")
+LOCAL_URL_PATH = "/static/uploads"
+
+# Ruta del endpoint de subida directa del backend local (routers/upload.py)
+DIRECT_UPLOAD_PATH = "/upload/direct"
+
+# Claves válidas: sha256 en hex, variante opcional y extensión
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}(_[a-z]+)?\.[a-z0-9]{2,5}$")
+
+
+def is_valid_key(key: str) -> bool:
+    return bool(KEY_PATTERN.match(key))
+
+
+# ============================================================================
+# INTERFAZ
+# ============================================================================
+class StorageWriter(ABC):
+    """Escritura en streaming de un fichero cuya clave se decide al final."""
+
+    @abstractmethod
+    def write(self, data: bytes):
+        ...
+
+    @abstractmethod
+    def commit(self, key: str) -> bool:
+        """Publica el fichero con `key`. Devuelve True si ya existía (duplicado)."""
+
+    @abstractmethod
+    def abort(self):
+        ...
+
+
+class Storage(ABC):
+    """Operaciones comunes a todos los backends (síncronas: usar en el threadpool)."""
+
+    @abstractmethod
+    def open_writer(self, content_type: str) -> StorageWriter:
+        ...
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def put_file(self, key: str, path: str, content_type: str):
+        """Sube un fichero local ya completo (variantes generadas, etc.)."""
+
+    @abstractmethod
+    def fetch(self, key: str) -> ContextManager[str]:
+        """Ruta local con el contenido de `key` mientras dura el contexto."""
+
+    @abstractmethod
+    def read_head(self, key: str, length: int) -> bytes:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def base_url(self, request: Optional[Request] = None) -> str:
+        ...
+
+    @abstractmethod
+    def presign_upload(self, key: str, content_type: str, size: int, sha256: str,
+                       request: Optional[Request] = None) -> dict:
+        """
+        Datos para que el cliente suba `key` directamente:
+        {"method", "url", "headers", "expires_in"}.
+        """
+
+    # ------------------------------------------------------------------------
+    # Resolución de URLs
+    # ------------------------------------------------------------------------
+    def url(self, key: str, request: Optional[Request] = None) -> str:
+        return f"{self.base_url(request)}/{quote(key)}"
+
+    def key_from_url(self, url: Optional[str]) -> Optional[str]:
+        """Clave de un fichero propio a partir de su URL pública, o None."""
+        if not url:
+            return None
+        prefix, _, key = url.split("?", 1)[0].rpartition("/")
+        if not is_valid_key(key) or not self._owns_prefix(prefix):
+            return None
+        return key
+
+    @abstractmethod
+    def _owns_prefix(self, prefix: str) -> bool:
+        ...
+
+
+# ============================================================================
+# BACKEND LOCAL
+# ============================================================================
+class _LocalWriter(StorageWriter):
+
+    def __init__(self, root: str, tmp_dir: str):
+        self.root = root
+        self._file = tempfile.NamedTemporaryFile(dir=tmp_dir, suffix=".part", delete=False)
+
+    def write(self, data: bytes):
+        self._file.write(data)
+
+    def commit(self, key: str) -> bool:
+        self._file.close()
+        final_path = os.path.join(self.root, key)
+        if os.path.exists(final_path):
+            os.unlink(self._file.name)
+            return True
+        os.replace(self._file.name, final_path)
+        return False
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.unlink(self._file.name)
+        except FileNotFoundError:
+            pass
+
+
+class LocalStorage(Storage):
+    """
+    Ficheros en `root`. Se escriben primero en `tmp_dir` (fuera del
+    directorio público) y se mueven con un renombrado atómico, así que ambos
+    deben estar en el mismo sistema de ficheros.
+    """
+
+    def __init__(self, root: str = None, url_path: str = LOCAL_URL_PATH, tmp_dir: str = None):
+        self.root = root or DEFAULT_LOCAL_DIR
+        self.tmp_dir = tmp_dir or DEFAULT_LOCAL_TMP_DIR
+        self.url_path = url_path
+        os.makedirs(self.root, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        if os.stat(self.root).st_dev != os.stat(self.tmp_dir).st_dev:
+            raise RuntimeError(
+                f"STORAGE_TMP_DIR ({self.tmp_dir}) debe estar en el mismo sistema de ficheros "
+                f"que el almacenamiento ({self.root})"
+            )
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def open_writer(self, content_type: str) -> StorageWriter:
+        return _LocalWriter(self.root, self.tmp_dir)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def put_file(self, key: str, path: str, content_type: str):
+        # Copia a un temporal único (varios hilos pueden subir la misma clave)
+        # fuera del directorio público y renombrado atómico
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    @contextmanager
+    def fetch(self, key: str) -> Iterator[str]:
+        yield self.path(key)
+
+    def read_head(self, key: str, length: int) -> bytes:
+        with open(self.path(key), "rb") as f:
+            return f.read(length)
+
+    def delete(self, key: str):
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def base_url(self, request: Optional[Request] = None) -> str:
+        host = str(request.base_url).rstrip("/") if request else ""
+        return f"{host}{self.url_path}"
+
+    def _owns_prefix(self, prefix: str) -> bool:
+        return prefix.endswith(self.url_path)
+
+    def presign_upload(self, key: str, content_type: str, size: int, sha256: str,
+                       request: Optional[Request] = None) -> dict:
+        # Sin bucket no hay a dónde desviar los bytes: la URL firmada apunta
+        # al endpoint PUT de la propia API, que la valida sin sesión.
+        expires = int(time.time()) + settings.UPLOAD_PRESIGN_EXPIRES
+        query = urlencode({
+            "size": size,
+            "expires": expires,
+            "signature": sign_direct_upload(key, size, expires),
+        })
+        host = str(request.base_url).rstrip("/") if request else ""
+        return {
+            "method": "PUT",
+            "url": f"{host}{DIRECT_UPLOAD_PATH}/{key}?{query}",
+            "headers": {"Content-Type": content_type},
+            "expires_in": settings.UPLOAD_PRESIGN_EXPIRES,
+        }
+
+
+def sign_direct_upload(key: str, size: int, expires: int) -> str:
+    message = f"{key}:{size}:{expires}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def verify_direct_upload(key: str, size: int, expires: int, signature: str) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(sign_direct_upload(key, size, expires), signature)
+
+
+# ============================================================================
+# BACKEND S3
+# ============================================================================
+class _S3Writer(StorageWriter):
+    """
+    Acumula hasta S3_PART_SIZE en memoria; si el fichero cabe en una parte se
+    sube con un único PUT, si no con multipart upload a una clave temporal
+    que al confirmar se copia a la definitiva.
+    """
+
+    def __init__(self, storage: "S3Storage", content_type: str):
+        self.storage = storage
+        self.content_type = content_type
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._incoming_key = f"_incoming/{uuid.uuid4().hex}"
+        self._parts = []
+
+    def write(self, data: bytes):
+        self._buffer += data
+        if len(self._buffer) >= self.storage.part_size:
+            self._flush_part()
+
+    def _flush_part(self):
+        s3 = self.storage
+        if self._upload_id is None:
+            response = s3.client.create_multipart_upload(
+                Bucket=s3.bucket, Key=s3.object_key(self._incoming_key), **s3.put_args(self.content_type)
+            )
+            self._upload_id = response["UploadId"]
+        number = len(self._parts) + 1
+        response = s3.client.upload_part(
+            Bucket=s3.bucket, Key=s3.object_key(self._incoming_key),
+            UploadId=self._upload_id, PartNumber=number, Body=bytes(self._buffer),
+        )
+        self._parts.append({"PartNumber": number, "ETag": response["ETag"]})
+        self._buffer.clear()
+
+    def commit(self, key: str) -> bool:
+        s3 = self.storage
+        if s3.exists(key):
+            self.abort()
+            return True
+
+        if self._upload_id is None:
+            s3.client.put_object(
+                Bucket=s3.bucket, Key=s3.object_key(key), Body=bytes(self._buffer),
+                **s3.put_args(self.content_type)
+            )
+            self._buffer.clear()
+            return False
+
+        if self._buffer:
+            self._flush_part()
+        incoming = s3.object_key(self._incoming_key)
+        s3.client.complete_multipart_upload(
+            Bucket=s3.bucket, Key=incoming, UploadId=self._upload_id,
+            MultipartUpload={"Parts": self._parts},
+        )
+        self._upload_id = None
+        s3.client.copy_object(
+            Bucket=s3.bucket, Key=s3.object_key(key),
+            CopySource={"Bucket": s3.bucket, "Key": incoming},
+        )
+        s3.client.delete_object(Bucket=s3.bucket, Key=incoming)
+        return False
+
+    def abort(self):
+        self._buffer.clear()
+        if self._upload_id is not None:
+            s3 = self.storage
+            s3.client.abort_multipart_upload(
+                Bucket=s3.bucket, Key=s3.object_key(self._incoming_key), UploadId=self._upload_id
+            )
+            self._upload_id = None
+
+
+class S3Storage(Storage):
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = None, region: str = None,
+                 access_key_id: str = None, secret_access_key: str = None, public_url: str = None,
+                 part_size: int = 8 * 1024 * 1024, client=None):
+        if client is None and boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND=s3 requiere instalar boto3")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 requiere S3_BUCKET")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.part_size = max(part_size, 5 * 1024 * 1024)  # mínimo de S3 por parte
+        # `client`: cliente ya creado (p. ej. el cliente en memoria de benchmarks/storage_check.py)
+        self.client = client or boto3.client(
+            "s3",
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            aws_access_key_id=access_key_id or None,
+            aws_secret_access_key=secret_access_key or None,
+            # MinIO y la mayoría de compatibles solo admiten path-style
+            config=BotoConfig(
+                signature_version="s3v4",
+                s3={"addressing_style": "path" if endpoint_url else "auto"},
+            ),
+        )
+        if public_url:
+            self.public_url = public_url.rstrip("/")
+        elif endpoint_url:
+            self.public_url = f"{endpoint_url.rstrip('/')}/{bucket}"
+        else:
+            self.public_url = f"https://{bucket}.s3.{region or 'us-east-1'}.amazonaws.com"
+        if self.prefix:
+            self.public_url = f"{self.public_url}/{self.prefix}"
+
+    def object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    @staticmethod
+    def put_args(content_type: str) -> dict:
+        return {"ContentType": content_type, "CacheControl": IMMUTABLE_CACHE_CONTROL}
+
+    def open_writer(self, content_type: str) -> StorageWriter:
+        return _S3Writer(self, content_type)
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put_file(self, key: str, path: str, content_type: str):
+        self.client.upload_file(path, self.bucket, self.object_key(key), ExtraArgs=self.put_args(content_type))
+
+    @contextmanager
+    def fetch(self, key: str) -> Iterator[str]:
+        fd, path = tempfile.mkstemp(suffix=os.path.splitext(key)[1])
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, self.object_key(key), path)
+            yield path
+        finally:
+            os.unlink(path)
+
+    def read_head(self, key: str, length: int) -> bytes:
+        response = self.client.get_object(
+            Bucket=self.bucket, Key=self.object_key(key), Range=f"bytes=0-{length - 1}"
+        )
+        return response["Body"].read()
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    def base_url(self, request: Optional[Request] = None) -> str:
+        return self.public_url
+
+    def _owns_prefix(self, prefix: str) -> bool:
+        return prefix == self.public_url
+
+    def presign_upload(self, key: str, content_type: str, size: int, sha256: str,
+                       request: Optional[Request] = None) -> dict:
+        # Tipo, tamaño y checksum van firmados: S3 rechaza cualquier otro cuerpo
+        checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+        url = self.client.generate_presigned_url(
+            "put_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": self.object_key(key),
+                "ContentType": content_type,
+                "ContentLength": size,
+                "ChecksumSHA256": checksum,
+                "CacheControl": IMMUTABLE_CACHE_CONTROL,
+            },
+            ExpiresIn=settings.UPLOAD_PRESIGN_EXPIRES,
+        )
+        return {
+            "method": "PUT",
+            "url": url,
+            "headers": {
+                "Content-Type": content_type,
+                "x-amz-checksum-sha256": checksum,
+                "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+            },
+            "expires_in": settings.UPLOAD_PRESIGN_EXPIRES,
+        }
+
+
+# ============================================================================
+# INSTANCIA GLOBAL
+# ============================================================================
+_storage: Optional[Storage] = None
+_storage_lock = Lock()
+
+
+def create_storage() -> Storage:
+    backend = settings.STORAGE_BACKEND.lower()
+    if backend == "s3":
+        return S3Storage(
+            bucket=settings.S3_BUCKET,
+            prefix=settings.S3_PREFIX,
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            region=settings.S3_REGION,
+            access_key_id=settings.S3_ACCESS_KEY_ID,
+            secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+            public_url=settings.S3_PUBLIC_URL,
+        )
+    if backend == "local":
+        return LocalStorage(settings.STORAGE_LOCAL_DIR or None, tmp_dir=settings.STORAGE_TMP_DIR or None)
+    raise RuntimeError(f"STORAGE_BACKEND desconocido: {settings.STORAGE_BACKEND}")
+
+
+def get_storage() -> Storage:
+    """Backend configurado (uno por proceso, también en los procesos hijos)."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage()
+    return _storage
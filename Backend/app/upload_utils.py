@@ -0,0 +1,363 @@
+"""
+Subida de imágenes en streaming.
+
+El cuerpo multipart se procesa a medida que llega de la red (sin que
+Starlette lo vuelque antes a un fichero temporal):
+- límite duro de bytes aplicado durante la lectura (413 en cuanto se supera),
+- validación por firma binaria (magic bytes), no por el `content_type` del cliente,
+- escritura por fragmentos en el almacenamiento (app/storage.py) desde el
+  threadpool, sin bloquear el event loop,
+- almacenamiento direccionado por contenido (`<sha256>.<ext>`): una imagen
+  repetida se guarda una sola vez y se devuelve la URL existente.
+
+También gestiona las subidas directas con URL firmada: el cliente envía el
+sha256, tipo y tamaño, sube los bytes al almacenamiento y confirma.
+"""
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+from starlette.concurrency import run_in_threadpool
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from .config import settings
+from .storage import StorageWriter, get_storage, is_valid_key
+
+# Margen para cabeceras y boundaries del multipart sobre el tamaño del fichero
+MULTIPART_OVERHEAD = 16 * 1024
+
+# Bytes necesarios para reconocer todas las firmas
+SIGNATURE_LENGTH = 12
+
+# Esquema OpenAPI del cuerpo (el endpoint no declara `UploadFile`)
+IMAGE_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
+
+@dataclass
+class StoredImage:
+    filename: str
+    sha256: str
+    content_type: str
+    size: int
+    deduplicated: bool
+
+
+def detect_image_type(head: bytes) -> Optional[Tuple[str, str]]:
+    """Devuelve (extensión, mime) según la firma binaria, o None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg", "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png", "image/png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "gif", "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp", "image/webp"
+    return None
+
+
+# Tipos admitidos en las subidas directas (el cliente declara el tipo)
+ALLOWED_TYPES = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/gif": "gif",
+    "image/webp": "webp",
+}
+
+
+def public_url(request: Request, filename: str) -> str:
+    return get_storage().url(filename, request)
+
+
+# ============================================================================
+# PARSER MULTIPART
+# ============================================================================
+class _FilePartCollector:
+    """
+    Callbacks de python-multipart: acumula los datos del campo de fichero
+    pedido e ignora el resto de partes. Los callbacks son síncronos, así
+    que los datos se recogen aquí y se procesan después de cada `write`.
+    """
+
+    def __init__(self, field_name: str):
+        self.field_name = field_name.encode()
+        self.found = False
+        self.finished = False
+        self._in_target = False
+        self._chunks: List[bytes] = []
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+
+    def on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._in_target = (
+            not self.found
+            and options.get(b"name") == self.field_name
+            and b"filename" in options
+        )
+        if self._in_target:
+            self.found = True
+
+    def on_part_data(self, data, start, end):
+        if self._in_target:
+            self._chunks.append(bytes(data[start:end]))
+
+    def on_part_end(self):
+        if self._in_target:
+            self._in_target = False
+            self.finished = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+# ============================================================================
+# PIPELINE
+# ============================================================================
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"La imagen supera el tamaño máximo de {max_bytes // 1024} KB"
+    )
+
+
+class _ImageSink:
+    """
+    Recibe los bytes del fichero por fragmentos: aplica el límite, calcula
+    el sha256, valida la firma con los primeros bytes y escribe en el
+    almacenamiento (en el threadpool).
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.storage = get_storage()
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.image_type: Optional[Tuple[str, str]] = None
+        self.rejected = False
+        self._head = b""
+        self._writer: Optional[StorageWriter] = None
+
+    async def feed(self, data: bytes, final: bool = False):
+        if not data and (not final or self.image_type is not None):
+            return
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise _too_large(self.max_bytes)
+        self.hasher.update(data)
+
+        if self.image_type is None:
+            self._head += data
+            if len(self._head) < SIGNATURE_LENGTH and not final:
+                return
+            self.image_type = detect_image_type(self._head)
+            if self.image_type is None:
+                self.rejected = True
+                return
+            data = self._head
+            self._writer = await run_in_threadpool(self.storage.open_writer, self.image_type[1])
+
+        await run_in_threadpool(self._writer.write, data)
+
+    async def commit(self) -> StoredImage:
+        digest = self.hasher.hexdigest()
+        extension, mime = self.image_type
+        filename = f"{digest}.{extension}"
+        deduplicated = await run_in_threadpool(self._writer.commit, filename)
+        self._writer = None
+        return StoredImage(
+            filename=filename,
+            sha256=digest,
+            content_type=mime,
+            size=self.size,
+            deduplicated=deduplicated,
+        )
+
+    async def abort(self):
+        if self._writer is not None:
+            await run_in_threadpool(self._writer.abort)
+            self._writer = None
+
+
+def _invalid_image() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="El archivo debe ser una imagen JPEG, PNG, GIF o WebP"
+    )
+
+
+async def receive_image(request: Request, field_name: str = "file", max_bytes: int = None) -> StoredImage:
+    """
+    Lee el campo `field_name` de un cuerpo multipart/form-data y lo guarda
+    en el almacenamiento con nombre `<sha256>.<ext>`.
+    """
+    max_bytes = max_bytes or settings.UPLOAD_MAX_BYTES
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Se esperaba un formulario multipart/form-data con el campo 'file'"
+        )
+
+    # Rechazo inmediato si el propio cliente declara un cuerpo demasiado grande
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > max_bytes + MULTIPART_OVERHEAD:
+        raise _too_large(max_bytes)
+
+    collector = _FilePartCollector(field_name)
+    parser = MultipartParser(params[b"boundary"], collector.callbacks())
+    sink = _ImageSink(max_bytes)
+    received = 0
+
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_bytes + MULTIPART_OVERHEAD:
+                raise _too_large(max_bytes)
+            parser.write(chunk)
+            await sink.feed(collector.drain(), final=collector.finished)
+            if sink.rejected:
+                break
+        else:
+            # Fin del cuerpo: el parser entrega lo que retenía y, si el fichero
+            # era más corto que la firma, se identifica ahora con lo recibido
+            parser.finalize()
+            if collector.found and not collector.finished:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="El formulario multipart llegó incompleto"
+                )
+            if collector.found:
+                await sink.feed(collector.drain(), final=True)
+
+        if sink.image_type is None:
+            if collector.found:
+                raise _invalid_image()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No se recibió ningún archivo en el campo 'file'"
+            )
+        return await sink.commit()
+    finally:
+        await sink.abort()
+
+
+# ============================================================================
+# SUBIDA DIRECTA (URL FIRMADA)
+# ============================================================================
+def direct_upload_key(sha256: str, content_type: str, size: int) -> str:
+    """Valida la petición de subida directa y devuelve la clave destino."""
+    extension = ALLOWED_TYPES.get(content_type)
+    if extension is None:
+        raise _invalid_image()
+    if size <= 0 or size > settings.UPLOAD_MAX_BYTES:
+        raise _too_large(settings.UPLOAD_MAX_BYTES)
+    sha256 = sha256.lower()
+    if len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="sha256 inválido")
+    return f"{sha256}.{extension}"
+
+
+async def prepare_direct_upload(request: Request, sha256: str, content_type: str, size: int) -> dict:
+    """
+    Devuelve la URL firmada para subir la imagen sin pasar por la API
+    (o directamente su URL si ya existe una imagen con ese hash).
+    """
+    storage = get_storage()
+    key = direct_upload_key(sha256, content_type, size)
+    url = storage.url(key, request)
+    if await run_in_threadpool(storage.exists, key):
+        return {"key": key, "url": url, "deduplicated": True, "upload": None}
+    upload = await run_in_threadpool(storage.presign_upload, key, content_type, size, sha256.lower(), request)
+    return {"key": key, "url": url, "deduplicated": False, "upload": upload}
+
+
+async def confirm_direct_upload(request: Request, key: str) -> str:
+    """
+    Comprueba la firma binaria de una imagen subida directamente (el
+    almacenamiento ya ha verificado tamaño y checksum). Si no es una imagen
+    válida se borra. Devuelve la URL pública.
+    """
+    storage = get_storage()
+    if not is_valid_key(key) or "_" in key:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Clave inválida")
+    if not await run_in_threadpool(storage.exists, key):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="La imagen no se ha subido")
+
+    head = await run_in_threadpool(storage.read_head, key, SIGNATURE_LENGTH)
+    image_type = detect_image_type(head)
+    if image_type is None or f".{image_type[0]}" != os.path.splitext(key)[1]:
+        await run_in_threadpool(storage.delete, key)
+        raise _invalid_image()
+    return storage.url(key, request)
+
+
+async def receive_direct_upload(request: Request, key: str, size: int) -> StoredImage:
+    """
+    Destino de las URLs firmadas del backend local: el cuerpo es la imagen
+    en bruto y debe coincidir con el tamaño y el sha256 de la clave.
+    """
+    sink = _ImageSink(size)
+    try:
+        async for chunk in request.stream():
+            await sink.feed(chunk)
+            if sink.rejected:
+                raise _invalid_image()
+        await sink.feed(b"", final=True)
+        if sink.image_type is None or sink.rejected:
+            raise _invalid_image()
+        if sink.size != size or f"{sink.hasher.hexdigest()}.{sink.image_type[0]}" != key:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="El contenido no coincide con la subida firmada"
+            )
+        return await sink.commit()
+    finally:
+        await sink.abort()
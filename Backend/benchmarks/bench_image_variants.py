@@ -0,0 +1,76 @@
+"""
+Benchmark: generación de variantes de imagen (app/image_variants.py).
+
+Crea N imágenes sintéticas (ruido + degradado, para que el códec trabaje
+como con una foto real) y las procesa con `render_variants` en un
+ProcessPoolExecutor con distinto número de workers. Se mide el rendimiento
+en imágenes por segundo; con 0 workers se procesa en serie en el propio
+proceso, que es lo que costaría hacerlo dentro de la petición.
+
+Uso (desde Backend/, con el .env cargado como para la app):
+    python -m benchmarks.bench_image_variants [--images 24] [--size 2000]
+"""
+import argparse
+import glob
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from app.image_variants import render_variants
+from app.storage import LocalStorage
+
+
+def build_images(directory: str, count: int, size: int):
+    sources = []
+    for i in range(count):
+        noise = Image.effect_noise((size, size * 3 // 4), 40 + i).convert("RGB")
+        gradient = Image.linear_gradient("L").resize(noise.size).convert("RGB")
+        image = Image.blend(noise, gradient, 0.5)
+        digest = f"{i:064x}"
+        key = f"{digest}.jpg"
+        image.save(os.path.join(directory, key), "JPEG", quality=90)
+        sources.append((key, digest))
+    return sources
+
+
+def run(sources, store: LocalStorage, workers: int) -> float:
+    for path in glob.glob(os.path.join(store.root, "*_*.*")):
+        os.unlink(path)
+    start = time.perf_counter()
+    if workers == 0:
+        for key, digest in sources:
+            render_variants(key, digest, store)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(render_variants, key, digest, store) for key, digest in sources]
+            for future in futures:
+                future.result()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=24)
+    parser.add_argument("--size", type=int, default=2000, help="lado mayor de la imagen original")
+    parser.add_argument("--workers", type=int, nargs="*", default=None)
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    worker_counts = args.workers or sorted({0, 1, 2, 4, cpus})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sources = build_images(tmp, args.images, args.size)
+        store = LocalStorage(tmp)
+        print(f"{args.images} imágenes de {args.size}px, {cpus} CPUs")
+        print(f"{'workers':>8} {'tiempo (s)':>11} {'img/s':>8}")
+        for workers in worker_counts:
+            elapsed = run(sources, store, workers)
+            label = "serie" if workers == 0 else str(workers)
+            print(f"{label:>8} {elapsed:>11.2f} {args.images / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
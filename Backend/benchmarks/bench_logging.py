@@ -0,0 +1,89 @@
+"""
+Benchmark: latencia de cola (p99) que añade el logging en el camino de la petición.
+
+Compara `print()` síncrono contra el logging JSON con QueueHandler de
+app/logging_config.py. La salida se redirige a un stream lento que simula
+stdout conectado a una tubería o a un colector de logs saturado.
+
+Uso (desde Backend/):
+    python -m benchmarks.bench_logging [--threads 16] [--calls 2000] [--sink-delay-us 200]
+"""
+import argparse
+import logging
+import statistics
+import sys
+import threading
+import time
+
+from app import logging_config
+
+
+class SlowStream:
+    """Stream que tarda `delay` segundos en cada escritura (con el GIL liberado)."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def write(self, data):
+        with self._lock:  # un único descriptor: las escrituras se serializan
+            time.sleep(self.delay)
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def run(label, emit, threads, calls):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker():
+        local = []
+        for i in range(calls):
+            start = time.perf_counter()
+            emit(i)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    wall = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    wall = time.perf_counter() - wall
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1e6
+    print(f"{label:<22} p50={pct(0.50):9.1f}µs  p99={pct(0.99):9.1f}µs  "
+          f"p99.9={pct(0.999):9.1f}µs  max={latencies[-1] * 1e6:9.1f}µs  "
+          f"mean={statistics.fmean(latencies) * 1e6:8.1f}µs  wall={wall:6.2f}s",
+          file=sys.__stdout__)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--sink-delay-us", type=float, default=200)
+    args = parser.parse_args()
+
+    sink = SlowStream(args.sink_delay_us / 1e6)
+    sys.stdout = sink
+
+    run("print()", lambda i: print(f"Database error: pedido {i} falló"),
+        args.threads, args.calls)
+
+    logging_config.setup_logging()
+    logger = logging.getLogger("bench")
+    run("logging (queue+json)", lambda i: logger.error("Database error", extra={"order": i}),
+        args.threads, args.calls)
+    # El tiempo de vaciado de la cola ocurre fuera del camino de la petición
+    logging_config.shutdown_logging()
+    sys.stdout = sys.__stdout__
+
+
+if __name__ == "__main__":
+    main()
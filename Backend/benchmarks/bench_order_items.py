@@ -0,0 +1,111 @@
+"""
+Benchmark: creación de pedidos de grupo con 1, 10 y 100 tickets.
+
+Compara la creación de las líneas del pedido:
+- antes: un `OrderItem` ORM por ticket con su uuid, flush y `db.refresh`
+  del pedido (más la carga perezosa de los items al serializar)
+- después: códigos generados en bloque, un INSERT multi-fila
+  (`crud.insert_order_items`) y el pedido devuelto con selectinload
+
+Cada iteración crea el pedido completo y hace commit; se cuentan también
+las sentencias SQL emitidas.
+
+Uso (desde Backend/, con DATABASE_URL apuntando a una BD de pruebas; por
+ejemplo `DATABASE_URL=sqlite:////tmp/bench.db`):
+    python -m benchmarks.bench_order_items [--repeat 20]
+"""
+import argparse
+import time
+import uuid
+
+from sqlalchemy import event
+
+from app import crud, models
+from app.database import Base, SessionLocal, engine
+
+SIZES = (1, 10, 100)
+
+
+def create_before(db, user, product, quantity):
+    db_order = crud.build_order(db, user.id, user)
+    total = 0.0
+    for _ in range(quantity):
+        item_total = float(product.price)
+        db.add(models.OrderItem(
+            order_id=db_order.id, product_id=product.id, quantity=1,
+            unit_price=product.price, subtotal=item_total,
+            product_name=product.name, product_type=product.type,
+            product_image_url=product.image_url,
+            ticket_code=f"TKT-{str(uuid.uuid4()).upper()[:8]}", ticket_status="valid",
+        ))
+        total += item_total
+    db_order.total = total
+    db.commit()
+    db.refresh(db_order)
+    return len(db_order.items)
+
+
+def create_after(db, user, product, quantity):
+    db_order = crud.build_order(db, user.id, user)
+    rows = crud.order_item_rows(db_order.id, product, quantity)
+    db_order.total = crud.insert_order_items(db, rows)
+    db.commit()
+    return len(crud.get_order_with_items(db, db_order.id).items)
+
+
+def measure(fn, db, user_id, product_id, quantity, repeat):
+    statements = 0
+
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        best = float("inf")
+        for _ in range(repeat):
+            db.expunge_all()
+            user = db.get(models.User, user_id)
+            product = db.get(models.Product, product_id)
+            statements = 0
+            start = time.perf_counter()
+            assert fn(db, user, product, quantity) == quantity
+            best = min(best, time.perf_counter() - start)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    return best * 1000, statements
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        suffix = uuid.uuid4().hex[:8]
+        user = models.User(username=f"bench_{suffix}", email=f"bench_{suffix}@example.com",
+                           hashed_password="-")
+        product = models.Product(name=f"Ticket bench {suffix}", price=6.66, stock=0, type="ticket")
+        db.add_all([user, product])
+        db.commit()
+        user_id, product_id = user.id, product.id
+
+        print(f"{'tickets':>8} {'antes (ms)':>11} {'SQL':>5} {'después (ms)':>13} {'SQL':>5}")
+        for quantity in SIZES:
+            before, before_sql = measure(create_before, db, user_id, product_id, quantity, args.repeat)
+            after, after_sql = measure(create_after, db, user_id, product_id, quantity, args.repeat)
+            print(f"{quantity:>8} {before:>11.2f} {before_sql:>5} {after:>13.2f} {after_sql:>5}")
+
+        db.query(models.OrderItem).filter(models.OrderItem.product_id == product_id).delete(synchronize_session=False)
+        db.query(models.Order).filter(models.Order.user_id == user_id).delete(synchronize_session=False)
+        db.query(models.Product).filter(models.Product.id == product_id).delete(synchronize_session=False)
+        db.query(models.User).filter(models.User.id == user_id).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
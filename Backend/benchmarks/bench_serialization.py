@@ -0,0 +1,97 @@
+"""
+Benchmark: serialización de listas de pedidos con items (`OrderWithItems`).
+
+Reproduce el camino de FastAPI para un endpoint con `response_model`: el
+resultado ya validado se vuelca con pydantic en modo JSON y la clase de
+respuesta lo convierte en bytes. Se comparan N pedidos (3 items cada uno):
+- antes: JSONResponse (json.dumps de la librería estándar)
+- después: ORJSONResponse de app/responses.py
+- nativo: `dump_json` de pydantic directo a bytes, el camino rápido de
+  FastAPI con su clase de respuesta por defecto (ver app/responses.py)
+Se incluye también el caso sin `response_model` (jsonable_encoder + render).
+
+Uso (desde Backend/):
+    python -m benchmarks.bench_serialization [--repeat 20]
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from pydantic import TypeAdapter
+
+from app import schemas
+from app.responses import ORJSONResponse
+
+SIZES = (100, 500, 1000)
+
+
+def build_orders(n: int) -> List[schemas.OrderWithItems]:
+    now = datetime(2025, 10, 31, 23, 59)
+    orders = []
+    for i in range(n):
+        items = [
+            schemas.OrderItemResponse(
+                id=i * 3 + j, product_id=j + 1, product_name=f"Ticket Mortal {j}",
+                product_type="ticket", product_image_url="ticket-mortal.png",
+                quantity=1, unit_price=Decimal("6.66"), subtotal=Decimal("6.66"),
+                ticket_code=f"TKT-{i:05d}{j}", ticket_status="valid",
+            )
+            for j in range(3)
+        ]
+        orders.append(schemas.OrderWithItems(
+            id=i, order_number=f"ORD-{i:08d}", user_id=i % 50 + 1,
+            customer_email=f"alma{i}@lapreviamaldita.com", customer_name=f"Alma {i}",
+            subtotal=Decimal("19.98"), total=Decimal("19.98"), status="confirmed",
+            payment_status="paid", created_at=now - timedelta(minutes=i), updated_at=now,
+            items=items,
+        ))
+    return orders
+
+
+def timeit(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    adapter = TypeAdapter(List[schemas.OrderWithItems])
+    print("response_model=List[OrderWithItems] (dump_python(mode='json') + render, o dump_json)")
+    print(f"{'filas':>6} {'antes (ms)':>11} {'después (ms)':>13} {'nativo (ms)':>12} "
+          f"{'render antes':>13} {'render después':>15} {'bytes':>9}")
+    for n in SIZES:
+        orders = build_orders(n)
+        content = adapter.dump_python(orders, mode="json")
+        before = timeit(lambda: JSONResponse(adapter.dump_python(orders, mode="json")).body, args.repeat)
+        after = timeit(lambda: ORJSONResponse(adapter.dump_python(orders, mode="json")).body, args.repeat)
+        native = timeit(lambda: Response(adapter.dump_json(orders), media_type="application/json").body,
+                        args.repeat)
+        render_before = timeit(lambda: JSONResponse(content).body, args.repeat)
+        render_after = timeit(lambda: ORJSONResponse(content).body, args.repeat)
+        size = len(ORJSONResponse(content).body)
+        print(f"{n:>6} {before:>11.2f} {after:>13.2f} {native:>12.2f} "
+              f"{render_before:>13.2f} {render_after:>15.2f} {size:>9}")
+
+    print()
+    print("sin response_model (jsonable_encoder + render)")
+    print(f"{'filas':>6} {'antes (ms)':>11} {'después (ms)':>13}")
+    for n in SIZES:
+        orders = build_orders(n)
+        before = timeit(lambda: JSONResponse(jsonable_encoder(orders)).body, args.repeat)
+        after = timeit(lambda: ORJSONResponse(jsonable_encoder(orders)).body, args.repeat)
+        print(f"{n:>6} {before:>11.2f} {after:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Servidor JWKS local que sustituye al de Google (app/google_jwks.py).
+
+Genera una clave RSA, sirve su JWKS con Cache-Control y keep-alive como
+Google, e imprime un ID token firmado con ella para `POST /users/google-auth`.
+Así se prueba el login con Google sin red.
+
+Uso (desde Backend/):
+    python -m benchmarks.google_jwks_stub --port 8765 --client-id <id> --email yo@example.com
+    GOOGLE_CERTS_URL=http://127.0.0.1:8765/certs GOOGLE_CLIENT_ID=<id> uvicorn app.main:app
+"""
+import argparse
+import base64
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+
+from app.google_jwks import ALGORITHM, ISSUERS
+
+
+def serve(port: int, client_id: str, email: str, max_age: int):
+    """Genera la clave, imprime la configuración y un token firmado, y sirve el JWKS."""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    numbers = private_key.public_key().public_numbers()
+    b64 = lambda n: base64.urlsafe_b64encode(n.to_bytes((n.bit_length() + 7) // 8, "big")).rstrip(b"=").decode()
+    kid = uuid.uuid4().hex
+    body = json.dumps({"keys": [{
+        "kty": "RSA", "alg": ALGORITHM, "use": "sig", "kid": kid,
+        "n": b64(numbers.n), "e": b64(numbers.e),
+    }]}).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, como Google
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", f"public, max-age={max_age}")
+            self.end_headers()
+            self.wfile.write(body)
+
+    now = int(time.time())
+    pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+    token = jwt.encode({
+        "iss": ISSUERS[1], "aud": client_id, "sub": uuid.uuid4().hex[:21], "email": email,
+        "email_verified": True, "name": email.split("@")[0], "iat": now, "exp": now + 3600,
+    }, pem, algorithm=ALGORITHM, headers={"kid": kid})
+
+    print(f"GOOGLE_CERTS_URL=http://127.0.0.1:{port}/certs")
+    print(f"GOOGLE_CLIENT_ID={client_id}")
+    print(f"Token de prueba (1 h):\n{token}", flush=True)
+    ThreadingHTTPServer(("127.0.0.1", port), Handler).serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor JWKS local que sustituye al de Google")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--client-id", default="local-client-id")
+    parser.add_argument("--email", default="jugador@example.com")
+    parser.add_argument("--max-age", type=int, default=300)
+    args = parser.parse_args()
+    serve(args.port, args.client_id, args.email, args.max_age)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Comprobación de los backends de almacenamiento (app/storage.py).
+
+Recorre todas las operaciones de un backend (escritura en streaming con
+duplicados, exists, read_head, fetch, URLs, subida firmada, borrado y
+abort) con un fichero pequeño y otro de varias partes. Con --memory se
+prueba S3Storage contra un cliente S3 en memoria, sin red ni bucket.
+
+Uso (desde Backend/, con el .env cargado como para la app):
+    python -m benchmarks.storage_check [--memory]
+"""
+import argparse
+import hashlib
+import io
+import os
+import uuid
+from threading import Lock
+from typing import Dict
+
+from app.storage import ClientError, S3Storage, Storage, get_storage
+
+
+class MemoryS3Client:
+    """
+    Sustituto en memoria del cliente boto3 con las operaciones que usa
+    S3Storage, para probarlo sin bucket: `S3Storage("bucket", client=MemoryS3Client())`.
+    """
+
+    def __init__(self):
+        self.objects: Dict[tuple, dict] = {}
+        self.uploads: Dict[str, dict] = {}
+        self._lock = Lock()
+
+    def _get(self, bucket: str, key: str, operation: str) -> dict:
+        obj = self.objects.get((bucket, key))
+        if obj is None:
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, operation)
+        return obj
+
+    def head_object(self, Bucket, Key):
+        obj = self._get(Bucket, Key, "HeadObject")
+        return {"ContentLength": len(obj["Body"]), "ContentType": obj.get("ContentType")}
+
+    def put_object(self, Bucket, Key, Body, **args):
+        with self._lock:
+            self.objects[(Bucket, Key)] = {"Body": bytes(Body), **args}
+        return {"ETag": hashlib.md5(Body).hexdigest()}
+
+    def get_object(self, Bucket, Key, Range=None):
+        body = self._get(Bucket, Key, "GetObject")["Body"]
+        if Range:
+            start, _, end = Range[len("bytes="):].partition("-")
+            body = body[int(start):int(end) + 1 if end else None]
+        return {"Body": io.BytesIO(body)}
+
+    def delete_object(self, Bucket, Key):
+        with self._lock:
+            self.objects.pop((Bucket, Key), None)
+
+    def copy_object(self, Bucket, Key, CopySource):
+        source = self._get(CopySource["Bucket"], CopySource["Key"], "CopyObject")
+        with self._lock:
+            self.objects[(Bucket, Key)] = dict(source)
+
+    def create_multipart_upload(self, Bucket, Key, **args):
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self.uploads[upload_id] = {"Bucket": Bucket, "Key": Key, "args": args, "parts": {}}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId]["parts"][PartNumber] = bytes(Body)
+        return {"ETag": hashlib.md5(Body).hexdigest()}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        with self._lock:
+            upload = self.uploads.pop(UploadId)
+        body = b"".join(upload["parts"][p["PartNumber"]] for p in MultipartUpload["Parts"])
+        self.put_object(Bucket, Key, body, **upload["args"])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        with self._lock:
+            self.uploads.pop(UploadId, None)
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None):
+        with open(Filename, "rb") as f:
+            self.put_object(Bucket, Key, f.read(), **(ExtraArgs or {}))
+
+    def download_file(self, Bucket, Key, Filename):
+        body = self._get(Bucket, Key, "GetObject")["Body"]
+        with open(Filename, "wb") as f:
+            f.write(body)
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn):
+        return f"memory://{Params['Bucket']}/{Params['Key']}?method={ClientMethod}&expires={ExpiresIn}"
+
+
+def self_check(backend: Storage) -> None:
+    """Recorre todas las operaciones de un backend; lanza AssertionError si alguna falla."""
+    payload = os.urandom(64 * 1024)
+    big = os.urandom(6 * 1024 * 1024)  # más de una parte en S3
+    for data in (payload, big):
+        key = f"{hashlib.sha256(data).hexdigest()}.bin"
+        for expected_duplicate in (False, True):
+            writer = backend.open_writer("application/octet-stream")
+            for i in range(0, len(data), 256 * 1024):
+                writer.write(data[i:i + 256 * 1024])
+            assert writer.commit(key) is expected_duplicate, "commit/duplicado"
+        assert backend.exists(key), "exists"
+        assert backend.read_head(key, 12) == data[:12], "read_head"
+        with backend.fetch(key) as path, open(path, "rb") as f:
+            assert f.read() == data, "fetch"
+        assert backend.key_from_url(backend.url(key)) == key, "url/key_from_url"
+        presigned = backend.presign_upload(key, "application/octet-stream", len(data),
+                                           hashlib.sha256(data).hexdigest())
+        assert presigned["method"] == "PUT" and presigned["url"], "presign_upload"
+        backend.delete(key)
+        assert not backend.exists(key), "delete"
+
+    writer = backend.open_writer("application/octet-stream")
+    writer.write(payload)
+    writer.abort()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--memory", action="store_true",
+                        help="S3Storage contra el cliente en memoria en lugar del backend configurado")
+    args = parser.parse_args()
+
+    if args.memory:
+        backend = S3Storage("self-check", prefix="uploads", region="eu-west-1", client=MemoryS3Client())
+    else:
+        backend = get_storage()
+    self_check(backend)
+    print(f"{type(backend).__name__}: OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 // CONFIGURACIÓN CENTRALIZADA
 import { API_URL } from './modules/config.js';
+import { uploadImageFile } from './modules/utils.js';
 
 // Expose ALL functions called from HTML onclick/onsubmit/onchange to window
 window.switchSection = switchSection;
@@ -23,6 +24,7 @@ window.editProduct = editProduct;
 window.deleteProduct = deleteProduct;
 window.filterProducts = filterProducts;
 window.filterOrders = filterOrders;
+window.exportData = exportData;
 window.viewOrder = viewOrder;
 window.closeOrderModal = closeOrderModal;
 window.changeOrderStatus = changeOrderStatus;
@@ -265,26 +267,13 @@ async function uploadImage(context) {
     }
     reader.readAsDataURL(file);
 
-    // 2. Upload to server
-    const formData = new FormData();
-    formData.append('file', file);
-
+    // 2. Upload to storage (URL firmada o multipart)
     try {
-        const res = await fetch(`${API_URL}/upload/`, {
-            method: 'POST',
-            body: formData,
-            // Header is NOT 'Content-Type': 'multipart/form-data' explicitly 
-            // because browser sets it with boundary automatically
+        hiddenInput.value = await uploadImageFile(API_URL, '/upload', file, { // Save URL for final form submission
+            'Authorization': `Bearer ${adminToken}`
         });
-
-        if (res.ok) {
-            const data = await res.json();
-            hiddenInput.value = data.url; // Save URL for final form submission
-            statusDiv.textContent = '✅ Subida completada';
-            statusDiv.className = 'upload-status success';
-        } else {
-            throw new Error('Falló la subida');
-        }
+        statusDiv.textContent = '✅ Subida completada';
+        statusDiv.className = 'upload-status success';
     } catch (e) {
         console.error(e);
         statusDiv.textContent = '❌ Error al subir';
@@ -978,24 +967,11 @@ async function saveProduct(event) {
     const fileInput = document.getElementById('productImageFile');
     if (fileInput && fileInput.files.length > 0) {
         const file = fileInput.files[0];
-        const formData = new FormData();
-        formData.append('file', file);
-        
+
         try {
-            const uploadRes = await fetch(`${API_URL}/products/upload/`, {
-                method: 'POST',
-                headers: {
-                    'Authorization': `Bearer ${adminToken}`
-                },
-                body: formData
+            imageUrl = await uploadImageFile(API_URL, '/products/upload', file, {
+                'Authorization': `Bearer ${adminToken}`
             });
-            
-            if (uploadRes.ok) {
-                const uploadData = await uploadRes.json();
-                imageUrl = uploadData.url;
-            } else {
-                alert('⚠️ No se pudo subir la imagen. Se guardará sin ella (o con la URL antigua).');
-            }
         } catch (e) {
             console.error("Upload error", e);
             alert('⚠️ Error al subir la imagen.');
@@ -1131,6 +1107,50 @@ function filterOrders() {
     renderOrdersTable(filtered);
 }
 
+// Exportación en streaming (GET /exports/{dataset}). Con la File System
+// Access API el fichero se escribe a disco según llega; si no, se descarga
+// como Blob.
+async function exportData(dataset) {
+    const params = new URLSearchParams({ format: 'csv' });
+    if (dataset === 'orders') {
+        const status = document.getElementById('filterOrderStatus').value;
+        if (status) params.set('status', status);
+    }
+    const filename = `${dataset}-${new Date().toISOString().slice(0, 10)}.csv`;
+
+    let fileHandle = null;
+    if (window.showSaveFilePicker) {
+        try {
+            fileHandle = await window.showSaveFilePicker({ suggestedName: filename });
+        } catch (e) {
+            return; // Cancelado por el usuario
+        }
+    }
+
+    showNotification('Exportando...', 'info');
+    try {
+        const res = await fetch(`${API_URL}/exports/${dataset}?${params}`, {
+            headers: { 'Authorization': `Bearer ${adminToken}` }
+        });
+        if (!res.ok) throw new Error(`Error ${res.status}`);
+
+        if (fileHandle) {
+            await res.body.pipeTo(await fileHandle.createWritable());
+        } else {
+            const url = URL.createObjectURL(await res.blob());
+            const link = document.createElement('a');
+            link.href = url;
+            link.download = filename;
+            link.click();
+            URL.revokeObjectURL(url);
+        }
+        showNotification('Exportación completada', 'success');
+    } catch (e) {
+        console.error(e);
+        showNotification('Error al exportar', 'error');
+    }
+}
+
 function translateStatus(status) {
     const map = {
         'pending': 'Pendiente',
@@ -1,4 +1,5 @@
 import { API_URL } from './modules/config.js';
+import { productImageUrl } from './modules/utils.js';
 import { 
     initMemoryGame, 
     togglePauseMemory 
@@ -157,6 +158,7 @@ async function loadDashboardData(token) {
         if (resBest.ok) {
             const best = await resBest.json();
             document.getElementById('bestScore').textContent = best.points || "0";
+            loadMyRank(token, best.game_type);
         } else {
             console.warn("No best score found or error:", resBest.status);
             document.getElementById('bestScore').textContent = "0";
@@ -170,10 +172,46 @@ async function loadDashboardData(token) {
     loadShopData(token);
 }
 
+// Posición global en el juego de la mejor puntuación
+async function loadMyRank(token, gameType) {
+    try {
+        const res = await fetch(`${API_URL}/games/my-rank?game_type=${encodeURIComponent(gameType)}&neighbors=2`, {
+            headers: { 'Authorization': `Bearer ${token}` }
+        });
+        if (res.ok) renderMyRank(await res.json());
+    } catch (e) {
+        console.error("Error loading rank", e);
+    }
+}
+
 // ==========================================
 // RENDERIZADO
 // ==========================================
 
+function renderMyRank(data) {
+    document.getElementById('globalRank').textContent = `#${data.rank}`;
+    document.getElementById('globalRankDetail').textContent =
+        `Superas o igualas al ${data.percentile}% de ${data.total_players} jugadores`;
+
+    const list = document.getElementById('rankNeighbors');
+    list.innerHTML = '';
+    const rows = [
+        ...data.above,
+        { position: data.position, username: 'Tú', points: data.points, me: true },
+        ...data.below,
+    ];
+    rows.forEach(row => {
+        const li = document.createElement('li');
+        if (row.me) li.className = 'me';
+        const name = document.createElement('span');
+        name.textContent = `${row.position}. ${row.username || 'Anónimo'}`;
+        const points = document.createElement('span');
+        points.textContent = row.points;
+        li.append(name, points);
+        list.appendChild(li);
+    });
+}
+
 function renderOrders(orders) {
     const tbody = document.getElementById('ordersList');
     tbody.innerHTML = '';
@@ -424,7 +462,7 @@ function renderShop(products) {
         card.className = 'product-card';
         
         // Image handling - use placeholder if URL looks relative or empty
-        let imgUrl = product.image_url;
+        let imgUrl = productImageUrl(product);
         if (!imgUrl || !imgUrl.startsWith('http')) {
             // Placeholder for now
              imgUrl = 'https://placehold.co/400x300/100000/bb0a1e?text=' + encodeURIComponent(product.name);
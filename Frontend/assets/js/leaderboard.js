@@ -78,13 +78,7 @@ async function loadLeaderboard() {
     podiumEl.innerHTML = '';
 
     try {
-        let url = `${API_URL}/games/leaderboard?limit=${LIMIT}`;
-        if (currentFilter) url += `&game_type=${currentFilter}`;
-
-        const res = await fetch(url);
-        if (!res.ok) throw new Error('Error al cargar');
-
-        allEntries = await res.json();
+        allEntries = (await fetchSnapshot()).slice(0, LIMIT);
 
         renderPodium(allEntries.slice(0, 3));
         renderList(allEntries);
@@ -101,6 +95,20 @@ async function loadLeaderboard() {
     }
 }
 
+// Snapshot estático publicado por el backend (se cachea unos segundos);
+// si aún no existe se pide a la API.
+async function fetchSnapshot() {
+    const snapshot = await fetch(`${API_URL}/static/leaderboard/${currentFilter || 'all'}.json`)
+        .catch(() => null);
+    if (snapshot && snapshot.ok) return snapshot.json();
+
+    let url = `${API_URL}/games/leaderboard?limit=${LIMIT}`;
+    if (currentFilter) url += `&game_type=${currentFilter}`;
+    const res = await fetch(url);
+    if (!res.ok) throw new Error('Error al cargar');
+    return res.json();
+}
+
 // ============================================================
 // RENDER PODIUM
 // ============================================================
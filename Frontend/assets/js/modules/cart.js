@@ -1,13 +1,14 @@
 import { API_URL } from './config.js';
 import { getCurrentUser, checkAuthSession, toggleModal } from './auth.js';
-import { showNotification } from './utils.js';
+import { showNotification, fetchIdempotent, newIdempotencyKey } from './utils.js';
 
 let cart = [];
 
 export function getCart() { return cart; }
 
-export function addToCart(name, price, id = null, type = 'item') {
-    cart.push({ name, price, id, type });
+export async function addToCart(name, price, id = null, type = 'item') {
+    const entry = { name, price, id, type };
+    cart.push(entry);
     updateCartIcon();
     showNotification(`Añadido: ${name}`);
     renderCart();
@@ -15,6 +16,41 @@ export function addToCart(name, price, id = null, type = 'item') {
     // Abrir carrito
     const overlay = document.getElementById('cartOverlay');
     if (overlay) overlay.classList.add('active');
+
+    // Reservar la unidad en el servidor; si está agotado se retira del carrito
+    const hold = await syncHold(id);
+    if (hold.soldOut) {
+        const index = cart.lastIndexOf(entry);
+        if (index !== -1) cart.splice(index, 1);
+        updateCartIcon();
+        renderCart();
+        alert(`💀 ${hold.detail}`);
+    }
+}
+
+// Reserva en el servidor la cantidad del producto que hay en el carrito
+// (solo con sesión iniciada; sin ella el stock se comprueba en el checkout)
+async function syncHold(productId) {
+    const token = localStorage.getItem('token');
+    if (!productId || !token || !getCurrentUser()) return { soldOut: false };
+
+    const quantity = cart.filter(item => item.id === productId).length;
+    const headers = { 'Authorization': `Bearer ${token}` };
+    try {
+        const res = quantity > 0
+            ? await fetch(`${API_URL}/holds/`, {
+                method: 'POST',
+                headers: { ...headers, 'Content-Type': 'application/json' },
+                body: JSON.stringify({ product_id: productId, quantity })
+            })
+            : await fetch(`${API_URL}/holds/${productId}`, { method: 'DELETE', headers });
+        if (res.status === 409) {
+            return { soldOut: true, detail: (await res.json()).detail };
+        }
+    } catch (e) {
+        console.error(e);
+    }
+    return { soldOut: false };
 }
 
 export function updateCartIcon() {
@@ -71,11 +107,15 @@ export function renderCart() {
 }
 
 export function removeFromCart(index) {
-    cart.splice(index, 1);
+    const [removed] = cart.splice(index, 1);
     updateCartIcon();
     renderCart();
+    if (removed) syncHold(removed.id);
 }
 
+// Pedido en curso: cuerpo enviado y su Idempotency-Key
+let pendingCheckout = null;
+
 export async function checkout() {
     const currentUser = getCurrentUser();
     if (!currentUser) {
@@ -97,34 +137,66 @@ export async function checkout() {
         quantity: 1
     }));
 
-    fetch(`${API_URL}/orders/`, {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-            'Authorization': `Bearer ${token}`
-        },
-        body: JSON.stringify({ items })
-    })
-        .then(async res => {
-            if (res.ok) {
-                alert("¡Pacto Sellado! Tus almas han sido cobradas.");
-                cart.length = 0; 
-
-                checkAuthSession(); 
-                updateCartIcon();
-                renderCart();
-                toggleCart();
+    // Misma cesta = mismo pedido: si el usuario repite el checkout tras un
+    // fallo de red se reutiliza la clave y no se cobra dos veces
+    const body = JSON.stringify({ items });
+    if (!pendingCheckout || pendingCheckout.body !== body) {
+        pendingCheckout = { body, key: newIdempotencyKey() };
+    }
+
+    const headers = {
+        'Content-Type': 'application/json',
+        'Authorization': `Bearer ${token}`,
+        // Si el servidor tiene activo el checkout en cola responde 202 y se espera el resultado
+        'Prefer': 'respond-async'
+    };
+
+    try {
+        const res = await fetchIdempotent(`${API_URL}/orders/`, {
+            method: 'POST',
+            headers,
+            body
+        }, pendingCheckout.key);
+
+        let result;
+        if (res.status === 202) {
+            showNotification("Tu pedido está en la cola del inframundo...");
+            result = await waitForQueuedOrder(await res.json(), token);
+        } else {
+            result = { ok: res.ok, status: res.status, detail: res.ok ? null : (await res.json()).detail };
+        }
+
+        if (result.ok) {
+            pendingCheckout = null;
+            alert("¡Pacto Sellado! Tus almas han sido cobradas.");
+            cart.length = 0; 
+
+            checkAuthSession(); 
+            updateCartIcon();
+            renderCart();
+            toggleCart();
+        } else {
+            if (result.status === 402) {
+                alert(`⚠️ ${result.detail}\n\n¡Ve a la sección de JUEGOS para ganar más almas!`);
             } else {
-                const err = await res.json();
-                if (res.status === 402) {
-                    alert(`⚠️ ${err.detail}\n\n¡Ve a la sección de JUEGOS para ganar más almas!`);
-                } else {
-                    alert("Error en el ritual: " + (err.detail || "Intenta de nuevo"));
-                }
+                alert("Error en el ritual: " + (result.detail || "Intenta de nuevo"));
             }
-        })
-        .catch(e => {
-            alert("Error de conexión con el inframundo.");
-            console.error(e);
+        }
+    } catch (e) {
+        alert("Error de conexión con el inframundo.");
+        console.error(e);
+    }
+}
+
+// Long-polling del pedido encolado hasta que se completa o falla
+async function waitForQueuedOrder(intent, token) {
+    while (intent.status === 'queued' || intent.status === 'processing') {
+        const res = await fetch(`${API_URL}/orders/intents/${intent.id}?wait=20`, {
+            headers: { 'Authorization': `Bearer ${token}` }
         });
+        if (!res.ok) throw new Error(`Estado del pedido no disponible (${res.status})`);
+        intent = await res.json();
+    }
+    if (intent.status === 'completed') return { ok: true, order: intent.order };
+    return { ok: false, status: intent.error_status, detail: intent.error };
 }
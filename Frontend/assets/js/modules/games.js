@@ -1,5 +1,6 @@
 import { API_URL } from './config.js';
 import { getCurrentUser, updateSoulBalance } from './auth.js';
+import { fetchIdempotent } from './utils.js';
 
 // --- Estado Global Compartido ---
 let gameActive = false;
@@ -615,7 +616,8 @@ async function saveGameScore(gameType, score) {
         const token = localStorage.getItem('token');
         if (!token) return;
 
-        const response = await fetch(`${API_URL}/games/score`, {
+        // Los reintentos por red reutilizan la Idempotency-Key: las almas se suman una vez
+        const response = await fetchIdempotent(`${API_URL}/games/score`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -1,4 +1,5 @@
 import { API_URL } from './config.js';
+import { productImageUrl } from './utils.js';
 
 let allProducts = [];
 
@@ -49,7 +50,7 @@ function renderTickets(tickets) {
 
         // Validación para mantener el mismo formato si tiene imagen o no, y manejar errores de carga
         const imageContent = ticket.image_url 
-            ? `<img src="${ticket.image_url}" alt="${ticket.name}" style="width: 100%; height: 100%; object-fit: cover;" 
+            ? `<img src="${productImageUrl(ticket)}" alt="${ticket.name}" loading="lazy" style="width: 100%; height: 100%; object-fit: cover;" 
                onerror="this.parentElement.innerHTML = '${placeholderHtml.replace(/"/g, "&quot;").replace(/\n/g, "")}'">`
             : placeholderHtml;
 
@@ -166,7 +167,7 @@ export function renderStore(products) {
         const icon = typeIcons[p.type] || '🔮';
 
         const imageContent = p.image_url 
-            ? `<img src="${p.image_url}" alt="${p.name}" style="max-width: 100%; max-height: 120px; object-fit: contain;" onerror="this.outerHTML='<span style=\\'font-size: 4rem;\\'>${icon}</span>'">`
+            ? `<img src="${productImageUrl(p)}" alt="${p.name}" loading="lazy" style="max-width: 100%; max-height: 120px; object-fit: contain;" onerror="this.outerHTML='<span style=\\'font-size: 4rem;\\'>${icon}</span>'">`
             : `<span style="font-size: 4rem;">${icon}</span>`;
 
         const card = document.createElement('div');
@@ -13,3 +13,87 @@ export function showNotification(text) {
     console.log("NOTIFICACIÓN:", text);
     // Aquí se podría implementar una notificación visual real
 }
+
+// Devuelve la variante redimensionada de la imagen de un producto
+// (generada por el backend) o la imagen original si aún no existe.
+export function productImageUrl(product, variant = 'card') {
+    const variants = product.gallery_urls || [];
+    const match = variants.find(v => v.variant === variant);
+    return (match && match.webp) || product.image_url;
+}
+
+// Sube una imagen con URL firmada (los bytes van directos al almacenamiento)
+// y, si el navegador no puede calcular el hash o falla, con multipart a la API.
+// `basePath` es '/upload' o '/products/upload'. Devuelve la URL pública.
+export async function uploadImageFile(apiUrl, basePath, file, authHeaders = {}) {
+    if (window.crypto && window.crypto.subtle) {
+        try {
+            const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+            const sha256 = Array.from(new Uint8Array(digest))
+                .map(b => b.toString(16).padStart(2, '0')).join('');
+
+            const presignRes = await fetch(`${apiUrl}${basePath}/presign`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', ...authHeaders },
+                body: JSON.stringify({ sha256, content_type: file.type, size: file.size })
+            });
+            if (presignRes.ok) {
+                const presign = await presignRes.json();
+                if (!presign.upload) return presign.url; // ya existía
+
+                const putRes = await fetch(presign.upload.url, {
+                    method: presign.upload.method,
+                    headers: presign.upload.headers,
+                    body: file
+                });
+                if (putRes.ok) {
+                    const completeRes = await fetch(`${apiUrl}${basePath}/complete`, {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json', ...authHeaders },
+                        body: JSON.stringify({ key: presign.key })
+                    });
+                    if (completeRes.ok) return (await completeRes.json()).url;
+                }
+            }
+        } catch (e) {
+            console.warn('Subida directa no disponible, usando multipart', e);
+        }
+    }
+
+    const formData = new FormData();
+    formData.append('file', file);
+    const res = await fetch(`${apiUrl}${basePath}/`, {
+        method: 'POST',
+        headers: authHeaders,
+        body: formData
+    });
+    if (!res.ok) throw new Error('Falló la subida');
+    return (await res.json()).url;
+}
+
+// Clave única por operación lógica (pedido, puntuación...)
+export function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+// POST con cabecera Idempotency-Key: si la conexión falla se reintenta con
+// la MISMA clave, y el servidor devuelve la respuesta original en lugar de
+// volver a cobrar o sumar puntos.
+export async function fetchIdempotent(url, options = {}, key = newIdempotencyKey(), retries = 2) {
+    const headers = { ...(options.headers || {}), 'Idempotency-Key': key };
+    for (let attempt = 0; ; attempt++) {
+        try {
+            const res = await fetch(url, { ...options, headers });
+            // 409: la primera petición con esta clave aún se está procesando
+            if ((res.status === 409 || res.status >= 500) && attempt < retries) {
+                await new Promise(r => setTimeout(r, 500 * 2 ** attempt));
+                continue;
+            }
+            return res;
+        } catch (e) {
+            if (attempt >= retries) throw e;
+            await new Promise(r => setTimeout(r, 500 * 2 ** attempt));
+        }
+    }
+}